@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'core',
     'rest_framework.authtoken',
     'rest_framework',
@@ -91,6 +92,73 @@ DATABASES = {
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # state every process must agree on, see core.cache.is_shared; the
+    # database table needs `manage.py createcachetable`, point
+    # SHARED_CACHE_BACKEND at Redis or Memcached in production
+    'shared': {
+        'BACKEND': os.environ.get(
+            'SHARED_CACHE_BACKEND',
+            'django.core.cache.backends.db.DatabaseCache'
+        ),
+        'LOCATION': os.environ.get('SHARED_CACHE_LOCATION', 'shared_cache'),
+    },
+    # list responses and validators of the recipe APIs, see recipe.cache;
+    # it must be shared between processes, a per-process backend turns the
+    # response cache and conditional GETs off (check recipe.W001)
+    'api': {
+        'BACKEND': os.environ.get(
+            'API_CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.environ.get(
+            'API_CACHE_LOCATION', '/vol/web/cache/api'
+        ),
+        'TIMEOUT': int(os.environ.get('API_CACHE_TIMEOUT', 300)),
+    },
+}
+
+API_CACHE_ALIAS = 'api'
+
+# token lookups of user.authentication.CachedTokenAuthentication; the
+# shared tier is skipped when ALIAS is a per-process cache
+TOKEN_AUTH_CACHE = {
+    'ALIAS': 'shared',
+    'TIMEOUT': int(os.environ.get('TOKEN_AUTH_CACHE_TIMEOUT', 300)),
+    'LOCAL_TIMEOUT': int(os.environ.get('TOKEN_AUTH_LOCAL_TIMEOUT', 10)),
+    'LOCAL_SIZE': int(os.environ.get('TOKEN_AUTH_LOCAL_SIZE', 1024)),
+}
+
+# opt-in signed access tokens, see user.tokens
+ACCESS_TOKENS = {
+    'ENABLED': bool(int(os.environ.get('ACCESS_TOKENS_ENABLED', 0))),
+    'ALIAS': 'shared',
+    'LIFETIME': int(os.environ.get('ACCESS_TOKENS_LIFETIME', 300)),
+    'DENY_LIST_REFRESH': 5,
+}
+
+
+# pbkdf2_sha256 hashes are computed on a bounded pool, see core.hashing
+PASSWORD_HASHERS = [
+    'core.hashing.PooledPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+PASSWORD_HASHING = {
+    'WORKERS': int(os.environ.get('PASSWORD_HASHING_WORKERS', 4)),
+    'QUEUE_DEPTH': int(os.environ.get('PASSWORD_HASHING_QUEUE_DEPTH', 16)),
+    'ALIAS': 'shared',
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -132,6 +200,60 @@ MEDIA_URL = '/static/media/'
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
+# longest edge in px of the variants generated for uploaded recipe images,
+# see recipe.images; 0 workers generates them inline
+RECIPE_IMAGE_SIZES = tuple(
+    int(size) for size in
+    os.environ.get('RECIPE_IMAGE_SIZES', '128,512,1024').split(',')
+)
+RECIPE_IMAGE_WORKERS = int(os.environ.get('RECIPE_IMAGE_WORKERS', 2))
+
+# uploads are re-encoded without metadata, capped to RECIPE_IMAGE_MAX_EDGE
+# px, with a sibling in RECIPE_IMAGE_SIBLING_FORMAT served to clients that
+# accept it; see recipe.images.process_image
+RECIPE_IMAGE_MAX_EDGE = int(os.environ.get('RECIPE_IMAGE_MAX_EDGE', 2048))
+RECIPE_IMAGE_QUALITY = int(os.environ.get('RECIPE_IMAGE_QUALITY', 82))
+RECIPE_IMAGE_ENCODING = {
+    'JPEG': {
+        'quality': RECIPE_IMAGE_QUALITY,
+        'optimize': True,
+        'progressive': True,
+    },
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': RECIPE_IMAGE_QUALITY, 'method': 4},
+}
+RECIPE_IMAGE_SIBLING_FORMAT = os.environ.get(
+    'RECIPE_IMAGE_SIBLING_FORMAT', 'WEBP'
+) or None
+
+# store recipe images by content hash, sharing identical files between
+# recipes, see core.storage
+RECIPE_IMAGE_CONTENT_ADDRESSED = bool(
+    int(os.environ.get('RECIPE_IMAGE_CONTENT_ADDRESSED', 0))
+)
+
+# limits checked on upload before an image is decoded, see
+# recipe.uploads and recipe.serializers.HeaderCheckedImageField
+RECIPE_IMAGE_MAX_UPLOAD_BYTES = int(
+    os.environ.get('RECIPE_IMAGE_MAX_UPLOAD_BYTES', 10 * 1024 * 1024)
+)
+RECIPE_IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+RECIPE_IMAGE_FORMATS = ('JPEG', 'PNG', 'WEBP', 'GIF')
+
+# on-demand resizes of /media/recipe/<id>/<w>x<h>.<ext>, kept outside
+# MEDIA_ROOT so they are only served through the authenticated view
+RECIPE_IMAGE_MAX_RESIZE = 2048
+RECIPE_IMAGE_CACHE_DIR = os.environ.get(
+    'RECIPE_IMAGE_CACHE_DIR', '/vol/web/cache/resized'
+)
+RECIPE_IMAGE_CACHE_MAX_BYTES = int(
+    os.environ.get('RECIPE_IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+)
+RECIPE_IMAGE_RESIZE_MAX_AGE = 24 * 60 * 60
+
+# rows fetched per server side cursor round trip by the recipe export
+RECIPE_EXPORT_CHUNK_SIZE = int(os.environ.get('RECIPE_EXPORT_CHUNK_SIZE', 500))
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
@@ -19,6 +19,8 @@ from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 from django.conf.urls.static import static
 from django.conf import settings
 
+from recipe.views import RecipeImageResizeView, RecipeImageView
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -34,6 +36,16 @@ urlpatterns = [
     ),
     path('api/user/', include('user.urls')),
     path('api/recipe/', include('recipe.urls')),
+    path(
+        'media/recipe/<int:pk>/image',
+        RecipeImageView.as_view(),
+        name='recipe-image'
+    ),
+    path(
+        'media/recipe/<int:pk>/<int:width>x<int:height>.<str:ext>',
+        RecipeImageResizeView.as_view(),
+        name='recipe-image-resize'
+    ),
 ]
 
 if settings.DEBUG:
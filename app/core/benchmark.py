@@ -0,0 +1,86 @@
+"""
+Helpers for recording and comparing benchmark results
+"""
+import json
+import platform
+import statistics
+
+import django
+from django.core.management.base import CommandError
+
+
+def percentiles(timings):
+    """Return p50 / p95 / p99 and the mean of timings in seconds, in ms"""
+    if len(timings) > 1:
+        cuts = statistics.quantiles(timings, n=100, method='inclusive')
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = timings[0]
+    return {
+        'p50_ms': round(p50 * 1000, 3),
+        'p95_ms': round(p95 * 1000, 3),
+        'p99_ms': round(p99 * 1000, 3),
+        'mean_ms': round(statistics.fmean(timings) * 1000, 3),
+    }
+
+
+def environment():
+    """Return the versions a result was recorded with"""
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'machine': platform.machine(),
+    }
+
+
+def write_results(path, results):
+    with open(path, 'w') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+
+
+def read_results(path):
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def find_regressions(baseline, results, thresholds):
+    """
+    Return `(name, metric, baseline, result)` of every regressed metric.
+
+    `baseline` and `results` map a benchmark name to its metrics.
+    `thresholds` maps a metric to `(ratio, floor)`: the metric regressed
+    when it grew by more than `ratio` of its baseline and by more than
+    `floor`, so noise on tiny values is ignored. A higher value is worse.
+    """
+    regressions = []
+    for name, metrics in results.items():
+        if name not in baseline:
+            continue
+        for metric, (ratio, floor) in thresholds.items():
+            old, new = baseline[name].get(metric), metrics.get(metric)
+            if old is None or new is None:
+                continue
+            if new - old > max(old * ratio, floor):
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def check_regressions(command, baseline, report, key, thresholds):
+    """
+    Print the regressions of `report[key]` against a baseline report.
+
+    Raises CommandError when there are any, so a management command exits
+    with an error status.
+    """
+    if baseline.get('options') != report['options']:
+        command.stderr.write(
+            'The baseline was recorded with different options'
+        )
+    regressions = find_regressions(baseline[key], report[key], thresholds)
+    for name, metric, old, new in regressions:
+        command.stdout.write(command.style.ERROR(
+            f'{name}: {metric} {old} -> {new}'
+        ))
+    if regressions:
+        raise CommandError(f'{len(regressions)} regressions')
+    command.stdout.write(command.style.SUCCESS('No regressions'))
@@ -0,0 +1,14 @@
+"""
+Helpers for the configured cache backends
+"""
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+# backends whose entries no other process can see
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def is_shared(alias):
+    """Return whether a cache alias is shared between processes"""
+    return not isinstance(caches[alias], PROCESS_LOCAL_BACKENDS)
@@ -0,0 +1,146 @@
+"""
+Password hashing on a bounded worker pool
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.cache import caches
+
+DEFAULTS = {
+    'WORKERS': 4,
+    # hashes allowed to wait for a worker before new ones are rejected
+    'QUEUE_DEPTH': 16,
+    # cache alias of the latency counters, shared between processes so
+    # password_hash_stats sees the counts of every worker
+    'ALIAS': 'shared',
+}
+
+STATS_KEY = 'hash-stats:{name}'
+# upper bounds in milliseconds of the latency histogram
+BUCKETS = (25, 50, 100, 200, 400, 800, 1600, None)
+
+
+def get_settings():
+    """Return the password hashing settings merged over their defaults"""
+    return {**DEFAULTS, **getattr(settings, 'PASSWORD_HASHING', {})}
+
+
+class PasswordHashingBusy(Exception):
+    """Raised when the password hashing pool is saturated"""
+
+
+class HashingPool:
+    """A thread pool with a limit on running plus waiting jobs"""
+
+    def __init__(self, workers, queue_depth):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        # pbkdf2_hmac releases the GIL, so threads hash in parallel
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='password-hash'
+        )
+        self._slots = threading.BoundedSemaphore(workers + queue_depth)
+
+    def run(self, func, *args):
+        """Run `func` on the pool and wait for it, or raise when full"""
+        if not self._slots.acquire(blocking=False):
+            _count('rejected')
+            raise PasswordHashingBusy()
+        start = time.perf_counter()
+        try:
+            return self._executor.submit(func, *args).result()
+        finally:
+            self._slots.release()
+            _record_latency(time.perf_counter() - start)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process wide hashing pool, sized from the settings"""
+    global _pool
+    options = get_settings()
+    with _pool_lock:
+        if (_pool is None
+                or _pool.workers != options['WORKERS']
+                or _pool.queue_depth != options['QUEUE_DEPTH']):
+            _pool = HashingPool(options['WORKERS'], options['QUEUE_DEPTH'])
+        return _pool
+
+
+def _get_cache():
+    return caches[get_settings()['ALIAS']]
+
+
+def _count(name, amount=1):
+    cache = _get_cache()
+    key = STATS_KEY.format(name=name)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        pass
+
+
+def _record_latency(seconds):
+    millis = seconds * 1000
+    bucket = next(b for b in BUCKETS if b is None or millis <= b)
+    _count('hashes')
+    _count('micros', int(seconds * 1000000))
+    _count(f'le:{bucket or "inf"}')
+
+
+def _bucket_names():
+    return [f'le:{bucket or "inf"}' for bucket in BUCKETS]
+
+
+def get_stats():
+    """Return counters and latency percentiles of password hashing"""
+    names = ['hashes', 'rejected', 'micros'] + _bucket_names()
+    values = _get_cache().get_many(
+        [STATS_KEY.format(name=name) for name in names]
+    )
+    counts = {
+        name: values.get(STATS_KEY.format(name=name), 0) for name in names
+    }
+    hashes = counts['hashes']
+    stats = {
+        'hashes': hashes,
+        'rejected': counts['rejected'],
+        'mean_ms': counts['micros'] / hashes / 1000 if hashes else 0.0,
+    }
+    for percentile in (50, 95, 99):
+        # the upper bound of the bucket holding the percentile
+        target, seen, bound = hashes * percentile / 100, 0, None
+        for bucket in BUCKETS:
+            seen += counts[f'le:{bucket or "inf"}']
+            if hashes and seen >= target:
+                bound = bucket
+                break
+        stats[f'p{percentile}_ms'] = bound
+    return stats
+
+
+def reset_stats():
+    """Reset the password hashing counters"""
+    names = ['hashes', 'rejected', 'micros'] + _bucket_names()
+    _get_cache().delete_many([STATS_KEY.format(name=name) for name in names])
+
+
+class PooledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 hasher running its key derivation on the hashing pool.
+
+    Keeps the `pbkdf2_sha256` algorithm name, so existing hashes verify
+    unchanged. Login bursts get a fixed capacity: hashes beyond the pool
+    and its queue fail fast with PasswordHashingBusy instead of tying up
+    every request worker; the user API answers it with 503.
+    """
+
+    def encode(self, password, salt, iterations=None):
+        return get_pool().run(super().encode, password, salt, iterations)
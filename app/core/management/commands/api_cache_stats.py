@@ -0,0 +1,28 @@
+"""
+Django command to report API response cache statistics
+"""
+from django.core.management.base import BaseCommand
+
+from recipe.cache import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = 'Report hit / miss counts of the API response cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Reset the counters after reporting them',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        stats = get_stats()
+        self.stdout.write(
+            f"hits: {stats['hits']}  misses: {stats['misses']}  "
+            f"hit rate: {stats['hit_rate']:.1%}"
+        )
+        if options['reset']:
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset'))
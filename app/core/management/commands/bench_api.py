@@ -0,0 +1,401 @@
+"""
+Django command to benchmark the API end to end
+"""
+import io
+import itertools
+import logging
+import shutil
+import tempfile
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, URLResolver, reverse
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import benchmark
+from core.models import Recipe, Tag, Ingredient
+from core.seeding import DatasetSeeder, PASSWORD, seed_email
+from recipe.cache import bump_version
+from user import tokens
+from user.authentication import get_local_cache, invalidate_token
+
+# modules whose every route must be benchmarked
+URLCONFS = ('recipe.urls', 'user.urls')
+# metric -> (relative growth, absolute growth) flagged as a regression
+THRESHOLDS = {
+    'p50_ms': (0.2, 1.0),
+    'p95_ms': (0.2, 1.0),
+    'queries': (0, 0),
+    'bytes': (0.1, 0),
+}
+
+
+class Rollback(Exception):
+    """Raised to discard the seeded dataset"""
+
+
+class Endpoint:
+    """A request to time, optionally prepared per run by `setup`"""
+
+    def __init__(self, name, method, route, args=(), data=None, setup=None,
+                 query=None, multipart=False):
+        self.name = name
+        self.method = method
+        self.route = route
+        self.args = args
+        self.data = data
+        self.setup = setup
+        self.query = query
+        self.multipart = multipart
+
+    def request(self, counter):
+        """Return the url and keyword arguments of a client call"""
+        args, data, headers = self.args, self.data, {}
+        if self.setup:
+            prepared = self.setup(counter)
+            args = prepared.get('args', args)
+            data = prepared.get('data', data)
+            headers = prepared.get('headers', headers)
+        url = reverse(self.route, args=args)
+        if self.method == 'get':
+            return url, {'data': self.query, **headers}
+        fmt = 'multipart' if self.multipart else 'json'
+        return url, {'data': data, 'format': fmt, **headers}
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway dataset and report latency, SQL queries and '
+            'response size of every recipe and user route')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--recipes-per-user', type=int, default=100)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=30,
+            help='Timed requests per endpoint',
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=3,
+            help='Untimed requests per endpoint before timing',
+        )
+        parser.add_argument(
+            '--only',
+            help='Only run endpoints whose name contains this text',
+        )
+        parser.add_argument('--output', help='Write the results as JSON')
+        parser.add_argument(
+            '--compare',
+            help='Flag regressions against a JSON results file and exit '
+                 'with an error if there are any',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        media_root = tempfile.mkdtemp()
+        request_logger = logging.getLogger('django.request')
+        try:
+            with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                DEBUG=False,
+                MEDIA_ROOT=media_root,
+                RECIPE_IMAGE_CACHE_DIR=f'{media_root}/cache',
+                # uploads are timed with their processing, which is
+                # otherwise done by a pool after the response
+                RECIPE_IMAGE_WORKERS=0,
+                ACCESS_TOKENS={**settings.ACCESS_TOKENS, 'ENABLED': True},
+                # a throwaway API cache shared like a production one, so
+                # the cached rows are measured and nothing outlives the run
+                CACHES={**settings.CACHES, settings.API_CACHE_ALIAS: {
+                    'BACKEND':
+                        'django.core.cache.backends.filebased.FileBasedCache',
+                    'LOCATION': f'{media_root}/api-cache',
+                }},
+            ):
+                with transaction.atomic():
+                    # error responses are reported in the status column
+                    request_logger.disabled = True
+                    results = self._run(**options)
+                    raise Rollback
+        except Rollback:
+            pass
+        finally:
+            request_logger.disabled = False
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        report = {
+            'environment': benchmark.environment(),
+            'options': {
+                key: options[key] for key in (
+                    'users', 'recipes_per_user', 'seed', 'requests'
+                )
+            },
+            'endpoints': results,
+        }
+        if options['output']:
+            benchmark.write_results(options['output'], report)
+            self.stdout.write(f"Results written to {options['output']}")
+        if options['compare']:
+            benchmark.check_regressions(
+                self, benchmark.read_results(options['compare']), report,
+                'endpoints', THRESHOLDS,
+            )
+
+    def _run(self, users, recipes_per_user, seed, requests, warmup, only,
+             **options):
+        self.stdout.write(
+            f'Seeding {users} users with {recipes_per_user} recipes each'
+        )
+        DatasetSeeder(
+            seed=seed, users=users, recipes_per_user=recipes_per_user
+        ).run()
+        endpoints = self._endpoints(seed)
+        self._check_coverage(endpoints)
+
+        results = {}
+        self.stdout.write(
+            f"{'endpoint':<28} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+            f"{'queries':>7} {'bytes':>8}  status"
+        )
+        for endpoint in endpoints:
+            if only and only not in endpoint.name:
+                continue
+            results[endpoint.name] = self._measure(
+                endpoint, requests, warmup
+            )
+            result = results[endpoint.name]
+            self.stdout.write(
+                f"{endpoint.name:<28} {result['p50_ms']:>8.2f} "
+                f"{result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+                f"{result['queries']:>7} {result['bytes']:>8}  "
+                f"{','.join(map(str, result['status']))}"
+            )
+        return results
+
+    def _measure(self, endpoint, requests, warmup):
+        """Time an endpoint and record its queries and response size"""
+        counter = itertools.count()
+        timings, queries, sizes, statuses = [], [], [], set()
+        for run in range(warmup + requests):
+            url, kwargs = endpoint.request(next(counter))
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = getattr(self.client, endpoint.method)(
+                    url, **{**self.headers, **kwargs}
+                )
+                if response.streaming:
+                    size = sum(map(len, response.streaming_content))
+                else:
+                    size = len(response.content)
+                elapsed = time.perf_counter() - start
+            if run < warmup:
+                continue
+            timings.append(elapsed)
+            queries.append(len(captured))
+            sizes.append(size)
+            statuses.add(response.status_code)
+        return {
+            **benchmark.percentiles(timings),
+            'queries': max(queries),
+            'bytes': max(sizes),
+            'status': sorted(statuses),
+        }
+
+    def _endpoints(self, seed):
+        """Return the endpoints, requested as the largest seeded user"""
+        user = get_user_model().objects.get(email=seed_email(seed, 0))
+        token = Token.objects.create(user=user)
+        self.client = APIClient()
+        # passed per request, so an endpoint can authenticate differently
+        self.headers = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+
+        recipe = (
+            Recipe.objects.filter(user=user, tags__isnull=False)
+            .order_by('id').first()
+        )
+        tag = Tag.objects.filter(user=user).order_by('id').first()
+        ingredient = (
+            Ingredient.objects.filter(user=user).order_by('id').first()
+        )
+        recipe_payload = {
+            'title': 'Benchmark recipe',
+            'description': 'Written by bench_api',
+            'time_minutes': 30,
+            'price': '5.50',
+            'tags': [{'name': 'Vegan'}, {'name': 'Benchmark'}],
+            'ingredients': [{'name': 'Salt'}, {'name': 'Lentils'}],
+        }
+
+        def cold(counter):
+            # time the list query and serialization, not the response cache
+            bump_version(user.id)
+            return {}
+
+        def new_recipe(counter):
+            obj = Recipe.objects.create(
+                user=user, title='Delete me', time_minutes=1,
+                price=Decimal('1.00'),
+            )
+            return {'args': [obj.id]}
+
+        def new_named(model):
+            def setup(counter):
+                obj = model.objects.create(
+                    user=user, name=f'Delete me {counter}'
+                )
+                return {'args': [obj.id]}
+            return setup
+
+        image = io.BytesIO()
+        Image.new('RGB', (1200, 800), 'tan').save(image, 'JPEG')
+
+        def upload(counter):
+            upload_file = io.BytesIO(image.getvalue())
+            upload_file.name = 'benchmark.jpg'
+            return {'data': {'image': upload_file}}
+
+        def new_user(counter):
+            return {'data': {
+                'email': f'bench-{counter}@example.com',
+                'password': PASSWORD,
+                'name': 'Benchmark',
+            }}
+
+        def token_uncached(counter):
+            # authenticate from the database, as before the token cache
+            invalidate_token(token.key)
+            return {}
+
+        def token_shared(counter):
+            # a process that has not seen the token yet
+            get_local_cache().delete(token.key)
+            return {}
+
+        def access_token(counter):
+            access, _ = tokens.issue_access_token(user)
+            return {'headers': {'HTTP_AUTHORIZATION': f'Bearer {access}'}}
+
+        credentials = {'email': user.email, 'password': PASSWORD}
+        return [
+            Endpoint('recipe-root', 'get', 'recipe:api-root'),
+            Endpoint(
+                'recipe-list', 'get', 'recipe:recipe-list', setup=cold
+            ),
+            Endpoint('recipe-list-cached', 'get', 'recipe:recipe-list'),
+            Endpoint(
+                'recipe-list-filtered', 'get', 'recipe:recipe-list',
+                query={'tags': str(tag.id), 'match': 'any'}, setup=cold,
+            ),
+            Endpoint(
+                'recipe-search', 'get', 'recipe:recipe-list',
+                query={'search': 'spicy soup'}, setup=cold,
+            ),
+            Endpoint(
+                'recipe-create', 'post', 'recipe:recipe-list',
+                data=recipe_payload,
+            ),
+            Endpoint(
+                'recipe-detail', 'get', 'recipe:recipe-detail',
+                args=[recipe.id],
+            ),
+            Endpoint(
+                'recipe-update', 'put', 'recipe:recipe-detail',
+                args=[recipe.id], data=recipe_payload,
+            ),
+            Endpoint(
+                'recipe-partial-update', 'patch', 'recipe:recipe-detail',
+                args=[recipe.id], data={'title': 'Patched'},
+            ),
+            Endpoint(
+                'recipe-delete', 'delete', 'recipe:recipe-detail',
+                setup=new_recipe,
+            ),
+            Endpoint(
+                'recipe-upload-image', 'post', 'recipe:recipe-upload-image',
+                args=[recipe.id], setup=upload, multipart=True,
+            ),
+            Endpoint('recipe-export', 'get', 'recipe:recipe-export'),
+            Endpoint('tag-list', 'get', 'recipe:tag-list', setup=cold),
+            Endpoint(
+                'tag-list-counts', 'get', 'recipe:tag-list',
+                query={'with_counts': 1, 'assigned_only': 1}, setup=cold,
+            ),
+            Endpoint(
+                'tag-autocomplete', 'get', 'recipe:tag-autocomplete',
+                query={'q': 'veg'},
+            ),
+            Endpoint(
+                'tag-update', 'patch', 'recipe:tag-detail',
+                args=[tag.id], data={'name': tag.name},
+            ),
+            Endpoint(
+                'tag-delete', 'delete', 'recipe:tag-detail',
+                setup=new_named(Tag),
+            ),
+            Endpoint(
+                'ingredient-list', 'get', 'recipe:ingredient-list',
+                setup=cold,
+            ),
+            Endpoint(
+                'ingredient-autocomplete', 'get',
+                'recipe:ingredient-autocomplete', query={'q': 'sal'},
+            ),
+            Endpoint(
+                'ingredient-update', 'patch', 'recipe:ingredient-detail',
+                args=[ingredient.id], data={'name': ingredient.name},
+            ),
+            Endpoint(
+                'ingredient-delete', 'delete', 'recipe:ingredient-detail',
+                setup=new_named(Ingredient),
+            ),
+            Endpoint('user-create', 'post', 'user:create', setup=new_user),
+            Endpoint('user-token', 'post', 'user:token', data=credentials),
+            Endpoint(
+                'user-token-refresh', 'post', 'user:token-refresh',
+                data={'token': token.key},
+            ),
+            Endpoint(
+                'user-token-revoke', 'post', 'user:token-revoke',
+                setup=access_token,
+            ),
+            Endpoint('user-me', 'get', 'user:me'),
+            Endpoint(
+                'user-me-token-shared', 'get', 'user:me', setup=token_shared
+            ),
+            Endpoint(
+                'user-me-token-uncached', 'get', 'user:me',
+                setup=token_uncached,
+            ),
+            Endpoint(
+                'user-me-update', 'patch', 'user:me',
+                data={'name': 'Benchmark'},
+            ),
+        ]
+
+    def _route_names(self, patterns, namespace):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                yield from self._route_names(pattern.url_patterns, namespace)
+            elif isinstance(pattern, URLPattern) and pattern.name:
+                yield f'{namespace}:{pattern.name}'
+
+    def _check_coverage(self, endpoints):
+        """Warn about routes no endpoint requests"""
+        covered = {endpoint.route for endpoint in endpoints}
+        for urlconf in URLCONFS:
+            module = __import__(urlconf, fromlist=['urlpatterns'])
+            for name in set(self._route_names(
+                module.urlpatterns, module.app_name
+            )) - covered:
+                self.stderr.write(f'Route {name} is not benchmarked')
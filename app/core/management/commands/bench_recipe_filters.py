@@ -0,0 +1,111 @@
+"""
+Django command to compare recipe tag filter query plans
+"""
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.models import Recipe, Tag
+from recipe.filters import filter_by_related, MATCH_ANY, MATCH_ALL
+
+
+class Rollback(Exception):
+    """Raised to discard the seeded dataset"""
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway dataset and compare JOIN + DISTINCT '
+            'against EXISTS tag filtering')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=20000)
+        parser.add_argument('--tags', type=int, default=200)
+        parser.add_argument('--tags-per-recipe', type=int, default=5)
+        parser.add_argument('--filter-tags', type=int, default=3)
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        try:
+            with transaction.atomic():
+                self._run(**options)
+                raise Rollback
+        except Rollback:
+            self.stdout.write('Seeded data rolled back')
+
+    def _seed(self, rng, recipes, tags, tags_per_recipe):
+        """Create a user with recipes linked to random tags"""
+        user = get_user_model().objects.create_user(
+            email=f'bench-{rng.random()}@example.com'
+        )
+        tag_objs = Tag.objects.bulk_create(
+            Tag(user=user, name=f'tag-{i}') for i in range(tags)
+        )
+        recipe_objs = Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    user=user,
+                    title=f'recipe-{i}',
+                    description='',
+                    time_minutes=10,
+                    price=Decimal('1.00'),
+                )
+                for i in range(recipes)
+            ),
+            batch_size=5000,
+        )
+        through = Recipe.tags.through
+        through.objects.bulk_create(
+            (
+                through(recipe_id=recipe.id, tag_id=tag.id)
+                for recipe in recipe_objs
+                for tag in rng.sample(tag_objs, tags_per_recipe)
+            ),
+            batch_size=5000,
+        )
+        with connection.cursor() as cursor:
+            for model in (Recipe, Tag, through):
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+        return user, [tag.id for tag in tag_objs]
+
+    def _time(self, queryset, runs):
+        """Return the median wall time of evaluating a queryset"""
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            list(queryset.values_list('id', flat=True))
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings)
+
+    def _run(self, recipes, tags, tags_per_recipe, filter_tags, runs, seed,
+             **options):
+        rng = random.Random(seed)
+        self.stdout.write(f'Seeding {recipes} recipes and {tags} tags')
+        user, tag_ids = self._seed(rng, recipes, tags, tags_per_recipe)
+        filter_ids = rng.sample(tag_ids, filter_tags)
+        base = Recipe.objects.filter(user=user).order_by('-id')
+
+        plans = {
+            'join + distinct (any)': base.filter(
+                tags__id__in=filter_ids
+            ).distinct(),
+            f'exists ({MATCH_ANY})': filter_by_related(
+                base, 'tags', filter_ids, MATCH_ANY
+            ),
+            f'exists ({MATCH_ALL})': filter_by_related(
+                base, 'tags', filter_ids, MATCH_ALL
+            ),
+        }
+        for name, queryset in plans.items():
+            median = self._time(queryset, runs)
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{name}: {queryset.count()} rows, '
+                f'median {median * 1000:.2f} ms over {runs} runs'
+            ))
+            self.stdout.write(queryset.explain(analyze=True))
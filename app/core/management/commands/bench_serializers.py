@@ -0,0 +1,205 @@
+"""
+Django command to benchmark the recipe serializers and renderer
+"""
+import gc
+import io
+import json
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core import benchmark
+from core.models import Recipe, Tag, Ingredient
+from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+
+# metric -> (relative growth, absolute growth) flagged as a regression
+THRESHOLDS = {
+    'p50_ms': (0.1, 0.5),
+    'peak_kb': (0.1, 16),
+}
+
+
+def _prefetch(recipe, field, objs):
+    """Fill the prefetch cache of a relation like prefetch_related does"""
+    queryset = getattr(recipe, field).all()
+    queryset._result_cache = objs
+    queryset._prefetch_done = True
+    recipe.__dict__.setdefault('_prefetched_objects_cache', {})[field] = (
+        queryset
+    )
+
+
+def _no_queries(execute, sql, params, many, context):
+    raise AssertionError(f'Benchmarks must not query the database: {sql}')
+
+
+class Command(BaseCommand):
+    help = ('Time serializing, rendering, parsing and validating recipes '
+            'in memory, without the HTTP stack or the database')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--objects',
+            type=int,
+            default=1000,
+            help='Recipes handled per run',
+        )
+        parser.add_argument('--tags-per-recipe', type=int, default=3)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=6)
+        parser.add_argument('--runs', type=int, default=10)
+        parser.add_argument(
+            '--only',
+            help='Only run cases whose name contains this text',
+        )
+        parser.add_argument('--output', help='Write the results as JSON')
+        parser.add_argument(
+            '--compare',
+            help='Flag regressions against a JSON results file and exit '
+                 'with an error if there are any',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        recipes = self._recipes(
+            options['objects'],
+            options['tags_per_recipe'],
+            options['ingredients_per_recipe'],
+        )
+        cases = self._cases(recipes)
+
+        results = {}
+        self.stdout.write(
+            f"{'case':<20} {'p50 ms':>9} {'p95 ms':>9} {'objects/s':>10} "
+            f"{'peak KB':>9} {'KB/object':>9}"
+        )
+        with connection.execute_wrapper(_no_queries):
+            for name, case in cases.items():
+                if options['only'] and options['only'] not in name:
+                    continue
+                results[name] = self._measure(
+                    case, options['runs'], options['objects']
+                )
+                result = results[name]
+                self.stdout.write(
+                    f"{name:<20} {result['p50_ms']:>9.2f} "
+                    f"{result['p95_ms']:>9.2f} {result['per_sec']:>10.0f} "
+                    f"{result['peak_kb']:>9.1f} "
+                    f"{result['peak_kb'] / options['objects']:>9.2f}"
+                )
+
+        report = {
+            'environment': benchmark.environment(),
+            'options': {
+                key: options[key] for key in (
+                    'objects', 'tags_per_recipe', 'ingredients_per_recipe',
+                    'runs',
+                )
+            },
+            'cases': results,
+        }
+        if options['output']:
+            benchmark.write_results(options['output'], report)
+            self.stdout.write(f"Results written to {options['output']}")
+        if options['compare']:
+            benchmark.check_regressions(
+                self, benchmark.read_results(options['compare']), report,
+                'cases', THRESHOLDS,
+            )
+
+    def _recipes(self, count, tags_per_recipe, ingredients_per_recipe):
+        """Return unsaved recipes with their tags and ingredients prefetched"""
+        tags = [Tag(id=i, name=f'Tag {i}') for i in range(1, 51)]
+        ingredients = [
+            Ingredient(id=i, name=f'Ingredient {i}') for i in range(1, 201)
+        ]
+        recipes = []
+        for i in range(1, count + 1):
+            recipe = Recipe(
+                id=i,
+                user_id=1,
+                title=f'Recipe {i}',
+                description='Simmer until golden and serve warm. ' * 4,
+                time_minutes=10 + i % 50,
+                price=Decimal(i % 9000) / 100,
+                link=f'https://example.com/recipes/{i}',
+            )
+            _prefetch(recipe, 'tags', [
+                tags[(i + j) % len(tags)] for j in range(tags_per_recipe)
+            ])
+            _prefetch(recipe, 'ingredients', [
+                ingredients[(i + j) % len(ingredients)]
+                for j in range(ingredients_per_recipe)
+            ])
+            recipes.append(recipe)
+        return recipes
+
+    def _cases(self, recipes):
+        """Return `{name: callable}` of the operations to time"""
+        list_data = RecipeSerializer(recipes, many=True).data
+        detail_data = RecipeDetailSerializer(recipes, many=True).data
+        renderer = JSONRenderer()
+        payloads = [
+            {
+                'title': item['title'],
+                'time_minutes': item['time_minutes'],
+                'price': item['price'],
+                'link': item['link'],
+                'tags': [{'name': tag['name']} for tag in item['tags']],
+                'ingredients': [
+                    {'name': ingredient['name']}
+                    for ingredient in item['ingredients']
+                ],
+            }
+            for item in list_data
+        ]
+        bodies = [json.dumps(payload).encode() for payload in payloads]
+        parser = JSONParser()
+
+        def validate():
+            for payload in payloads:
+                serializer = RecipeSerializer(data=payload)
+                if not serializer.is_valid():
+                    raise CommandError(f'Invalid payload: {serializer.errors}')
+
+        return {
+            'serialize-list': lambda: RecipeSerializer(
+                recipes, many=True
+            ).data,
+            'serialize-detail': lambda: RecipeDetailSerializer(
+                recipes, many=True
+            ).data,
+            'render-list': lambda: renderer.render(list_data),
+            'render-detail': lambda: renderer.render(detail_data),
+            'parse-payloads': lambda: [
+                parser.parse(io.BytesIO(body)) for body in bodies
+            ],
+            'validate-payloads': validate,
+        }
+
+    def _measure(self, case, runs, objects):
+        """Time a case and trace the memory it allocates at its peak"""
+        timings = []
+        for _ in range(runs):
+            gc.collect()
+            start = time.perf_counter()
+            case()
+            timings.append(time.perf_counter() - start)
+
+        # traced separately, tracemalloc slows allocations down
+        gc.collect()
+        tracemalloc.start()
+        try:
+            case()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        result = benchmark.percentiles(timings)
+        result['per_sec'] = round(objects / (result['p50_ms'] / 1000), 1)
+        result['peak_kb'] = round(peak / 1024, 1)
+        return result
@@ -0,0 +1,176 @@
+"""
+Django command to delete recipe images no recipe references
+"""
+import os
+import re
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from core.models import Recipe
+from core.storage import lock_names
+
+UPLOAD_DIR = os.path.join('uploads', 'recipe')
+# thumbnails are named <stem>_<size><ext> after their original, with the
+# extension lowercased, and re-encoded siblings <stem><ext>.<format>
+VARIANT_RE = re.compile(r'^(?P<stem>.+)_\d+(?P<ext>\.[^.]*)$')
+SIBLING_RE = re.compile(r'^(?P<name>[^.]+\.[^.]+)\.[^.]+$')
+
+
+class Command(BaseCommand):
+    help = ('Delete files under MEDIA_ROOT/uploads/recipe that no recipe '
+            'image references')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report the files that would be deleted',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=24 * 60 * 60,
+            help='Only delete files last modified at least this many '
+                 'seconds ago, so uploads in flight are kept',
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=0,
+            help='Delete at most this many files per second (0: no limit)',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        self.dry_run = options['dry_run']
+        self.rate = options['rate']
+        self.verbosity = options['verbosity']
+        self.started = time.monotonic()
+        cutoff = time.time() - options['min_age']
+        self.scanned = self.deleted = self.freed = 0
+
+        batch = []
+        root = os.path.join(settings.MEDIA_ROOT, UPLOAD_DIR)
+        for entry in self._scan(root):
+            self.scanned += 1
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime > cutoff:
+                continue
+            batch.append((entry.path, stat.st_size))
+            if len(batch) >= options['batch_size']:
+                self._collect(batch)
+                batch = []
+        if batch:
+            self._collect(batch)
+
+        action = 'would delete' if self.dry_run else 'deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'Scanned {self.scanned} files, {action} {self.deleted} '
+            f'({self.freed} bytes)'
+        ))
+
+    def _scan(self, directory):
+        """Yield the files below a directory without listing it at once"""
+        stack = [directory]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            yield entry
+            except FileNotFoundError:
+                continue
+
+    def _owner(self, path):
+        """Return the image name a stored file belongs to"""
+        name = os.path.relpath(path, settings.MEDIA_ROOT)
+        directory, filename = os.path.split(name)
+        if filename.endswith('.tmp'):
+            # left behind by an interrupted write
+            return None
+        match = SIBLING_RE.match(filename)
+        if match:
+            filename = match['name']
+        match = VARIANT_RE.match(filename)
+        if match:
+            filename = match['stem'] + match['ext']
+        return os.path.join(directory, filename)
+
+    def _referenced(self, names):
+        """Return the lowercased names recipes reference"""
+        return set(
+            Recipe.objects.annotate(image_lower=Lower('image'))
+            .filter(image_lower__in={name.lower() for name in names})
+            .values_list('image_lower', flat=True)
+        )
+
+    def _collect(self, batch):
+        """Delete the unreferenced files of a batch"""
+        owners = {path: self._owner(path) for path, _ in batch}
+        names = {name for name in owners.values() if name}
+        referenced = self._referenced(names)
+        candidates = [
+            (path, size) for path, size in batch
+            if not self._is_referenced(owners[path], referenced)
+        ]
+        if not candidates:
+            return
+        if self.dry_run:
+            for path, size in candidates:
+                self._report(path, size)
+            return
+
+        # the advisory locks block uploads of these names, so batches are
+        # throttled between transactions rather than while holding them
+        size = self._chunk_size()
+        for start in range(0, len(candidates), size):
+            self._delete(candidates[start:start + size], owners)
+            self._throttle()
+
+    def _delete(self, candidates, owners):
+        with transaction.atomic():
+            # an upload reusing a content addressed name holds this lock
+            # until its reference is committed
+            names = {owners[path] for path, _ in candidates if owners[path]}
+            lock_names(names)
+            referenced = self._referenced(names)
+            for path, size in candidates:
+                if self._is_referenced(owners[path], referenced):
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                self._report(path, size)
+
+    def _is_referenced(self, owner, referenced):
+        return owner is not None and owner.lower() in referenced
+
+    def _chunk_size(self):
+        """Return how many files to delete per locked transaction"""
+        # about a tenth of a second of the rate, at least one file
+        return max(1, int(self.rate / 10)) if self.rate else 1000
+
+    def _report(self, path, size):
+        self.deleted += 1
+        self.freed += size
+        if self.verbosity > 1 or (self.dry_run and self.verbosity):
+            self.stdout.write(path)
+
+    def _throttle(self):
+        if not self.rate:
+            return
+        # sleep until the deletions so far fit the rate
+        ahead = self.deleted / self.rate - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
@@ -0,0 +1,99 @@
+"""
+Django command to bulk import recipes from an NDJSON file
+"""
+import sys
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework import serializers
+
+from core.models import Tag, Ingredient
+from recipe.imports import LOAD_METHODS, RecipeImporter
+
+
+class Command(BaseCommand):
+    help = ('Import recipes, tags and ingredients from an NDJSON file in '
+            'the export format, one transaction per batch')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='NDJSON file, "-" for stdin')
+        parser.add_argument(
+            '--user',
+            required=True,
+            help='Email of the user owning the imported recipes',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--method',
+            choices=LOAD_METHODS,
+            default='copy',
+            help='Load with COPY (default) or bulk_create batches',
+        )
+        parser.add_argument(
+            '--max-errors',
+            type=int,
+            default=100,
+            help='Abort after this many invalid rows',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        try:
+            user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'No user with email {options["user"]}')
+        importer = RecipeImporter(user, method=options['method'])
+        self.started = time.monotonic()
+        self.errors = 0
+
+        if options['path'] == '-':
+            self._import(importer, sys.stdin, **options)
+        else:
+            with open(options['path'], encoding='utf-8') as source:
+                self._import(importer, source, **options)
+
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {importer.recipes} recipes, created '
+            f'{importer.created[Tag]} tags and '
+            f'{importer.created[Ingredient]} ingredients, '
+            f'skipped {self.errors} invalid rows in {elapsed:.1f} s '
+            f'({self._rate(importer.recipes, elapsed)} rows/s)'
+        ))
+
+    def _import(self, importer, source, batch_size, max_errors, **options):
+        batch = []
+        for lineno, line in enumerate(source, 1):
+            if not line.strip():
+                continue
+            try:
+                batch.append(importer.validate(line))
+            except serializers.ValidationError as exc:
+                self._error(lineno, exc.detail, max_errors)
+                continue
+            if len(batch) >= batch_size:
+                self._load(importer, batch)
+                batch = []
+        if batch:
+            self._load(importer, batch)
+
+    def _load(self, importer, batch):
+        importer.load(batch)
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(
+            f'{importer.recipes} recipes '
+            f'({self._rate(importer.recipes, elapsed)} rows/s)'
+        )
+
+    def _error(self, lineno, detail, max_errors):
+        self.errors += 1
+        self.stderr.write(f'line {lineno}: {detail}')
+        if self.errors >= max_errors:
+            raise CommandError(
+                f'Aborted after {self.errors} invalid rows, the batches '
+                'loaded so far are kept'
+            )
+
+    def _rate(self, rows, elapsed):
+        return f'{rows / elapsed:.0f}' if elapsed else '-'
@@ -0,0 +1,44 @@
+"""
+Django command to report password hashing statistics
+"""
+from django.core.management.base import BaseCommand
+
+from core.cache import is_shared
+from core.hashing import BUCKETS, get_settings, get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = 'Report latency and rejections of the password hashing pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Reset the counters after reporting them',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        alias = get_settings()['ALIAS']
+        if not is_shared(alias):
+            self.stderr.write(
+                f"PASSWORD_HASHING['ALIAS'] {alias!r} is not shared between "
+                f'processes, only the hashes of this command are counted'
+            )
+        stats = get_stats()
+        percentiles = '  '.join(
+            f"p{p}: {self._bound(stats[f'p{p}_ms'], stats['hashes'])}"
+            for p in (50, 95, 99)
+        )
+        self.stdout.write(
+            f"hashes: {stats['hashes']}  rejected: {stats['rejected']}  "
+            f"mean: {stats['mean_ms']:.1f} ms  {percentiles}"
+        )
+        if options['reset']:
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset'))
+
+    def _bound(self, bound, hashes):
+        if not hashes:
+            return '-'
+        return f'<={bound} ms' if bound is not None else f'>{BUCKETS[-2]} ms'
@@ -0,0 +1,91 @@
+"""
+Django command to generate a synthetic dataset for scale testing
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.seeding import DatasetSeeder, PASSWORD, seed_email
+
+
+class Command(BaseCommand):
+    help = ('Generate users with Zipf distributed recipes, tags and '
+            'ingredients, reproducibly from a seed')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument(
+            '--recipes-per-user',
+            type=int,
+            default=50,
+            help='Mean number of recipes, most owned by a few power users',
+        )
+        parser.add_argument(
+            '--tags', type=int, default=40, help='Tags of each user'
+        )
+        parser.add_argument(
+            '--ingredients',
+            type=int,
+            default=150,
+            help='Ingredients of each user',
+        )
+        parser.add_argument('--tags-per-recipe', type=int, default=3)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=6)
+        parser.add_argument(
+            '--user-skew',
+            type=float,
+            default=1.0,
+            help='Zipf exponent of the recipes per user',
+        )
+        parser.add_argument(
+            '--popularity-skew',
+            type=float,
+            default=1.1,
+            help='Zipf exponent of the tag and ingredient popularity',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Delete the users of previously seeded datasets first',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        if options['clear']:
+            deleted, _ = DatasetSeeder.delete()
+            self.stdout.write(f'Deleted {deleted} seeded rows')
+
+        seeder = DatasetSeeder(
+            seed=options['seed'],
+            users=options['users'],
+            recipes_per_user=options['recipes_per_user'],
+            tags=options['tags'],
+            ingredients=options['ingredients'],
+            tags_per_recipe=options['tags_per_recipe'],
+            ingredients_per_recipe=options['ingredients_per_recipe'],
+            user_skew=options['user_skew'],
+            popularity_skew=options['popularity_skew'],
+            batch_size=options['batch_size'],
+        )
+        started = time.monotonic()
+        seeder.run(progress=self._progress if options['verbosity'] > 1
+                   else None)
+
+        counts = seeder.counts
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {counts['users']} users, {counts['recipes']} recipes, "
+            f"{counts['tags']} tags, {counts['ingredients']} ingredients "
+            f"and {counts['links']} links in "
+            f'{time.monotonic() - started:.1f} s'
+        ))
+        self.stdout.write(
+            f"Log in as {seed_email(options['seed'], 0)} (the largest "
+            f'library) with password {PASSWORD}'
+        )
+
+    def _progress(self, counts):
+        self.stdout.write(
+            f"{counts['recipes']} recipes, {counts['links']} links"
+        )
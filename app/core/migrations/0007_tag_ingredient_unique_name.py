@@ -0,0 +1,57 @@
+# Generated by Django 4.0.10 on 2026-10-17 05:59
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """Point recipes at one row per (user, name) and drop the others"""
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, field_name in (('Tag', 'tags'), ('Ingredient', 'ingredients')):
+        model = apps.get_model('core', model_name)
+        through = getattr(Recipe, field_name).through
+        target = f'{model_name.lower()}_id'
+        duplicates = (
+            model.objects.values('user', 'name')
+            .annotate(keep_id=Min('id'), rows=Count('id'))
+            .filter(rows__gt=1)
+        )
+        for group in duplicates:
+            drop_ids = list(
+                model.objects.filter(user=group['user'], name=group['name'])
+                .exclude(id=group['keep_id'])
+                .values_list('id', flat=True)
+            )
+            recipe_ids = set(
+                through.objects.filter(**{f'{target}__in': drop_ids})
+                .values_list('recipe_id', flat=True)
+            )
+            through.objects.bulk_create(
+                [
+                    through(recipe_id=recipe_id, **{target: group['keep_id']})
+                    for recipe_id in recipe_ids
+                ],
+                ignore_conflicts=True,
+            )
+            model.objects.filter(id__in=drop_ids).delete()
+    # flush deferred FK checks so the constraints below can alter the tables
+    schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_recipe_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='unique_ingredient_name_per_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='unique_tag_name_per_user'),
+        ),
+    ]
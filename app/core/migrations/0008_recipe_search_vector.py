@@ -0,0 +1,30 @@
+# Generated by Django 4.0.10 on 2026-10-17 06:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_tag_ingredient_unique_name'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                """
+                ALTER TABLE core_recipe ADD COLUMN search_vector tsvector
+                GENERATED ALWAYS AS (
+                    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+                    setweight(to_tsvector('english', coalesce(description, '')), 'B')
+                ) STORED
+                """,
+                'CREATE INDEX core_recipe_search_vector_idx '
+                'ON core_recipe USING GIN (search_vector)',
+            ],
+            reverse_sql=[
+                'DROP INDEX core_recipe_search_vector_idx',
+                'ALTER TABLE core_recipe DROP COLUMN search_vector',
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.0.10 on 2026-10-17 06:05
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # indexes are built CONCURRENTLY so live tables stay writable
+    atomic = False
+
+    dependencies = [
+        ('core', '0009_tag_ingredient_name_trgm'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(fields=['user', '-id'], name='recipe_user_id_desc_idx'),
+        ),
+        migrations.RunSQL(
+            sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS recipe_tags_tag_recipe_idx '
+                'ON core_recipe_tags (tag_id, recipe_id)',
+            reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS recipe_tags_tag_recipe_idx',
+        ),
+        migrations.RunSQL(
+            sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS recipe_ingredients_ingredient_recipe_idx '
+                'ON core_recipe_ingredients (ingredient_id, recipe_id)',
+            reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS recipe_ingredients_ingredient_recipe_idx',
+        ),
+    ]
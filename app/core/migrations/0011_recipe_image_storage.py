@@ -0,0 +1,27 @@
+# Generated by Django 4.0.10 on 2026-10-17 06:31
+
+import core.models
+import core.storage
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # the index is built CONCURRENTLY so the recipe table stays writable
+    atomic = False
+
+    dependencies = [
+        ('core', '0010_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.recipe_image_storage, upload_to=core.models.recipe_image_file_path),
+        ),
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(fields=['image'], name='recipe_image_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.0.10 on 2026-10-17 09:12
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+    # the index is built CONCURRENTLY so the recipe table stays writable
+    atomic = False
+
+    dependencies = [
+        ('core', '0011_recipe_image_storage'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(django.db.models.functions.text.Lower('image'), name='recipe_image_lower_idx'),
+        ),
+    ]
@@ -1,13 +1,16 @@
 """
 Database Models
 """
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Lower, Upper
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin)
 
 from app import settings
+from core.storage import recipe_image_storage
 import uuid
 import os
 
@@ -51,6 +54,10 @@ class User(AbstractBaseUser, PermissionsMixin):
 
 class Recipe(models.Model):
     """Recipe Model"""
+    # core_recipe also has a `search_vector` tsvector column generated by
+    # Postgres from title and description (see migration 0008). It is not
+    # a model field so Django never writes it; query it through
+    # recipe.filters.search_recipes.
     title = models.CharField(max_length=255)
     description = models.TextField()
     time_minutes = models.IntegerField()
@@ -65,9 +72,23 @@ class Recipe(models.Model):
     image = models.ImageField(
         null=True,
         blank=True,
-        upload_to=recipe_image_file_path
+        upload_to=recipe_image_file_path,
+        storage=recipe_image_storage
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', '-id'],
+                name='recipe_user_id_desc_idx',
+            ),
+            # counts the references to a content addressed image
+            models.Index(fields=['image'], name='recipe_image_idx'),
+            # thumbnails lowercase the extension of their original, so
+            # gc_media looks their owners up case insensitively
+            models.Index(Lower('image'), name='recipe_image_lower_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -80,6 +101,20 @@ class Tag(models.Model):
         on_delete=models.CASCADE
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='unique_tag_name_per_user',
+            ),
+        ]
+        indexes = [
+            GinIndex(
+                OpClass(Upper('name'), name='gin_trgm_ops'),
+                name='tag_name_trgm_idx',
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -92,5 +127,19 @@ class Ingredient(models.Model):
         on_delete=models.CASCADE
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                name='unique_ingredient_name_per_user',
+            ),
+        ]
+        indexes = [
+            GinIndex(
+                OpClass(Upper('name'), name='gin_trgm_ops'),
+                name='ingredient_name_trgm_idx',
+            ),
+        ]
+
     def __str__(self):
         return self.name
@@ -0,0 +1,227 @@
+"""
+Deterministic synthetic datasets for scale testing
+"""
+import bisect
+import itertools
+import random
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+
+from core.models import Recipe, Tag, Ingredient
+
+EMAIL_DOMAIN = 'seed.example.com'
+PASSWORD = 'seed-password'
+
+ADJECTIVES = (
+    'Spicy', 'Creamy', 'Smoky', 'Crispy', 'Roasted', 'Grilled', 'Quick',
+    'Rustic', 'Zesty', 'Garlic', 'Sweet', 'Herbed', 'Baked', 'Fresh',
+)
+DISHES = (
+    'Soup', 'Salad', 'Curry', 'Pasta', 'Stew', 'Tacos', 'Risotto', 'Pie',
+    'Noodles', 'Burger', 'Omelette', 'Chili', 'Casserole', 'Flatbread',
+)
+TAG_WORDS = (
+    'Vegan', 'Vegetarian', 'Dinner', 'Lunch', 'Breakfast', 'Dessert',
+    'Quick', 'Healthy', 'Comfort', 'Spicy', 'Gluten Free', 'Party',
+    'Budget', 'Kids', 'Summer', 'Winter', 'Italian', 'Mexican', 'Thai',
+    'Indian', 'Baking', 'Grill', 'Slow Cooker', 'One Pot',
+)
+INGREDIENT_WORDS = (
+    'Salt', 'Pepper', 'Olive Oil', 'Garlic', 'Onion', 'Butter', 'Flour',
+    'Sugar', 'Eggs', 'Milk', 'Tomato', 'Lemon', 'Rice', 'Chicken', 'Beef',
+    'Lentils', 'Chickpeas', 'Basil', 'Parsley', 'Cumin', 'Paprika',
+    'Ginger', 'Soy Sauce', 'Cheese', 'Potato', 'Carrot', 'Spinach',
+    'Mushroom', 'Coconut Milk', 'Honey',
+)
+WORDS = (
+    'stir', 'simmer', 'until', 'golden', 'season', 'taste', 'serve', 'warm',
+    'with', 'fresh', 'herbs', 'the', 'and', 'slowly', 'add', 'sauce',
+    'bake', 'minutes', 'crisp', 'tender', 'bowl', 'mix', 'chop', 'finely',
+)
+
+
+def seed_email(seed, index):
+    """Return the email of the `index`th user of a seeded dataset"""
+    return f'user-{seed}-{index}@{EMAIL_DOMAIN}'
+
+
+def zipf_cum_weights(count, exponent):
+    """Return cumulative weights of ranks 1..count under Zipf's law"""
+    return list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)
+    ))
+
+
+def skewed_counts(total, count, exponent):
+    """Split `total` into `count` Zipf distributed parts, each at least 1"""
+    if not count:
+        return []
+    cum_weights = zipf_cum_weights(count, exponent)
+    weights = [
+        b - a for a, b in zip([0] + cum_weights, cum_weights)
+    ]
+    scale = max(total - count, 0) / cum_weights[-1]
+    return [1 + int(weight * scale) for weight in weights]
+
+
+def _names(words, count):
+    """Return `count` distinct names, numbering words once they run out"""
+    return [
+        words[i % len(words)]
+        + (f' {i // len(words) + 1}' if i >= len(words) else '')
+        for i in range(count)
+    ]
+
+
+class DatasetSeeder:
+    """
+    Generate users with recipes, tags and ingredients from a seed.
+
+    Recipe counts per user follow Zipf's law, so a few power users own
+    most recipes, and so does the popularity of each user's tags and
+    ingredients. Every value comes from one random.Random(seed) drawn in
+    a fixed order, so a seed produces the same rows on any machine and at
+    any batch size. Rows are written with bulk_create.
+    """
+
+    def __init__(self, seed=0, users=100, recipes_per_user=50, tags=40,
+                 ingredients=150, tags_per_recipe=3, ingredients_per_recipe=6,
+                 user_skew=1.0, popularity_skew=1.1, batch_size=5000):
+        self.seed = seed
+        self.users = users
+        self.recipes_per_user = recipes_per_user
+        self.tags = tags
+        self.ingredients = ingredients
+        self.tags_per_recipe = tags_per_recipe
+        self.ingredients_per_recipe = ingredients_per_recipe
+        self.user_skew = user_skew
+        self.popularity_skew = popularity_skew
+        self.batch_size = batch_size
+        self.counts = {'users': 0, 'recipes': 0, 'tags': 0,
+                       'ingredients': 0, 'links': 0}
+
+    @classmethod
+    def delete(cls):
+        """Delete the users of every seeded dataset and what they own"""
+        return get_user_model().objects.filter(
+            email__endswith=f'@{EMAIL_DOMAIN}'
+        ).delete()
+
+    def run(self, progress=None):
+        """Write the dataset and return the ids of its users"""
+        rng = random.Random(self.seed)
+        recipe_counts = skewed_counts(
+            self.users * self.recipes_per_user, self.users, self.user_skew
+        )
+        with transaction.atomic():
+            users = self._create_users()
+        for user, recipe_count in zip(users, recipe_counts):
+            with transaction.atomic():
+                self._seed_user(rng, user, recipe_count)
+            if progress:
+                progress(self.counts)
+        with connection.cursor() as cursor:
+            for model in (Recipe, Tag, Ingredient,
+                          Recipe.tags.through, Recipe.ingredients.through):
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+        return [user.id for user in users]
+
+    def _create_users(self):
+        # hashing once keeps seeding fast; every user logs in with PASSWORD
+        password = make_password(PASSWORD)
+        users = get_user_model().objects.bulk_create(
+            (
+                get_user_model()(
+                    email=seed_email(self.seed, i),
+                    name=f'Seed user {i}',
+                    password=password,
+                )
+                for i in range(self.users)
+            ),
+            batch_size=self.batch_size,
+        )
+        self.counts['users'] += len(users)
+        return users
+
+    def _sample(self, rng, population, cum_weights, mean):
+        """Pick about `mean` distinct items, popular ones more often"""
+        count = min(
+            max(0, round(rng.gauss(mean, mean / 3))), len(population)
+        )
+        picked = {}
+        while len(picked) < count:
+            index = bisect.bisect(cum_weights, rng.random() * cum_weights[-1])
+            picked[min(index, len(population) - 1)] = None
+        return [population[index] for index in picked]
+
+    def _seed_user(self, rng, user, recipe_count):
+        tags = Tag.objects.bulk_create(
+            Tag(user=user, name=name)
+            for name in _names(TAG_WORDS, self.tags)
+        )
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(user=user, name=name)
+            for name in _names(INGREDIENT_WORDS, self.ingredients)
+        )
+        self.counts['tags'] += len(tags)
+        self.counts['ingredients'] += len(ingredients)
+        # every user likes different tags best
+        rng.shuffle(tags)
+        rng.shuffle(ingredients)
+        tag_weights = zipf_cum_weights(len(tags), self.popularity_skew)
+        ingredient_weights = zipf_cum_weights(
+            len(ingredients), self.popularity_skew
+        )
+
+        remaining = recipe_count
+        while remaining:
+            size = min(remaining, self.batch_size)
+            remaining -= size
+            recipes, links = [], []
+            for _ in range(size):
+                recipes.append(self._recipe(rng, user))
+                links.append((
+                    self._sample(
+                        rng, tags, tag_weights, self.tags_per_recipe
+                    ),
+                    self._sample(
+                        rng, ingredients, ingredient_weights,
+                        self.ingredients_per_recipe,
+                    ),
+                ))
+            Recipe.objects.bulk_create(recipes)
+            self.counts['recipes'] += len(recipes)
+            self._link(recipes, links)
+
+    def _recipe(self, rng, user):
+        words = max(3, int(rng.paretovariate(1.5) * 8))
+        return Recipe(
+            user=user,
+            title=f'{rng.choice(ADJECTIVES)} {rng.choice(DISHES)}',
+            description=' '.join(rng.choices(WORDS, k=words)).capitalize(),
+            time_minutes=min(5 + int(rng.lognormvariate(3, 0.6)), 600),
+            price=Decimal(rng.randint(100, 4999)) / 100,
+            link='',
+        )
+
+    def _link(self, recipes, links):
+        tag_through = Recipe.tags.through
+        ingredient_through = Recipe.ingredients.through
+        tag_rows = [
+            tag_through(recipe_id=recipe.id, tag_id=tag.id)
+            for recipe, (tags, _) in zip(recipes, links)
+            for tag in tags
+        ]
+        ingredient_rows = [
+            ingredient_through(recipe_id=recipe.id, ingredient_id=item.id)
+            for recipe, (_, ingredients) in zip(recipes, links)
+            for item in ingredients
+        ]
+        tag_through.objects.bulk_create(tag_rows, batch_size=self.batch_size)
+        ingredient_through.objects.bulk_create(
+            ingredient_rows, batch_size=self.batch_size
+        )
+        self.counts['links'] += len(tag_rows) + len(ingredient_rows)
@@ -0,0 +1,105 @@
+"""
+Storage for recipe images
+"""
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+
+
+def lock_name(name):
+    """
+    Serialise writers and releasers of a stored name.
+
+    Takes a transaction scoped advisory lock, so it only protects callers
+    inside transaction.atomic() and is released on commit.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [name])
+
+
+def lock_names(names):
+    """Take the lock_name() lock of several names in one query"""
+    with connection.cursor() as cursor:
+        # a fixed order keeps two callers from deadlocking
+        cursor.execute(
+            'SELECT pg_advisory_xact_lock(hashtext(name)) '
+            'FROM unnest(%s::text[]) WITH ORDINALITY AS t(name, n) '
+            'ORDER BY n',
+            [sorted(names)],
+        )
+
+
+class RecipeImageStorage(FileSystemStorage):
+    """
+    File system storage that can name files by their content.
+
+    With RECIPE_IMAGE_CONTENT_ADDRESSED set, a file is stored as the
+    SHA-256 of its bytes under uploads/recipe/<2 hex>/, so identical
+    uploads share one file and a repeated upload skips the write; the
+    Recipe rows pointing at a name are its reference count.
+    """
+
+    @property
+    def content_addressed(self):
+        return getattr(settings, 'RECIPE_IMAGE_CONTENT_ADDRESSED', False)
+
+    def content_name(self, name, content):
+        """Return the content addressed name of `content`"""
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        hexdigest = digest.hexdigest()
+        ext = os.path.splitext(name)[1].lower()
+        return os.path.join(
+            'uploads', 'recipe', hexdigest[:2], f'{hexdigest}{ext}'
+        )
+
+    def save(self, name, content, max_length=None):
+        if not self.content_addressed:
+            return super().save(name, content, max_length)
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        lock_name(name)
+        if self.exists(name):
+            return name
+        return self._save_replace(name, content)
+
+    def _save_replace(self, name, content):
+        # identical bytes may race in from another request; replacing the
+        # file atomically keeps whichever copy lands last
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            if hasattr(content, 'temporary_file_path'):
+                os.close(fd)
+                file_move_safe(
+                    content.temporary_file_path(), tmp_path,
+                    allow_overwrite=True,
+                )
+            else:
+                with os.fdopen(fd, 'wb') as tmp_file:
+                    for chunk in content.chunks():
+                        tmp_file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return name
+
+
+def recipe_image_storage():
+    """Return the storage of Recipe.image"""
+    return RecipeImageStorage()
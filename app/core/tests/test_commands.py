@@ -1,12 +1,25 @@
 """
 Test custom Django management commands
 """
+import json
+import os
+import shutil
+import tempfile
+import time
+from decimal import Decimal
+from io import StringIO
 from unittest.mock import patch
 
-from django.db import OperationalError
+from django.db import connection, OperationalError
 from psycopg2 import OperationalError as Psycopg2Error
-from django.core.management import call_command
-from django.test import SimpleTestCase
+from django.contrib.auth import get_user_model
+from django.core.management import call_command, CommandError
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core.models import Recipe, Tag
+from core.seeding import DatasetSeeder, seed_email
+from recipe.export import ndjson_lines
+from recipe.filters import search_recipes
 
 
 @patch("core.management.commands.wait_for_db.Command.check")
@@ -28,3 +41,382 @@ class CommandTests(SimpleTestCase):
         call_command('wait_for_db')
         self.assertEqual(mock_check.call_count, 6)
         mock_check.assert_called_with(databases=['default'])
+
+
+class BenchRecipeFiltersCommandTests(TestCase):
+    """Test the recipe filter benchmark command"""
+
+    def test_bench_recipe_filters_rolls_back(self):
+        """Test benchmark reports each plan and leaves no data behind"""
+        out = StringIO()
+        call_command(
+            'bench_recipe_filters',
+            recipes=20,
+            tags=5,
+            tags_per_recipe=2,
+            filter_tags=2,
+            runs=1,
+            stdout=out,
+        )
+        output = out.getvalue()
+        self.assertIn('join + distinct', output)
+        self.assertIn('exists (all)', output)
+        self.assertFalse(Recipe.objects.exists())
+
+
+class GcMediaCommandTests(TestCase):
+    """Test deleting unreferenced recipe images"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root
+        )
+        self.settings_override.enable()
+        self.upload_dir = os.path.join(self.media_root, 'uploads', 'recipe')
+        os.makedirs(os.path.join(self.upload_dir, 'ab'))
+        user = get_user_model().objects.create_user(
+            email='user@example.com', password='test123'
+        )
+        Recipe.objects.create(
+            user=user,
+            title='sample recipe',
+            time_minutes=10,
+            price=Decimal('5.00'),
+            image='uploads/recipe/ab/kept.jpg',
+        )
+        self.kept = self._file('ab/kept.jpg')
+        self.kept_variant = self._file('ab/kept_128.jpg')
+        self.orphan = self._file('orphan.jpg')
+        self.orphan_variant = self._file('orphan_512.jpg')
+        self.recent = self._file('recent.jpg', age=0)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def _file(self, name, age=3600):
+        """Create a file under the upload directory `age` seconds old"""
+        path = os.path.join(self.upload_dir, name)
+        with open(path, 'wb') as upload:
+            upload.write(b'x' * 10)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_gc_media_deletes_orphans(self):
+        """Test unreferenced files older than min-age are deleted"""
+        out = StringIO()
+        call_command('gc_media', min_age=60, batch_size=2, stdout=out)
+
+        for path in (self.kept, self.kept_variant, self.recent):
+            self.assertTrue(os.path.exists(path))
+        for path in (self.orphan, self.orphan_variant):
+            self.assertFalse(os.path.exists(path))
+        self.assertIn('Scanned 5 files, deleted 2', out.getvalue())
+
+    def test_gc_media_dry_run(self):
+        """Test a dry run lists orphans without deleting them"""
+        out = StringIO()
+        call_command('gc_media', min_age=60, dry_run=True, stdout=out)
+
+        self.assertTrue(os.path.exists(self.orphan))
+        self.assertIn(self.orphan, out.getvalue())
+        self.assertIn('would delete 2', out.getvalue())
+
+    @patch('core.management.commands.gc_media.time.sleep')
+    def test_gc_media_rate_limit(self, mock_sleep):
+        """Test deletions are spaced out to the requested rate"""
+        call_command('gc_media', min_age=60, rate=1, stdout=StringIO())
+
+        self.assertTrue(mock_sleep.called)
+
+    def test_gc_media_sleeps_outside_the_lock(self):
+        """Test throttling never holds the locked transaction"""
+        depth = len(connection.savepoint_ids)
+        depths = []
+        with patch(
+            'core.management.commands.gc_media.time.sleep',
+            side_effect=lambda _: depths.append(
+                len(connection.savepoint_ids)
+            ),
+        ):
+            call_command('gc_media', min_age=60, rate=1, stdout=StringIO())
+
+        self.assertTrue(depths)
+        self.assertEqual(set(depths), {depth})
+
+    def test_gc_media_matches_owner_case_insensitively(self):
+        """Test thumbnails of an upper case extension are kept"""
+        Recipe.objects.create(
+            user=get_user_model().objects.get(),
+            title='sample recipe',
+            time_minutes=10,
+            price=Decimal('5.00'),
+            image='uploads/recipe/ab/upper.JPG',
+        )
+        original = self._file('ab/upper.JPG')
+        variant = self._file('ab/upper_128.jpg')
+
+        call_command('gc_media', min_age=60, stdout=StringIO())
+
+        self.assertTrue(os.path.exists(original))
+        self.assertTrue(os.path.exists(variant))
+        self.assertFalse(os.path.exists(self.orphan_variant))
+
+
+class ImportRecipesCommandTests(TestCase):
+    """Test the import_recipes command"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='test123'
+        )
+        Tag.objects.create(user=self.user, name='Vegan')
+
+    def _import(self, rows, *args):
+        with tempfile.NamedTemporaryFile(
+            'w', suffix='.ndjson', delete=False
+        ) as source:
+            for row in rows:
+                source.write(
+                    (row if isinstance(row, str) else json.dumps(row)) + '\n'
+                )
+        self.addCleanup(os.remove, source.name)
+        out, err = StringIO(), StringIO()
+        call_command(
+            'import_recipes', source.name, '--user', self.user.email,
+            '--batch-size', '2', *args, stdout=out, stderr=err,
+        )
+        return out.getvalue(), err.getvalue()
+
+    def _rows(self):
+        return [
+            {'type': 'tag', 'name': 'Unused'},
+            {
+                'title': 'Lentil soup',
+                'description': 'Red lentils',
+                'time_minutes': 30,
+                'price': '4.50',
+                'tags': ['Vegan', 'Soup', 'Soup'],
+                'ingredients': ['Lentils'],
+            },
+            {'title': 'Toast', 'time_minutes': 5, 'price': '1.00'},
+            {'title': 'Salad', 'time_minutes': 10, 'price': '3.00',
+             'tags': ['Vegan']},
+        ]
+
+    def _assert_imported(self):
+        recipes = Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual(
+            [recipe.title for recipe in recipes],
+            ['Lentil soup', 'Toast', 'Salad'],
+        )
+        soup = recipes[0]
+        self.assertEqual(soup.price, Decimal('4.50'))
+        self.assertEqual(
+            sorted(soup.tags.values_list('name', flat=True)),
+            ['Soup', 'Vegan'],
+        )
+        self.assertEqual(
+            list(soup.ingredients.values_list('name', flat=True)),
+            ['Lentils'],
+        )
+        self.assertEqual(
+            Tag.objects.filter(user=self.user).count(), 3
+        )
+        self.assertEqual(recipes[1].description, '')
+        self.assertFalse(recipes[1].image)
+
+    def test_import_copy(self):
+        """Test rows are loaded with COPY"""
+        out, _ = self._import(self._rows())
+
+        self._assert_imported()
+        self.assertIn('Imported 3 recipes, created 2 tags', out)
+        self.assertIn('rows/s', out)
+        # the generated search column is filled in
+        self.assertEqual(
+            search_recipes(Recipe.objects.all(), 'lentils').count(), 1
+        )
+        # ids were taken from the sequence
+        Recipe.objects.create(
+            user=self.user, title='New', time_minutes=1, price=Decimal('1')
+        )
+
+    def test_import_bulk_create(self):
+        """Test rows are loaded with bulk_create"""
+        self._import(self._rows(), '--method', 'bulk')
+
+        self._assert_imported()
+
+    def test_invalid_rows_skipped(self):
+        """Test invalid rows are reported and the rest imported"""
+        _, err = self._import([
+            'not json',
+            {'title': 'No price', 'time_minutes': 5},
+            {'type': 'unknown'},
+            {'title': 'Valid', 'time_minutes': 5, 'price': '1.00'},
+            {'title': 'Nested', 'time_minutes': 5, 'price': '1.00',
+             'tags': [['Vegan']]},
+            {'type': 'tag', 'name': {'name': 'Vegan'}},
+        ])
+
+        self.assertIn('line 1', err)
+        self.assertIn('line 2', err)
+        self.assertIn('line 3', err)
+        self.assertIn('line 5', err)
+        self.assertIn('line 6', err)
+        self.assertEqual(
+            list(Recipe.objects.values_list('title', flat=True)), ['Valid']
+        )
+
+    def test_max_errors(self):
+        """Test the import aborts after too many invalid rows"""
+        with self.assertRaises(CommandError):
+            self._import(['{}'] * 3, '--max-errors', '2')
+
+    def test_export_round_trip(self):
+        """Test an export of another user can be imported"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='test123'
+        )
+        recipe = Recipe.objects.create(
+            user=other, title='Soup', time_minutes=5, price=Decimal('2.00')
+        )
+        recipe.tags.add(Tag.objects.create(user=other, name='Vegan'))
+
+        self._import([line.rstrip('\n') for line in ndjson_lines(other)])
+
+        imported = Recipe.objects.get(user=self.user)
+        self.assertEqual(imported.title, 'Soup')
+        self.assertEqual(
+            list(imported.tags.values_list('name', flat=True)), ['Vegan']
+        )
+
+
+class SeedDataCommandTests(TestCase):
+    """Test the seed_data command"""
+
+    def _seed(self, *args):
+        call_command(
+            'seed_data', '--users', '5', '--recipes-per-user', '8',
+            '--tags', '6', '--ingredients', '10', *args, stdout=StringIO(),
+        )
+        return [
+            (
+                recipe.user.email, recipe.title, recipe.description,
+                recipe.price, recipe.time_minutes,
+                sorted(recipe.tags.values_list('name', flat=True)),
+                sorted(recipe.ingredients.values_list('name', flat=True)),
+            )
+            for recipe in Recipe.objects.select_related('user').order_by('id')
+        ]
+
+    def test_deterministic(self):
+        """Test a seed produces the same rows at any batch size"""
+        first = self._seed('--seed', '3')
+        DatasetSeeder.delete()
+        second = self._seed('--seed', '3', '--batch-size', '7')
+        DatasetSeeder.delete()
+        other = self._seed('--seed', '4')
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+
+    def test_skewed(self):
+        """Test the first user owns the most recipes"""
+        rows = self._seed()
+        counts = [
+            sum(row[0] == seed_email(0, i) for row in rows) for i in range(5)
+        ]
+
+        self.assertEqual(counts, sorted(counts, reverse=True))
+        self.assertGreater(counts[0], 2 * counts[-1])
+        self.assertEqual(Tag.objects.count(), 5 * 6)
+
+    def test_clear(self):
+        """Test --clear replaces a previously seeded dataset"""
+        self._seed()
+        rows = self._seed('--clear')
+
+        self.assertEqual(Recipe.objects.count(), len(rows))
+        self.assertEqual(
+            get_user_model().objects.filter(
+                email=seed_email(0, 0)
+            ).count(), 1
+        )
+
+
+class BenchApiCommandTests(TestCase):
+    """Test the bench_api command"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output = os.path.join(self.directory, 'results.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _bench(self, *args):
+        out, err = StringIO(), StringIO()
+        call_command(
+            'bench_api', '--users', '2', '--recipes-per-user', '3',
+            '--requests', '2', '--warmup', '0', *args,
+            stdout=out, stderr=err,
+        )
+        return out.getvalue(), err.getvalue()
+
+    def test_every_route_benchmarked(self):
+        """Test each route is requested successfully and recorded"""
+        _, err = self._bench('--output', self.output)
+
+        self.assertNotIn('not benchmarked', err)
+        with open(self.output) as results_file:
+            endpoints = json.load(results_file)['endpoints']
+        self.assertIn('recipe-export', endpoints)
+        for name, result in endpoints.items():
+            self.assertTrue(
+                all(200 <= code < 300 for code in result['status']), name
+            )
+            self.assertGreater(result['p99_ms'], 0)
+        # the seeded dataset is rolled back
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_compare_flags_regressions(self):
+        """Test more queries than the baseline fail the comparison"""
+        self._bench('--only', 'recipe-detail', '--output', self.output)
+        with open(self.output) as results_file:
+            baseline = json.load(results_file)
+        result = baseline['endpoints']['recipe-detail']
+        result['queries'] -= 1
+        # keep timing noise out of the comparison
+        result['p50_ms'] = result['p95_ms'] = 1000000
+        with open(self.output, 'w') as results_file:
+            json.dump(baseline, results_file)
+
+        with self.assertRaisesRegex(CommandError, '1 regressions'):
+            self._bench('--only', 'recipe-detail', '--compare', self.output)
+
+
+class BenchSerializersCommandTests(SimpleTestCase):
+    """Test the bench_serializers command"""
+
+    def test_cases_recorded(self):
+        """Test every case runs in memory and is recorded"""
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command(
+                'bench_serializers', '--objects', '5', '--runs', '2',
+                '--output', output, stdout=StringIO(),
+            )
+            with open(output) as results_file:
+                cases = json.load(results_file)['cases']
+
+        self.assertEqual(set(cases), {
+            'serialize-list', 'serialize-detail', 'render-list',
+            'render-detail', 'parse-payloads', 'validate-payloads',
+        })
+        for result in cases.values():
+            self.assertGreater(result['per_sec'], 0)
+            self.assertGreater(result['peak_kb'], 0)
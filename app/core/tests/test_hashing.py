@@ -0,0 +1,127 @@
+"""
+Tests for pooled password hashing
+"""
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import (
+    check_password,
+    make_password,
+    PBKDF2PasswordHasher
+)
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.test import APIClient
+
+from core.hashing import (
+    BUCKETS,
+    get_pool,
+    get_stats,
+    PasswordHashingBusy,
+    reset_stats
+)
+
+TOKEN_URL = reverse('user:token')
+CREATE_USER_URL = reverse('user:create')
+
+
+class PooledPasswordHasherTests(TestCase):
+    """Test hashing passwords on the bounded pool"""
+
+    def setUp(self):
+        reset_stats()
+
+    def test_hashes_compatible_with_stock_hasher(self):
+        """Test pooled and stock PBKDF2 hashes verify each other"""
+        pooled = make_password('secret', salt='salt')
+        stock = PBKDF2PasswordHasher().encode('secret', 'salt')
+
+        self.assertEqual(pooled, stock)
+        self.assertTrue(check_password('secret', stock))
+
+    def test_latency_recorded(self):
+        """Test each hash is counted with its latency"""
+        make_password('secret')
+        make_password('other')
+        stats = get_stats()
+
+        self.assertEqual(stats['hashes'], 2)
+        self.assertGreater(stats['mean_ms'], 0)
+        self.assertIn(stats['p95_ms'], BUCKETS)
+
+    @override_settings(PASSWORD_HASHING={'WORKERS': 1, 'QUEUE_DEPTH': 0})
+    def test_saturated_pool_rejects_login(self):
+        """Test logins fail fast with 503 while the pool is full"""
+        get_user_model().objects.create_user(
+            email='user@example.com', password='test123'
+        )
+        pool = get_pool()
+        pool._slots.acquire()
+        try:
+            res = APIClient().post(
+                TOKEN_URL,
+                {'email': 'user@example.com', 'password': 'test123'},
+            )
+        finally:
+            pool._slots.release()
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res['Retry-After'], '1')
+        self.assertEqual(get_stats()['rejected'], 1)
+
+    @override_settings(PASSWORD_HASHING={'WORKERS': 1, 'QUEUE_DEPTH': 0})
+    def test_saturated_pool_rejects_sign_up(self):
+        """Test sign-ups fail fast with 503 while the pool is full"""
+        pool = get_pool()
+        pool._slots.acquire()
+        try:
+            res = APIClient().post(CREATE_USER_URL, {
+                'email': 'user@example.com',
+                'password': 'test123',
+                'name': 'Test Name',
+            })
+        finally:
+            pool._slots.release()
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertFalse(get_user_model().objects.exists())
+
+    @override_settings(PASSWORD_HASHING={'WORKERS': 1, 'QUEUE_DEPTH': 0})
+    def test_saturated_pool_outside_the_api(self):
+        """Test the hasher raises a plain exception, not a DRF one"""
+        pool = get_pool()
+        pool._slots.acquire()
+        try:
+            with self.assertRaises(PasswordHashingBusy) as raised:
+                make_password('secret')
+        finally:
+            pool._slots.release()
+
+        self.assertNotIsInstance(raised.exception, APIException)
+
+    def test_stats_command(self):
+        """Test the stats command reports counters"""
+        make_password('secret')
+        out = StringIO()
+        call_command('password_hash_stats', '--reset', stdout=out)
+
+        self.assertIn('hashes: 1', out.getvalue())
+        self.assertEqual(get_stats()['hashes'], 0)
+
+    @override_settings(PASSWORD_HASHING={'ALIAS': 'default'})
+    def test_stats_command_warns_about_unshared_cache(self):
+        """Test the command notices counters no other process sees"""
+        err = StringIO()
+        call_command('password_hash_stats', stdout=StringIO(), stderr=err)
+
+        self.assertIn('not shared between processes', err.getvalue())
+
+    def test_stats_command_quiet_for_shared_cache(self):
+        """Test the default counters are shared between processes"""
+        err = StringIO()
+        call_command('password_hash_stats', stdout=StringIO(), stderr=err)
+
+        self.assertEqual(err.getvalue(), '')
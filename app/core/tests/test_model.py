@@ -2,6 +2,7 @@
 test for model
 """
 from decimal import Decimal
+from django.db import IntegrityError
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from core import models
@@ -73,6 +74,13 @@ class ModelTests(TestCase):
         tag = models.Tag.objects.create(name='tag', user=user)
         self.assertEqual(str(tag), tag.name)
 
+    def test_tag_name_unique_per_user(self):
+        """Test a user cannot have two tags with the same name"""
+        user = create_user()
+        models.Tag.objects.create(name='tag', user=user)
+        with self.assertRaises(IntegrityError):
+            models.Tag.objects.create(name='tag', user=user)
+
     def test_creating_ingredients(self):
         """Test creating an ingredients is successful"""
         user = create_user()
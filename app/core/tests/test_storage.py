@@ -0,0 +1,94 @@
+"""
+Tests for content addressed recipe image storage
+"""
+import io
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from core.models import Recipe
+from core.storage import RecipeImageStorage
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def image_file(color='red'):
+    """Return an uploaded PNG of a single color"""
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), color).save(buffer, 'PNG')
+    return SimpleUploadedFile('photo.PNG', buffer.getvalue())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, RECIPE_IMAGE_CONTENT_ADDRESSED=True)
+class ContentAddressedStorageTests(TestCase):
+    """Test deduplicated storage of recipe images"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='test123'
+        )
+
+    def tearDown(self):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def _recipe(self, upload=None):
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='sample recipe',
+            time_minutes=10,
+            price=Decimal('5.00'),
+        )
+        if upload is not None:
+            recipe.image.save(upload.name, upload)
+        return recipe
+
+    def test_identical_uploads_share_a_file(self):
+        """Test identical bytes are stored once under their hash"""
+        first = self._recipe(image_file())
+        with patch.object(
+            RecipeImageStorage, '_save_replace'
+        ) as save_replace:
+            second = self._recipe(image_file())
+
+        save_replace.assert_not_called()
+        self.assertEqual(first.image.name, second.image.name)
+        name = os.path.basename(first.image.name)
+        self.assertRegex(name, r'^[0-9a-f]{64}\.png$')
+        self.assertTrue(os.path.exists(first.image.path))
+
+    def test_different_uploads_stored_apart(self):
+        """Test different bytes get different names"""
+        first = self._recipe(image_file('red'))
+        second = self._recipe(image_file('blue'))
+
+        self.assertNotEqual(first.image.name, second.image.name)
+
+    def test_last_reference_frees_file(self):
+        """Test a file is deleted once no recipe references it"""
+        first = self._recipe(image_file())
+        second = self._recipe(image_file())
+        path = first.image.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.image.save('other.png', image_file('blue'))
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(first.image.path))
+
+    @override_settings(RECIPE_IMAGE_CONTENT_ADDRESSED=False)
+    def test_disabled_keeps_unique_names(self):
+        """Test uploads keep their random names when the mode is off"""
+        first = self._recipe(image_file())
+        second = self._recipe(image_file())
+
+        self.assertNotEqual(first.image.name, second.image.name)
@@ -0,0 +1,230 @@
+"""
+Per-user versioned response cache for recipe APIs
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from core.cache import is_shared
+
+VERSION_KEY = 'api-version:{user_id}'
+MODIFIED_KEY = 'api-modified:{user_id}'
+RESPONSE_KEY = 'api-response:{user_id}:{version}:{digest}'
+HITS_KEY = 'api-stats:hits'
+MISSES_KEY = 'api-stats:misses'
+
+
+def get_cache():
+    """Return the cache backend configured for API responses"""
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def is_enabled():
+    """
+    Return whether versions can be trusted across processes.
+
+    Writes in another worker or a management command only bump the
+    version in their own process' copy of a per-process cache, so the
+    response cache and conditional GETs are off unless the API cache is
+    shared.
+    """
+    return is_shared(settings.API_CACHE_ALIAS)
+
+
+@checks.register(checks.Tags.caches)
+def check_api_cache(app_configs, **kwargs):
+    """Warn when the API cache is per-process and so never used"""
+    if is_enabled():
+        return []
+    return [checks.Warning(
+        f'The {settings.API_CACHE_ALIAS!r} cache is not shared between '
+        f'processes, so list responses are not cached and recipe '
+        f'endpoints answer no conditional requests.',
+        hint='Set API_CACHE_BACKEND to a file based, Redis or Memcached '
+             'cache.',
+        id='recipe.W001',
+    )]
+
+
+def clear_responses():
+    """Drop every cached response and version"""
+    get_cache().clear()
+
+
+def _new_version():
+    # versions come from the clock, so a version lost to eviction or a
+    # restart is never reused while responses may still be cached under it
+    return time.time_ns()
+
+
+def get_version(user_id):
+    """Return the current cache version of a user's data"""
+    cache = get_cache()
+    key = VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), timeout=None)
+        version = cache.get(key) or _new_version()
+    return version
+
+
+def get_last_modified(user_id):
+    """Return when a user's data last changed, as a Unix timestamp"""
+    cache = get_cache()
+    key = MODIFIED_KEY.format(user_id=user_id)
+    modified = cache.get(key)
+    if modified is None:
+        cache.add(key, int(time.time()), timeout=None)
+        modified = cache.get(key) or int(time.time())
+    return modified
+
+
+def bump_version(user_id):
+    """Invalidate every cached response of a user in O(1)"""
+    # a fresh value rather than incr(), which file and database caches
+    # implement as a racy read-modify-write that could lose a bump
+    get_cache().set_many({
+        VERSION_KEY.format(user_id=user_id): _new_version(),
+        MODIFIED_KEY.format(user_id=user_id): int(time.time()),
+    }, timeout=None)
+
+
+def invalidate_user(user_id):
+    """Bump a user's version now and again once the transaction commits"""
+    bump_version(user_id)
+    # a read racing the write could otherwise cache pre-commit data under
+    # the version bumped above
+    transaction.on_commit(lambda: bump_version(user_id))
+
+
+def _request_digest(request):
+    # responses embed absolute links (cursors, images), so the scheme and
+    # host are part of the request
+    url = request.build_absolute_uri(request.path)
+    query = sorted(request.query_params.lists())
+    return hashlib.sha1(f'{url}?{query}'.encode()).hexdigest()
+
+
+def response_key(request):
+    """Return the cache key of a request for its user's current version"""
+    user_id = request.user.pk
+    return RESPONSE_KEY.format(
+        user_id=user_id,
+        version=get_version(user_id),
+        digest=_request_digest(request),
+    )
+
+
+def get_etag(request):
+    """Return a strong ETag for the response to a request"""
+    user_id = request.user.pk
+    renderer = getattr(request, 'accepted_renderer', None)
+    tag = hashlib.sha1(
+        f'{user_id}:{get_version(user_id)}:{_request_digest(request)}:'
+        f'{getattr(renderer, "format", "")}'.encode()
+    ).hexdigest()
+    return f'"{tag}"'
+
+
+def _count(key):
+    cache = get_cache()
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def get_stats():
+    """Return hit / miss counters of the response cache"""
+    values = get_cache().get_many([HITS_KEY, MISSES_KEY])
+    hits = values.get(HITS_KEY, 0)
+    misses = values.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else 0.0,
+    }
+
+
+def reset_stats():
+    """Reset hit / miss counters of the response cache"""
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
+
+
+class CachedListMixin:
+    """Serve list responses from the per-user versioned cache"""
+
+    def list(self, request, *args, **kwargs):
+        if not is_enabled():
+            return super().list(request, *args, **kwargs)
+        cache = get_cache()
+        key = response_key(request)
+        data = cache.get(key)
+        if data is not None:
+            _count(HITS_KEY)
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        _count(MISSES_KEY)
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+
+
+class ConditionalGetMixin:
+    """Answer list / retrieve with 304 when the user's data is unchanged"""
+
+    def _conditional(self, handler, request, *args, **kwargs):
+        etag = get_etag(request)
+        last_modified = get_last_modified(request.user.pk)
+        # a second that has not ended yet may still see more changes, so it
+        # can not be used to validate If-Modified-Since
+        if last_modified >= int(time.time()):
+            last_modified = None
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if not is_enabled():
+            return super().list(request, *args, **kwargs)
+        return self._conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not is_enabled():
+            return super().retrieve(request, *args, **kwargs)
+        conditional = (
+            'HTTP_IF_NONE_MATCH' in request.META
+            or 'HTTP_IF_MODIFIED_SINCE' in request.META
+        )
+        if conditional and not self._object_exists(**kwargs):
+            # let the view answer 404 rather than match "If-None-Match: *"
+            return super().retrieve(request, *args, **kwargs)
+        return self._conditional(super().retrieve, request, *args, **kwargs)
+
+    def _object_exists(self, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        return self.filter_queryset(self.get_queryset()).filter(
+            **{self.lookup_field: kwargs[lookup_url_kwarg]}
+        ).exists()
@@ -0,0 +1,178 @@
+"""
+Streaming export of a user's recipes, tags and ingredients
+"""
+import csv
+import json
+import time
+import zipfile
+from itertools import islice
+
+from django.conf import settings
+
+from core.models import Recipe, Tag, Ingredient
+
+RECIPE_FIELDS = (
+    'id', 'title', 'description', 'time_minutes', 'price', 'link', 'image'
+)
+CSV_HEADER = RECIPE_FIELDS + ('tags', 'ingredients')
+# separates the tag / ingredient names of a CSV cell
+CSV_LIST_SEPARATOR = '|'
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _related_names(model, field, recipe_ids):
+    """Return `{recipe id: [names]}` from one query on a link table"""
+    through = getattr(Recipe, field).through
+    names = {}
+    rows = (
+        through.objects.filter(recipe_id__in=recipe_ids)
+        .values_list('recipe_id', f'{model._meta.model_name}__name')
+        .order_by(f'{model._meta.model_name}__name')
+    )
+    for recipe_id, name in rows:
+        names.setdefault(recipe_id, []).append(name)
+    return names
+
+
+def iter_recipes(user, chunk_size=None):
+    """
+    Yield the recipes of a user as dicts with their tag and ingredient names.
+
+    Rows are read through a server side cursor and the names of each
+    chunk are loaded with one query per link table, so memory use does not
+    grow with the number of recipes.
+    """
+    chunk_size = chunk_size or settings.RECIPE_EXPORT_CHUNK_SIZE
+    rows = (
+        Recipe.objects.filter(user=user).order_by('id')
+        .values(*RECIPE_FIELDS).iterator(chunk_size=chunk_size)
+    )
+    for chunk in _chunks(rows, chunk_size):
+        ids = [row['id'] for row in chunk]
+        tags = _related_names(Tag, 'tags', ids)
+        ingredients = _related_names(Ingredient, 'ingredients', ids)
+        for row in chunk:
+            row['price'] = str(row['price'])
+            row['tags'] = tags.get(row['id'], [])
+            row['ingredients'] = ingredients.get(row['id'], [])
+            yield row
+
+
+def iter_names(model, user, chunk_size=None):
+    """Yield the names of a user's tags or ingredients"""
+    return (
+        model.objects.filter(user=user).order_by('name')
+        .values_list('name', flat=True)
+        .iterator(chunk_size=chunk_size or settings.RECIPE_EXPORT_CHUNK_SIZE)
+    )
+
+
+def ndjson_lines(user):
+    """
+    Yield the library of a user as NDJSON lines.
+
+    Tags and ingredients come first, so the ones no recipe uses are
+    exported as well; every line has a "type" key.
+    """
+    for name in iter_names(Tag, user):
+        yield json.dumps({'type': 'tag', 'name': name}) + '\n'
+    for name in iter_names(Ingredient, user):
+        yield json.dumps({'type': 'ingredient', 'name': name}) + '\n'
+    for row in iter_recipes(user):
+        yield json.dumps({'type': 'recipe', **row}) + '\n'
+
+
+class _Echo:
+    """Pseudo file returning what is written, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+class _Buffer:
+    """Unseekable file collecting the bytes written until taken"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def csv_lines(user):
+    """Yield the recipes of a user as CSV, names joined by '|'"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in iter_recipes(user):
+        yield writer.writerow([row[field] for field in RECIPE_FIELDS] + [
+            CSV_LIST_SEPARATOR.join(row['tags']),
+            CSV_LIST_SEPARATOR.join(row['ingredients']),
+        ])
+
+
+def _write_zip(archive, user):
+    """Write the members of an export zip, yielding after every write"""
+    info = zipfile.ZipInfo('recipes.ndjson', time.localtime()[:6])
+    # deflate the text; the images are stored as they are compressed
+    info.compress_type = zipfile.ZIP_DEFLATED
+    with archive.open(info, 'w', force_zip64=True) as member:
+        for line in ndjson_lines(user):
+            member.write(line.encode())
+            yield
+
+    storage = Recipe._meta.get_field('image').storage
+    images = (
+        Recipe.objects.filter(user=user).exclude(image='')
+        .order_by('image').values_list('image', flat=True).distinct()
+        .iterator(chunk_size=settings.RECIPE_EXPORT_CHUNK_SIZE)
+    )
+    for name in images:
+        try:
+            source = storage.open(name, 'rb')
+        except FileNotFoundError:
+            continue
+        with source, archive.open(name, 'w') as member:
+            for chunk in source.chunks():
+                member.write(chunk)
+                yield
+
+
+def zip_chunks(user):
+    """
+    Yield a zip of the NDJSON export and the user's image files.
+
+    The zip is written to an unseekable buffer, so zipfile puts the sizes
+    in data descriptors after each member and nothing is held back.
+    """
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for _ in _write_zip(archive, user):
+            data = buffer.take()
+            if data:
+                yield data
+    yield buffer.take()
+
+
+# format -> (content type, file name, chunk generator)
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'recipes.ndjson', ndjson_lines),
+    'csv': ('text/csv', 'recipes.csv', csv_lines),
+    'zip': ('application/zip', 'recipes.zip', zip_chunks),
+}
@@ -0,0 +1,98 @@
+"""
+Query filters for recipe APIs
+"""
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVectorField,
+    TrigramSimilarity
+)
+from django.db.models import (
+    BooleanField,
+    Exists,
+    ExpressionWrapper,
+    FloatField,
+    OuterRef,
+    Q
+)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Upper
+
+from core.models import Recipe
+
+MATCH_ANY = 'any'
+MATCH_ALL = 'all'
+MATCH_MODES = (MATCH_ANY, MATCH_ALL)
+
+SEARCH_CONFIG = 'english'
+SEARCH_RANK = 'rank'
+
+
+def filter_by_related(queryset, field_name, ids, match=MATCH_ANY):
+    """
+    Filter a queryset to rows linked to `ids` through a many-to-many field.
+
+    Each condition is a correlated EXISTS against the through table, so the
+    result needs no JOIN fan-out and no DISTINCT. With `match='all'` every
+    id must be linked, with `match='any'` at least one of them.
+    """
+    field = queryset.model._meta.get_field(field_name)
+    through = field.remote_field.through
+    source = field.m2m_field_name()
+    target = field.m2m_reverse_field_name()
+    links = through.objects.filter(**{source: OuterRef('pk')})
+
+    if match == MATCH_ALL:
+        for related_id in dict.fromkeys(ids):
+            queryset = queryset.filter(
+                Exists(links.filter(**{target: related_id}))
+            )
+        return queryset
+    return queryset.filter(Exists(links.filter(**{f'{target}__in': ids})))
+
+
+def filter_assigned(queryset, related_name='recipe'):
+    """Filter tags / ingredients linked to at least one recipe via EXISTS"""
+    rel = queryset.model._meta.get_field(related_name)
+    through = rel.through
+    source = rel.field.m2m_reverse_field_name()
+    return queryset.filter(
+        Exists(through.objects.filter(**{source: OuterRef('pk')}))
+    )
+
+
+def search_recipes(queryset, terms):
+    """
+    Filter recipes matching a web-style search and annotate their rank.
+
+    Matches against the generated, GIN indexed `search_vector` column; the
+    rank is cast to double precision so it round trips through the
+    pagination cursor exactly.
+    """
+    vector = RawSQL(
+        f'"{Recipe._meta.db_table}"."search_vector"', [],
+        output_field=SearchVectorField(),
+    )
+    query = SearchQuery(terms, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.alias(search_vector=vector).filter(
+        search_vector=query
+    ).annotate(**{
+        SEARCH_RANK: Cast(SearchRank(vector, query), FloatField())
+    })
+
+
+def autocomplete_names(queryset, term):
+    """
+    Filter to names starting with or similar to `term`, best matches first.
+
+    Both conditions compare UPPER(name) so they are served by the
+    `gin_trgm_ops` expression index; prefix matches sort ahead of fuzzy
+    ones, then by trigram similarity.
+    """
+    prefix = Q(upper_name__startswith=term.upper())
+    return queryset.alias(upper_name=Upper('name')).filter(
+        prefix | Q(upper_name__trigram_similar=term)
+    ).annotate(
+        is_prefix=ExpressionWrapper(prefix, output_field=BooleanField()),
+        similarity=TrigramSimilarity(Upper('name'), term),
+    ).order_by('-is_prefix', '-similarity', 'name')
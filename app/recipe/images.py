@@ -0,0 +1,471 @@
+"""
+Post-processing and downscaled variants of uploaded recipe images
+"""
+import fcntl
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# info keys holding metadata that is dropped when an upload is re-encoded
+METADATA_KEYS = ('exif', 'xmp', 'XML:com.adobe.xmp', 'comment')
+
+CONTENT_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+    'GIF': 'image/gif',
+}
+
+# URL suffix of the resize endpoint -> (Pillow format, content type)
+RESIZE_FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpg': ('JPEG', 'image/jpeg'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'png': ('PNG', 'image/png'),
+}
+
+
+def variant_name(name, size):
+    """Return the storage name of the `size` px variant of an image"""
+    stem, ext = os.path.splitext(name)
+    return f'{stem}_{size}{ext.lower()}'
+
+
+def sibling_name(name, image_format):
+    """Return the storage name of an image re-encoded to `image_format`"""
+    return f'{name}.{image_format.lower()}'
+
+
+def derived_names(name):
+    """Return the names of every file generated from a stored image"""
+    names = [variant_name(name, size) for size in settings.RECIPE_IMAGE_SIZES]
+    if settings.RECIPE_IMAGE_SIBLING_FORMAT:
+        names.append(
+            sibling_name(name, settings.RECIPE_IMAGE_SIBLING_FORMAT)
+        )
+    return names
+
+
+def variant_names(image):
+    """
+    Return `{size: name}` of the variants of a stored image.
+
+    process_image() skips the sizes the image fits already, the name of
+    the original stands in for them.
+    """
+    try:
+        edge = max(image.width, image.height)
+    except (OSError, TypeError):
+        # an unreadable original has no variants to alias either
+        edge = None
+    return {
+        size: (
+            image.name if edge is not None and size >= edge
+            else variant_name(image.name, size)
+        )
+        for size in settings.RECIPE_IMAGE_SIZES
+    }
+
+
+def content_marker(path):
+    """Return a token that changes whenever the file at `path` does"""
+    # process_image replaces originals in place under the same name
+    stat = os.stat(path)
+    return f'{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}'
+
+
+def _save_atomic(image, path, image_format, **params):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    image.save(tmp_path, image_format, **params)
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def _encode_params(image_format, options, icc_profile):
+    params = dict(options['encoding'].get(image_format, {}))
+    if icc_profile:
+        # colour profiles change how the pixels look, keep them
+        params['icc_profile'] = icc_profile
+    return params
+
+
+def process_image(path, options):
+    """
+    Optimise the image at `path` in place and write its derived files.
+
+    The original is rotated upright, its longest edge capped at
+    `options['max_edge']` and re-encoded without metadata; it is only
+    replaced when that strips metadata, shrinks it or was needed to cap
+    it. A sibling in `options['sibling_format']` is kept when smaller, and
+    a downscaled variant is written for each of `options['sizes']`.
+    Runs in a worker process, so it only touches the filesystem. Returns
+    the sizes in bytes of what was stored.
+    """
+    original_bytes = os.path.getsize(path)
+    max_edge = options['max_edge']
+    with Image.open(path) as original:
+        image_format = original.format
+        if image_format not in Image.SAVE:
+            image_format = 'PNG'
+        # let the JPEG decoder scale down while decoding
+        original.draft(original.mode, (max_edge, max_edge))
+        has_metadata = (
+            any(key in original.info for key in METADATA_KEYS)
+            or bool(original.getexif())
+        )
+        icc_profile = original.info.get('icc_profile')
+        # re-encoding keeps only the first frame of an animation
+        animated = getattr(original, 'is_animated', False)
+        image = ImageOps.exif_transpose(original)
+    # some encoders fall back to the metadata read from the source
+    image.info = {
+        key: value for key, value in image.info.items()
+        if key == 'transparency'
+    }
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    resized = max(image.size) > max_edge
+    if resized:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    params = _encode_params(image_format, options, icc_profile)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    image.save(tmp_path, image_format, **params)
+    stored_bytes = os.path.getsize(tmp_path)
+    if not animated and (
+            resized or has_metadata or stored_bytes < original_bytes):
+        os.replace(tmp_path, path)
+    else:
+        os.remove(tmp_path)
+        stored_bytes = original_bytes
+
+    sibling_bytes = None
+    sibling_format = options['sibling_format']
+    if (sibling_format and sibling_format != image_format
+            and sibling_format in Image.SAVE and not animated):
+        sibling_path = sibling_name(path, sibling_format)
+        sibling_bytes = _save_atomic(
+            image, sibling_path, sibling_format,
+            **_encode_params(sibling_format, options, icc_profile)
+        )
+        if sibling_bytes >= stored_bytes:
+            # not cheaper to serve, keep only the original
+            os.remove(sibling_path)
+            sibling_bytes = None
+
+    variants = []
+    edge = max(image.size)
+    # shrink the largest first and derive smaller sizes from it; sizes
+    # the image fits already are served by the original instead
+    for size in sorted(options['sizes'], reverse=True):
+        if size >= edge:
+            continue
+        image.thumbnail((size, size), Image.LANCZOS)
+        variant_path = variant_name(path, size)
+        _save_atomic(image, variant_path, image_format, **params)
+        variants.append(variant_path)
+
+    return {
+        'path': path,
+        'original_bytes': original_bytes,
+        'stored_bytes': stored_bytes,
+        'sibling_bytes': sibling_bytes,
+        'variants': variants,
+    }
+
+
+def report_processing(result):
+    """Log the bytes saved by processing an image"""
+    saved = result['original_bytes'] - result['stored_bytes']
+    sibling = result['sibling_bytes']
+    logger.info(
+        'Optimised %s: %d -> %d bytes, saved %d (%.0f%%)%s',
+        result['path'],
+        result['original_bytes'],
+        result['stored_bytes'],
+        saved,
+        100 * saved / result['original_bytes'],
+        f', {sibling} byte sibling' if sibling is not None else '',
+    )
+    return result
+
+
+def _report_future(future):
+    if future.exception() is not None:
+        logger.error(
+            'Processing an image failed', exc_info=future.exception()
+        )
+    else:
+        report_processing(future.result())
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process pool processing uploads"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                # a forked child would inherit the server's threads and
+                # database connections
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def schedule_processing(recipe):
+    """Process an uploaded recipe image off the request path"""
+    if not recipe.image:
+        return None
+    storage = recipe.image.storage
+    if all(
+        storage.exists(name)
+        for name in variant_names(recipe.image).values()
+    ):
+        # a content addressed image uploaded before was processed already
+        return None
+    options = {
+        'sizes': settings.RECIPE_IMAGE_SIZES,
+        'max_edge': settings.RECIPE_IMAGE_MAX_EDGE,
+        'encoding': settings.RECIPE_IMAGE_ENCODING,
+        'sibling_format': settings.RECIPE_IMAGE_SIBLING_FORMAT,
+    }
+    if settings.RECIPE_IMAGE_WORKERS == 0:
+        return report_processing(process_image(recipe.image.path, options))
+    future = get_executor().submit(process_image, recipe.image.path, options)
+    future.add_done_callback(_report_future)
+    return future
+
+
+def variant_urls(image, request=None):
+    """Return `{size: url}` of the variants of an image generated so far"""
+    if not image:
+        return {}
+    urls = {}
+    for size, name in variant_names(image).items():
+        if image.storage.exists(name):
+            url = image.storage.url(name)
+            urls[str(size)] = (
+                request.build_absolute_uri(url) if request else url
+            )
+    return urls
+
+
+def resize_formats():
+    """Return the entries of RESIZE_FORMATS this Pillow build can write"""
+    Image.init()
+    return {
+        ext: value for ext, value in RESIZE_FORMATS.items()
+        if value[0] in Image.SAVE
+    }
+
+
+def resize_image(source, target, width, height, image_format):
+    """
+    Write the image at `source` scaled to fit `width` x `height`.
+
+    JPEGs are scaled down by the decoder through draft(), other formats
+    are shrunk by an integer factor with reduce() before the final
+    resample, so large originals are never resampled at full size.
+    Palette and bilevel images are expanded first, reduce() does not
+    support them.
+    """
+    with Image.open(source) as image:
+        image.draft('RGB', (width, height))
+        image = ImageOps.exif_transpose(image)
+        if image.mode == '1':
+            image = image.convert('L')
+        elif image.mode == 'P':
+            image = image.convert(
+                'RGBA' if 'transparency' in image.info else 'RGB'
+            )
+        factor = min(image.width // width, image.height // height)
+        if factor >= 2:
+            image = image.reduce(factor)
+        image.thumbnail((width, height), Image.LANCZOS)
+        if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        _save_atomic(image, target, image_format)
+
+
+class ResizeCache:
+    """
+    Size bounded on-disk cache of resized images with LRU eviction.
+
+    Entries are touched on every hit so their mtime tracks last use; once
+    the bytes written exceed `max_bytes` the least recently used entries
+    are removed down to `LOW_WATER` of it. An flock per entry makes
+    concurrent requests for the same size wait for a single resize; lock
+    files outlive their entries and are only pruned while nobody holds
+    them.
+    """
+    LOW_WATER = 0.9
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._bytes = None
+        self._lock = threading.Lock()
+
+    def path(self, key, ext):
+        """Return the cache path of a key"""
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], f'{digest}.{ext}')
+
+    def get_or_create(self, key, ext, create):
+        """Return the path of a cached entry, calling `create(path)` once"""
+        path = self.path(key, ext)
+        try:
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            pass
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._locked(f'{path}.lock') as lock_file:
+            try:
+                # another request may have written it while we waited
+                if not os.path.exists(path):
+                    create(path)
+                    self._added(os.path.getsize(path))
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return path
+
+    @staticmethod
+    def _locked(lock_path):
+        """
+        Open and flock `lock_path`, return the locked file.
+
+        The lock is retried when the file was pruned while we waited, as
+        the flock of an unlinked file excludes nobody opening the path.
+        """
+        while True:
+            lock_file = open(lock_path, 'a')
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if os.stat(lock_path).st_ino == os.fstat(
+                        lock_file.fileno()).st_ino:
+                    return lock_file
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+
+    def _entries(self):
+        for shard in os.scandir(self.directory):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if not entry.name.endswith(('.lock', '.tmp')):
+                        yield entry
+
+    def _added(self, size):
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum(
+                    entry.stat().st_size for entry in self._entries()
+                )
+            else:
+                self._bytes += size
+            if self._bytes > self.max_bytes:
+                self._bytes = self.evict()
+
+    def evict(self):
+        """Remove least recently used entries, return the bytes kept"""
+        entries = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        low_water = self.max_bytes * self.LOW_WATER
+        for _, size, path in entries:
+            if total <= low_water:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.prune_locks()
+        return total
+
+    def prune_locks(self):
+        """
+        Remove the lock files of entries that no longer exist.
+
+        A lock file is only unlinked under a non-blocking flock of it, so
+        one held by a request rendering its entry is left in place.
+        """
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.name.endswith('.lock'):
+                    continue
+                try:
+                    lock_file = open(entry.path)
+                except FileNotFoundError:
+                    continue
+                with lock_file:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue
+                    try:
+                        if (not os.path.exists(entry.path[:-len('.lock')])
+                                and os.stat(entry.path).st_ino
+                                == os.fstat(lock_file.fileno()).st_ino):
+                            os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+
+
+_resize_cache = None
+
+
+def get_resize_cache():
+    """Return the resize cache configured in the settings"""
+    global _resize_cache
+    with _executor_lock:
+        if (_resize_cache is None
+                or _resize_cache.directory != settings.RECIPE_IMAGE_CACHE_DIR
+                or _resize_cache.max_bytes
+                != settings.RECIPE_IMAGE_CACHE_MAX_BYTES):
+            _resize_cache = ResizeCache(
+                settings.RECIPE_IMAGE_CACHE_DIR,
+                settings.RECIPE_IMAGE_CACHE_MAX_BYTES,
+            )
+        return _resize_cache
+
+
+def get_resized(image, width, height, ext, marker=None):
+    """
+    Return the cache path of `image` resized to fit `width` x `height`.
+
+    Entries are keyed by the content_marker() of the original, which is
+    read unless given, so a replaced original is resized again.
+    """
+    image_format, _ = RESIZE_FORMATS[ext]
+    if marker is None:
+        marker = content_marker(image.path)
+    return get_resize_cache().get_or_create(
+        f'{image.name}:{marker}:{width}x{height}', ext,
+        lambda path: resize_image(
+            image.path, path, width, height, image_format
+        ),
+    )
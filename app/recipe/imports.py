@@ -0,0 +1,211 @@
+"""
+Bulk loading of recipes, tags and ingredients
+"""
+import csv
+import io
+import json
+
+from django.db import connection, transaction
+from rest_framework import serializers
+
+from core.models import Recipe, Tag, Ingredient
+from recipe.cache import invalidate_user
+from recipe.serializers import RecipeImportSerializer
+
+RECIPE_COLUMNS = (
+    'id', 'title', 'description', 'time_minutes', 'price', 'link', 'image',
+    'user_id',
+)
+LOAD_METHODS = ('copy', 'bulk')
+
+
+class RecipeImporter:
+    """
+    Load validated NDJSON rows of a user's library in batches.
+
+    Rows use the format of recipe.export.ndjson_lines: a "type" of "tag",
+    "ingredient" or "recipe" (the default), recipes naming their tags and
+    ingredients. Each batch is loaded in one transaction with a fixed
+    number of statements: tags and ingredients are inserted once per
+    distinct name, and the recipes and both link tables are written with
+    COPY, or with bulk_create batches when `method` is "bulk".
+    """
+
+    def __init__(self, user, method='copy'):
+        if method not in LOAD_METHODS:
+            raise ValueError(f'Unknown load method {method!r}')
+        self.user = user
+        self.method = method
+        self.serializer = RecipeImportSerializer()
+        self.name_field = serializers.CharField(max_length=255)
+        self.valid_names = set()
+        # name -> id of the tags and ingredients seen so far
+        self.ids = {Tag: {}, Ingredient: {}}
+        self.recipes = 0
+        self.created = {Tag: 0, Ingredient: 0}
+
+    def validate(self, line):
+        """Return `(type, data)` of an NDJSON line or raise ValidationError"""
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            raise serializers.ValidationError(f'Invalid JSON: {exc}')
+        if not isinstance(row, dict):
+            raise serializers.ValidationError('Expected a JSON object.')
+        kind = row.get('type', 'recipe')
+        if kind in ('tag', 'ingredient'):
+            return kind, self._validate_name(row.get('name'))
+        if kind != 'recipe':
+            raise serializers.ValidationError(f'Unknown type "{kind}".')
+        data = self.serializer.run_validation(row)
+        for field in ('tags', 'ingredients'):
+            try:
+                data[field] = [
+                    self._validate_name(name) for name in data.get(field, [])
+                ]
+            except serializers.ValidationError as exc:
+                raise serializers.ValidationError({field: exc.detail})
+        return kind, data
+
+    def _validate_name(self, name):
+        # lists and objects are unhashable, leave them to the field
+        if isinstance(name, str) and name in self.valid_names:
+            return name
+        name = self.name_field.run_validation(name)
+        self.valid_names.add(name)
+        return name
+
+    def load(self, rows):
+        """Load a batch of validated `(type, data)` rows in one transaction"""
+        names = {Tag: set(), Ingredient: set()}
+        recipes = []
+        for kind, data in rows:
+            if kind == 'tag':
+                names[Tag].add(data)
+            elif kind == 'ingredient':
+                names[Ingredient].add(data)
+            else:
+                data['tags'] = list(dict.fromkeys(data.get('tags', [])))
+                data['ingredients'] = list(
+                    dict.fromkeys(data.get('ingredients', []))
+                )
+                names[Tag].update(data['tags'])
+                names[Ingredient].update(data['ingredients'])
+                recipes.append(data)
+
+        with transaction.atomic():
+            for model, model_names in names.items():
+                self._resolve(model, model_names)
+            if recipes:
+                if self.method == 'copy':
+                    self._copy(recipes)
+                else:
+                    self._bulk_create(recipes)
+            # bulk writes send no signals, invalidate the cache ourselves;
+            # this reaches the API workers through the shared API cache,
+            # without one they cache nothing, see recipe.cache.is_enabled
+            invalidate_user(self.user.id)
+        self.recipes += len(recipes)
+
+    def _resolve(self, model, names):
+        """Look up or create the ids of names not seen before"""
+        ids = self.ids[model]
+        missing = [name for name in names if name not in ids]
+        if not missing:
+            return
+        existing = model.objects.filter(user=self.user, name__in=missing)
+        ids.update(existing.values_list('name', 'id'))
+        new = [name for name in missing if name not in ids]
+        if new:
+            model.objects.bulk_create(
+                [model(user=self.user, name=name) for name in new],
+                ignore_conflicts=True,
+            )
+            ids.update(
+                model.objects.filter(user=self.user, name__in=new)
+                .values_list('name', 'id')
+            )
+            self.created[model] += len(new)
+
+    def _links(self, recipe_ids, recipes, field):
+        model = Tag if field == 'tags' else Ingredient
+        ids = self.ids[model]
+        return [
+            (recipe_id, ids[name])
+            for recipe_id, data in zip(recipe_ids, recipes)
+            for name in data[field]
+        ]
+
+    def _copy(self, recipes):
+        """Write the recipes and their links with COPY"""
+        with connection.cursor() as cursor:
+            # take the ids up front to link the recipes without reading
+            # them back
+            cursor.execute(
+                'SELECT nextval(pg_get_serial_sequence(%s, %s)) '
+                'FROM generate_series(1, %s)',
+                [Recipe._meta.db_table, 'id', len(recipes)],
+            )
+            recipe_ids = [row[0] for row in cursor.fetchall()]
+            self._copy_rows(
+                cursor, Recipe._meta.db_table, RECIPE_COLUMNS,
+                (
+                    (
+                        recipe_id, data['title'], data.get('description', ''),
+                        data['time_minutes'], data['price'],
+                        data.get('link', ''), '', self.user.id,
+                    )
+                    for recipe_id, data in zip(recipe_ids, recipes)
+                ),
+            )
+            for field in ('tags', 'ingredients'):
+                through = getattr(Recipe, field).through
+                self._copy_rows(
+                    cursor, through._meta.db_table,
+                    (
+                        through._meta.get_field('recipe').column,
+                        through._meta.get_field(
+                            Recipe._meta.get_field(field)
+                            .m2m_reverse_field_name()
+                        ).column,
+                    ),
+                    self._links(recipe_ids, recipes, field),
+                )
+
+    def _copy_rows(self, cursor, table, columns, rows):
+        buffer = io.StringIO()
+        # quoting every value keeps empty strings from loading as NULL
+        csv.writer(buffer, quoting=csv.QUOTE_ALL).writerows(rows)
+        buffer.seek(0)
+        quote = connection.ops.quote_name
+        cursor.copy_expert(
+            f'COPY {quote(table)} ({", ".join(map(quote, columns))}) '
+            'FROM STDIN WITH (FORMAT csv)',
+            buffer,
+        )
+
+    def _bulk_create(self, recipes):
+        """Write the recipes and their links with bulk_create"""
+        objs = Recipe.objects.bulk_create(
+            Recipe(
+                user=self.user,
+                title=data['title'],
+                description=data.get('description', ''),
+                time_minutes=data['time_minutes'],
+                price=data['price'],
+                link=data.get('link', ''),
+            )
+            for data in recipes
+        )
+        recipe_ids = [obj.id for obj in objs]
+        for field in ('tags', 'ingredients'):
+            through = getattr(Recipe, field).through
+            target = (
+                f'{Recipe._meta.get_field(field).m2m_reverse_field_name()}_id'
+            )
+            through.objects.bulk_create(
+                through(recipe_id=recipe_id, **{target: target_id})
+                for recipe_id, target_id in self._links(
+                    recipe_ids, recipes, field
+                )
+            )
@@ -0,0 +1,27 @@
+"""
+Pagination for recipe APIs
+"""
+from rest_framework.pagination import CursorPagination
+
+from recipe.filters import SEARCH_RANK
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Keyset pagination for recipes, newest first"""
+    ordering = '-id'
+    page_size = 25
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    search_ordering = (f'-{SEARCH_RANK}', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        """Page search results by rank, everything else by id"""
+        if SEARCH_RANK in queryset.query.annotations:
+            return self.search_ordering
+        return super().get_ordering(request, queryset, view)
+
+
+class RecipeAttrCursorPagination(RecipeCursorPagination):
+    """Keyset pagination for tags and ingredients ordered by name"""
+    # names are unique per user, so the (user, name) index serves each page
+    ordering = '-name'
@@ -1,19 +1,43 @@
 """
 Serializers for Recipe
 """
+import warnings
 
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+from django.utils.translation import gettext_lazy as _
+from PIL import Image
 from rest_framework import serializers
 from core.models import Recipe, Tag, Ingredient
+from recipe.images import variant_urls
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class UniqueNameMixin:
+    """Reject renaming a tag / ingredient onto one the user already has"""
+
+    def validate_name(self, value):
+        """Check the name is free when updating a standalone object"""
+        if self.instance is not None and self.parent is None:
+            clash = type(self.instance).objects.filter(
+                user=self.instance.user_id,
+                name=value,
+            ).exclude(pk=self.instance.pk)
+            if clash.exists():
+                raise serializers.ValidationError(
+                    'An item with this name already exists.'
+                )
+        return value
+
+
+class IngredientSerializer(UniqueNameMixin, serializers.ModelSerializer):
     class Meta:
         model = Ingredient
         fields = ('id', 'name')
         read_only_fields = ['id']
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(UniqueNameMixin, serializers.ModelSerializer):
     """Serializer for Tag """
 
     class Meta:
@@ -22,6 +46,22 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
+class IngredientCountSerializer(IngredientSerializer):
+    """Serializer for Ingredient with the number of recipes using it"""
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(IngredientSerializer.Meta):
+        fields = IngredientSerializer.Meta.fields + ('recipe_count',)
+
+
+class TagCountSerializer(TagSerializer):
+    """Serializer for Tag with the number of recipes using it"""
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ['recipe_count']
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Serializer for Recipe"""
     tags = TagSerializer(
@@ -47,27 +87,63 @@ class RecipeSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', ]
 
-    def _get_or_create_tags(self, tags, recipe, auth_user):
-        """Handle getting or creating tags """
-
-        for tag in tags:
-            tag_obj, created = Tag.objects.get_or_create(
-                user=auth_user,
-                **tag,
+    def _bulk_get_or_create(self, model, items, auth_user):
+        """Return one object per distinct name, creating missing ones"""
+        names = list(dict.fromkeys(item['name'] for item in items))
+        if not names:
+            return []
+        by_name = {
+            obj.name: obj
+            for obj in model.objects.filter(user=auth_user, name__in=names)
+        }
+        missing = [name for name in names if name not in by_name]
+        if missing:
+            # rows created concurrently are skipped by the unique constraint
+            # and picked up by the second lookup
+            model.objects.bulk_create(
+                [model(user=auth_user, name=name) for name in missing],
+                ignore_conflicts=True,
             )
-            recipe.tags.add(tag_obj)
-
-    def _get_or_create_ingredients(self, ingredients, recipe, auth_user):
-        """Handle getting or creating ingredients """
-        for ingredient in ingredients:
-            ingredient_obj, created = (
-                Ingredient.objects.get_or_create(
-                    user=auth_user,
-                    **ingredient
+            by_name.update(
+                (obj.name, obj) for obj in model.objects.filter(
+                    user=auth_user, name__in=missing
                 )
             )
-            recipe.ingredients.add(ingredient_obj)
+        return [by_name[name] for name in names]
 
+    def _add_related(self, recipe, field_name, objs):
+        """Link objects to the recipe with a single through-table insert"""
+        field = Recipe._meta.get_field(field_name)
+        through = field.remote_field.through
+        target = f'{field.m2m_reverse_field_name()}_id'
+        through.objects.bulk_create(
+            [through(recipe_id=recipe.id, **{target: obj.id}) for obj in objs],
+            ignore_conflicts=True,
+        )
+
+    def _set_related(self, recipe, field_name, objs):
+        """Replace the recipe's links, writing only the ones that changed"""
+        field = Recipe._meta.get_field(field_name)
+        through = field.remote_field.through
+        target = f'{field.m2m_reverse_field_name()}_id'
+        links = through.objects.filter(recipe_id=recipe.id)
+        current = set(links.values_list(target, flat=True))
+        removed = current - {obj.id for obj in objs}
+        if removed:
+            links.filter(**{f'{target}__in': removed}).delete()
+        self._add_related(
+            recipe, field_name, [obj for obj in objs if obj.id not in current]
+        )
+
+    def _get_or_create_tags(self, tags, auth_user):
+        """Handle getting or creating tags """
+        return self._bulk_get_or_create(Tag, tags, auth_user)
+
+    def _get_or_create_ingredients(self, ingredients, auth_user):
+        """Handle getting or creating ingredients """
+        return self._bulk_get_or_create(Ingredient, ingredients, auth_user)
+
+    @transaction.atomic
     def create(self, validated_data):
         """Create a new recipe instance"""
         tags = validated_data.pop('tags', [])
@@ -76,14 +152,17 @@ class RecipeSerializer(serializers.ModelSerializer):
         auth_user = self.context['request'].user
         # add user to Recipe
         recipe = Recipe.objects.create(**validated_data, user=auth_user)
-        self._get_or_create_tags(tags, recipe, auth_user=auth_user)
-        self._get_or_create_ingredients(
-            ingredients, recipe,
-            auth_user=auth_user
+        self._add_related(
+            recipe, 'tags', self._get_or_create_tags(tags, auth_user)
+        )
+        self._add_related(
+            recipe, 'ingredients',
+            self._get_or_create_ingredients(ingredients, auth_user)
         )
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         """Update a recipe with Tags"""
         auth_user = self.context['request'].user
@@ -91,35 +170,111 @@ class RecipeSerializer(serializers.ModelSerializer):
         ingredients = validated_data.pop('ingredients', None)
 
         if ingredients is not None:
-            instance.ingredients.clear()
-            self._get_or_create_ingredients(ingredients, instance, auth_user)
+            self._set_related(
+                instance, 'ingredients',
+                self._get_or_create_ingredients(ingredients, auth_user)
+            )
 
         if tags is not None:
-            instance.tags.clear()
-            self._get_or_create_tags(tags, instance, auth_user)
+            self._set_related(
+                instance, 'tags', self._get_or_create_tags(tags, auth_user)
+            )
         for att, value in validated_data.items():
             setattr(instance, att, value)
         instance.save()
         return instance
 
 
-class RecipeDetailSerializer(RecipeSerializer):
+class ThumbnailsMixin(serializers.Serializer):
+    """Expose the URLs of the downscaled variants of the recipe image"""
+    thumbnails = serializers.SerializerMethodField()
+
+    def get_thumbnails(self, obj):
+        """Return `{size: url}` of the variants generated so far"""
+        return variant_urls(obj.image, self.context.get('request'))
+
+
+class ImageURLMixin:
+    """
+    Represent a recipe image by its content negotiated URL.
+
+    The view behind the `recipe-image` route picks the best format the
+    client accepts, whereas the storage URL always serves the original.
+    """
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        url = reverse('recipe-image', args=[value.instance.pk])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
+class RecipeImageField(ImageURLMixin, serializers.ImageField):
+    """Image field represented by the negotiated image URL"""
+
+
+class RecipeDetailSerializer(ThumbnailsMixin, RecipeSerializer):
     """Serializer for recipe detail view"""
+    image = RecipeImageField(required=False, allow_null=True)
 
     class Meta(RecipeSerializer.Meta):
-        fields = RecipeSerializer.Meta.fields + ['description', 'image']
+        fields = RecipeSerializer.Meta.fields + [
+            'description', 'image', 'thumbnails'
+        ]
+
 
+class HeaderCheckedImageField(ImageURLMixin, serializers.FileField):
+    """
+    Image field validated from the file header alone.
 
-class RecipeImageSerializer(serializers.ModelSerializer):
+    Unlike DRF's ImageField no pixel data is decoded: Image.open only reads
+    the header, which is enough to check the format and dimensions and to
+    reject decompression bombs before anything allocates their pixels.
+    """
+    default_error_messages = {
+        'invalid_image': _(
+            'Upload a valid image. The file you uploaded was either not an '
+            'image or a corrupted image.'
+        ),
+        'format': _('Unsupported image format "{format}".'),
+        'too_many_pixels': _(
+            'Image of {width}x{height} pixels exceeds the limit of '
+            '{max_pixels} pixels.'
+        ),
+    }
+
+    def to_internal_value(self, data):
+        file_object = super().to_internal_value(data)
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('error', Image.DecompressionBombWarning)
+                with Image.open(file_object) as image:
+                    image_format, (width, height) = image.format, image.size
+        except (OSError, SyntaxError, ValueError,
+                Image.DecompressionBombError, Image.DecompressionBombWarning):
+            self.fail('invalid_image')
+
+        if image_format not in settings.RECIPE_IMAGE_FORMATS:
+            self.fail('format', format=image_format)
+        max_pixels = settings.RECIPE_IMAGE_MAX_PIXELS
+        if width * height > max_pixels:
+            self.fail(
+                'too_many_pixels',
+                width=width, height=height, max_pixels=max_pixels,
+            )
+        file_object.seek(0)
+        return file_object
+
+
+class RecipeImageSerializer(ThumbnailsMixin, serializers.ModelSerializer):
     """Serializer for Uploading images to recipes """
+    image = HeaderCheckedImageField()
 
     class Meta:
         model = Recipe
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'thumbnails']
         read_only_fields = ['id']
-        extra_kwargs = {
-            'image': {'required': True}
-        }
 
     # @action(methods=['post'], detail=True, url_path='upload-image')
     # def create(self, validated_data):
@@ -128,3 +283,29 @@ class RecipeImageSerializer(serializers.ModelSerializer):
     #     recipe.image = image
     #     recipe.save()
     #     return recipe
+
+
+class RecipeImportSerializer(serializers.ModelSerializer):
+    """
+    Validate a recipe of a bulk import, tags and ingredients by name.
+
+    Only the lists are checked here; the names repeat across rows, so
+    recipe.imports.RecipeImporter validates each distinct one once.
+    """
+    tags = serializers.ListField(required=False)
+    ingredients = serializers.ListField(required=False)
+
+    class Meta:
+        model = Recipe
+        fields = [
+            'title',
+            'description',
+            'time_minutes',
+            'price',
+            'link',
+            'tags',
+            'ingredients'
+        ]
+        extra_kwargs = {
+            'description': {'required': False, 'allow_blank': True},
+        }
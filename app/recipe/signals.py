@@ -0,0 +1,97 @@
+"""
+Signal handlers for recipe APIs
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_init,
+    post_migrate,
+    post_save
+)
+from django.dispatch import receiver
+
+from core.models import Recipe, Tag, Ingredient
+from core.storage import lock_name
+from recipe.cache import clear_responses, invalidate_user
+from recipe.images import derived_names
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_on_change(sender, instance, **kwargs):
+    """Invalidate cached responses of the owner of a changed object"""
+    invalidate_user(instance.user_id)
+
+
+@receiver(post_migrate)
+def clear_cached_responses(sender, **kwargs):
+    """
+    Drop cached responses once the schema may have changed.
+
+    A new (or test) database also restarts the id sequences, so versions
+    of users from the previous one must not survive it.
+    """
+    if sender.name == 'recipe':
+        clear_responses()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_on_links_changed(sender, instance, action, **kwargs):
+    """Invalidate cached responses when recipe links change"""
+    if action.startswith('post_'):
+        invalidate_user(instance.user_id)
+
+
+def release_image(name):
+    """
+    Delete a stored image and its variants once no recipe references it.
+
+    Runs under the same lock as RecipeImageStorage.save, so an upload
+    reusing the file either commits its reference first or writes the file
+    again.
+    """
+    storage = Recipe._meta.get_field('image').storage
+    with transaction.atomic():
+        lock_name(name)
+        if Recipe.objects.filter(image=name).exists():
+            return False
+        for derived in derived_names(name):
+            storage.delete(derived)
+        storage.delete(name)
+    return True
+
+
+def _image_name(instance):
+    # read the raw attribute so a deferred image is not loaded
+    value = instance.__dict__.get('image')
+    return getattr(value, 'name', value) or None
+
+
+@receiver(post_init, sender=Recipe)
+def remember_image(sender, instance, **kwargs):
+    """Remember the stored image name to notice when it is replaced"""
+    instance._stored_image = _image_name(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def release_replaced_image(sender, instance, **kwargs):
+    """Free a content addressed image once its last recipe drops it"""
+    old, new = instance._stored_image, _image_name(instance)
+    instance._stored_image = new
+    if settings.RECIPE_IMAGE_CONTENT_ADDRESSED and old and old != new:
+        transaction.on_commit(lambda: release_image(old))
+
+
+@receiver(post_delete, sender=Recipe)
+def release_deleted_image(sender, instance, **kwargs):
+    """Free the content addressed image of a deleted recipe if unused"""
+    name = _image_name(instance)
+    if settings.RECIPE_IMAGE_CONTENT_ADDRESSED and name:
+        transaction.on_commit(lambda: release_image(name))
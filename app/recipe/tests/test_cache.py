@@ -0,0 +1,327 @@
+"""
+Test the API response cache
+"""
+import tempfile
+import time
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import http_date
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+from recipe import cache
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def detail_url(recipe_id):
+    """Return recipe detail URL"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'sample recipe',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+        'description': 'sample description',
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class ResponseCacheTests(TestCase):
+    """Test list responses are cached per user and version"""
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_default_cache_shared(self):
+        """Test the default API cache is used and passes the check"""
+        self.assertTrue(cache.is_enabled())
+        self.assertEqual(cache.check_api_cache(None), [])
+
+    def test_repeated_list_served_from_cache(self):
+        """Test an identical list request skips the database"""
+        create_recipe(user=self.user)
+        res = self.client.get(RECIPE_URL)
+        self.assertEqual(res['X-Cache'], 'MISS')
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(RECIPE_URL)
+
+        self.assertEqual(cached.status_code, status.HTTP_200_OK)
+        self.assertEqual(cached['X-Cache'], 'HIT')
+        self.assertEqual(cached.data, res.data)
+        self.assertEqual(cache.get_stats()['hits'], 1)
+        self.assertEqual(cache.get_stats()['misses'], 1)
+
+    def test_query_params_part_of_key(self):
+        """Test different query params are cached separately"""
+        self.client.get(RECIPE_URL)
+        res = self.client.get(RECIPE_URL, {'page_size': 1})
+        self.assertEqual(res['X-Cache'], 'MISS')
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'api.example.com'])
+    def test_host_part_of_key(self):
+        """Test absolute links are never served to another host"""
+        for i in range(2):
+            create_recipe(user=self.user, title=f'Recipe {i}')
+        self.client.get(RECIPE_URL, {'page_size': 1})
+
+        res = self.client.get(
+            RECIPE_URL, {'page_size': 1}, HTTP_HOST='api.example.com'
+        )
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertTrue(
+            res.data['next'].startswith('http://api.example.com/')
+        )
+
+    def test_write_invalidates_cache(self):
+        """Test creating a recipe through the API invalidates lists"""
+        self.client.get(RECIPE_URL)
+        payload = {
+            'title': 'Soup',
+            'time_minutes': 5,
+            'price': Decimal('1.00'),
+            'description': 'Hot',
+        }
+        self.client.post(RECIPE_URL, payload)
+
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_tag_rename_invalidates_recipe_list(self):
+        """Test renaming a tag refreshes recipe lists embedding it"""
+        tag = Tag.objects.create(user=self.user, name='Lunch')
+        create_recipe(user=self.user).tags.add(tag)
+        self.client.get(RECIPE_URL)
+
+        tag.name = 'Dinner'
+        tag.save()
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.data['results'][0]['tags'][0]['name'], 'Dinner')
+
+    def test_link_change_invalidates_cache(self):
+        """Test adding a tag to a recipe invalidates lists"""
+        recipe = create_recipe(user=self.user)
+        self.client.get(RECIPE_URL)
+
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Lunch'))
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(len(res.data['results'][0]['tags']), 1)
+
+    def test_cache_is_per_user(self):
+        """Test one user's cached list is never served to another"""
+        create_recipe(user=self.user)
+        self.client.get(RECIPE_URL)
+        other = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(other)
+
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(res.data['results'], [])
+
+    def test_tags_list_cached(self):
+        """Test the tag list is cached too"""
+        Tag.objects.create(user=self.user, name='Lunch')
+        self.client.get(TAGS_URL)
+        res = self.client.get(TAGS_URL)
+        self.assertEqual(res['X-Cache'], 'HIT')
+        self.assertEqual(len(res.data['results']), 1)
+
+
+class FileBackendCacheTests(TestCase):
+    """Test the response cache works on the file based backend"""
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(CACHES={
+            **settings.CACHES,
+            'api': {
+                'BACKEND':
+                    'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': self.cache_dir.name,
+            },
+        })
+        self.settings_override.enable()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.cache_dir.cleanup()
+
+    def test_list_cached_on_disk(self):
+        """Test repeated lists hit the file cache until a write"""
+        create_recipe(user=self.user)
+        self.client.get(RECIPE_URL)
+        self.assertEqual(self.client.get(RECIPE_URL)['X-Cache'], 'HIT')
+
+        create_recipe(user=self.user)
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res['X-Cache'], 'MISS')
+        self.assertEqual(len(res.data['results']), 2)
+
+
+class ConditionalGetTests(TestCase):
+    """Test ETag / Last-Modified handling of the recipe endpoints"""
+
+    def setUp(self):
+        cache.get_cache().clear()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user)
+        self.recipe.tags.add(Tag.objects.create(user=self.user, name='Lunch'))
+
+    def assertNotModifiedWithoutQueries(self, url, **headers):
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(url, **headers)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        for query in ctx.captured_queries:
+            self.assertNotIn('core_tag', query['sql'])
+            self.assertNotIn('core_ingredient', query['sql'])
+            self.assertNotIn('core_recipe_tags', query['sql'])
+        return res
+
+    def test_detail_if_none_match(self):
+        """Test an unchanged recipe returns 304 for its ETag"""
+        url = detail_url(self.recipe.id)
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        etag = res['ETag']
+
+        not_modified = self.assertNotModifiedWithoutQueries(
+            url, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(not_modified['ETag'], etag)
+
+    def test_list_if_none_match(self):
+        """Test an unchanged list returns 304 for its ETag"""
+        res = self.client.get(RECIPE_URL)
+        self.assertNotModifiedWithoutQueries(
+            RECIPE_URL, HTTP_IF_NONE_MATCH=res['ETag']
+        )
+
+    def test_change_invalidates_etag(self):
+        """Test a change to the user's data yields a new ETag"""
+        url = detail_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+
+        self.recipe.title = 'New title'
+        self.recipe.save()
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['title'], 'New title')
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_etag_differs_per_query(self):
+        """Test lists with different params have different ETags"""
+        first = self.client.get(RECIPE_URL)['ETag']
+        second = self.client.get(RECIPE_URL, {'page_size': 1})['ETag']
+        self.assertNotEqual(first, second)
+
+    def test_if_modified_since(self):
+        """Test If-Modified-Since is honoured once the second has passed"""
+        url = detail_url(self.recipe.id)
+        later = time.time() + 5
+        with patch('recipe.cache.time.time', return_value=later):
+            res = self.client.get(url)
+            self.assertIn('Last-Modified', res)
+            self.assertNotModifiedWithoutQueries(
+                url, HTTP_IF_MODIFIED_SINCE=res['Last-Modified']
+            )
+            res = self.client.get(
+                url, HTTP_IF_MODIFIED_SINCE=http_date(later - 3600)
+            )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_no_last_modified_within_current_second(self):
+        """Test a change in the current second is not used for IMS"""
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertNotIn('Last-Modified', res)
+
+    def test_other_users_recipe_not_found(self):
+        """Test conditional headers do not expose other users' recipes"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+        )
+        recipe = create_recipe(user=other)
+        res = self.client.get(detail_url(recipe.id), HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(CACHES={
+    **settings.CACHES,
+    'api': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+})
+class PerProcessCacheTests(TestCase):
+    """Test a per-process API cache is not trusted"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = create_recipe(user=self.user)
+
+    def test_check_warns(self):
+        """Test the system check reports the disabled cache"""
+        warnings = cache.check_api_cache(None)
+
+        self.assertEqual([w.id for w in warnings], ['recipe.W001'])
+
+    def test_response_cache_disabled(self):
+        """Test list responses are not cached"""
+        self.client.get(RECIPE_URL)
+        res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Cache', res)
+
+    def test_conditional_get_disabled(self):
+        """Test no validators are sent nor honoured"""
+        url = detail_url(self.recipe.id)
+        res = self.client.get(url)
+        self.assertNotIn('ETag', res)
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
@@ -0,0 +1,135 @@
+"""
+Tests for the streaming recipe export
+"""
+import csv
+import io
+import json
+import tempfile
+import zipfile
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'sample recipe',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+        'description': 'sample description',
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+@override_settings(RECIPE_EXPORT_CHUNK_SIZE=2, RECIPE_IMAGE_WORKERS=0)
+class ExportApiTests(TestCase):
+    """Test exporting the library of a user"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='test123'
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=self.user, name='Unused')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user, name='Salt'
+        )
+
+    def _export(self, output=None):
+        params = {'output': output} if output else {}
+        res = self.client.get(EXPORT_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return b''.join(res.streaming_content)
+
+    def test_ndjson(self):
+        """Test recipes are exported with their tag and ingredient names"""
+        recipe = create_recipe(self.user, title='Soup')
+        recipe.tags.add(self.tag)
+        recipe.ingredients.add(self.ingredient)
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='test123'
+        )
+        create_recipe(other, title='Not mine')
+
+        lines = self._export().decode().splitlines()
+        records = [json.loads(line) for line in lines]
+
+        self.assertEqual(
+            [(r['type'], r.get('name')) for r in records[:3]],
+            [('tag', 'Unused'), ('tag', 'Vegan'), ('ingredient', 'Salt')],
+        )
+        self.assertEqual(len(records), 4)
+        self.assertEqual(records[3]['title'], 'Soup')
+        self.assertEqual(records[3]['price'], '5.25')
+        self.assertEqual(records[3]['tags'], ['Vegan'])
+        self.assertEqual(records[3]['ingredients'], ['Salt'])
+
+    def test_csv(self):
+        """Test recipes are exported as CSV rows"""
+        for i in range(3):
+            create_recipe(self.user, title=f'Recipe {i}').tags.add(self.tag)
+
+        rows = list(csv.DictReader(
+            io.StringIO(self._export('csv').decode())
+        ))
+
+        self.assertEqual(
+            [row['title'] for row in rows],
+            ['Recipe 0', 'Recipe 1', 'Recipe 2'],
+        )
+        self.assertEqual(rows[0]['tags'], 'Vegan')
+
+    def test_zip_includes_images(self):
+        """Test the zip holds the NDJSON export and the image files"""
+        recipe = create_recipe(self.user)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', (10, 10)).save(image_file, 'JPEG')
+            image_file.seek(0)
+            recipe.image.save('sample.jpg', image_file)
+        self.addCleanup(recipe.image.delete)
+
+        archive = zipfile.ZipFile(io.BytesIO(self._export('zip')))
+
+        self.assertEqual(
+            archive.namelist(), ['recipes.ndjson', recipe.image.name]
+        )
+        with recipe.image.open('rb') as image:
+            self.assertEqual(archive.read(recipe.image.name), image.read())
+
+    def test_queries_batched_per_chunk(self):
+        """Test tags and ingredients are loaded per chunk, not per recipe"""
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self._export()
+            return len(queries)
+
+        for _ in range(2):
+            create_recipe(self.user).tags.add(self.tag)
+        two = count_queries()
+        for _ in range(2):
+            create_recipe(self.user).tags.add(self.tag)
+        four = count_queries()
+
+        # one more chunk: one query per link table
+        self.assertEqual(four - two, 2)
+
+    def test_invalid_output(self):
+        """Test unknown formats are rejected"""
+        res = self.client.get(EXPORT_URL, {'output': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
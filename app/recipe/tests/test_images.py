@@ -0,0 +1,416 @@
+"""
+Tests for recipe image processing and the image endpoints
+"""
+import fcntl
+import os
+import shutil
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import features, Image
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+from recipe import images
+from recipe.images import (
+    process_image, ResizeCache, sibling_name, variant_name
+)
+
+CACHE_DIR = tempfile.mkdtemp()
+
+
+def image_url(recipe_id):
+    """Create and return the URL of a recipe image"""
+    return reverse('recipe-image', kwargs={'pk': recipe_id})
+
+
+def resize_url(recipe_id, width, height, ext='png'):
+    """Create and return a resize URL"""
+    return reverse(
+        'recipe-image-resize',
+        kwargs={'pk': recipe_id, 'width': width, 'height': height, 'ext': ext}
+    )
+
+
+def replace_original(path, size):
+    """Replace an image file under its name, like process_image does"""
+    Image.new('RGB', size).save(f'{path}.tmp', 'JPEG')
+    os.replace(f'{path}.tmp', path)
+
+
+@override_settings(
+    RECIPE_IMAGE_CACHE_DIR=CACHE_DIR,
+    RECIPE_IMAGE_CACHE_MAX_BYTES=1024 * 1024,
+    RECIPE_IMAGE_WORKERS=0,
+)
+class ResizeViewTests(TestCase):
+    """Test resizing recipe images on demand"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='test123'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='sample recipe',
+            time_minutes=10,
+            price=Decimal('5.00'),
+        )
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', (800, 400)).save(image_file, 'JPEG')
+            image_file.seek(0)
+            self.recipe.image.save('sample.jpg', image_file)
+
+    def tearDown(self):
+        self.recipe.image.delete()
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+    def _image(self, res):
+        path = os.path.join(CACHE_DIR, 'response')
+        with open(path, 'wb') as response_file:
+            response_file.write(b''.join(res.streaming_content))
+        image = Image.open(path)
+        image.load()
+        return image
+
+    def test_resize(self):
+        """Test the image is scaled to fit the box"""
+        res = self.client.get(resize_url(self.recipe.id, 200, 200, 'jpg'))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertIn('max-age', res['Cache-Control'])
+        self.assertIn('ETag', res)
+        image = self._image(res)
+        self.assertEqual(image.format, 'JPEG')
+        self.assertEqual(image.size, (200, 100))
+
+    def test_resize_palette_image(self):
+        """Test palette images are expanded before being reduced"""
+        self.recipe.image.delete()
+        with tempfile.NamedTemporaryFile(suffix='.png') as image_file:
+            Image.effect_noise((1000, 800), 64).convert('P').save(
+                image_file, 'PNG'
+            )
+            image_file.seek(0)
+            self.recipe.image.save('palette.png', image_file)
+
+        for ext in ('png', 'jpg'):
+            res = self.client.get(resize_url(self.recipe.id, 100, 100, ext))
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(self._image(res).size, (100, 80))
+
+    @skipUnless(features.check('webp'), 'Pillow built without WebP')
+    def test_resize_webp(self):
+        """Test images can be served as WebP"""
+        res = self.client.get(resize_url(self.recipe.id, 200, 200, 'webp'))
+
+        self.assertEqual(res['Content-Type'], 'image/webp')
+        self.assertEqual(self._image(res).format, 'WEBP')
+
+    def test_not_modified(self):
+        """Test a matching If-None-Match gets a 304"""
+        res = self.client.get(resize_url(self.recipe.id, 100, 100, 'png'))
+        res = self.client.get(
+            resize_url(self.recipe.id, 100, 100, 'png'),
+            HTTP_IF_NONE_MATCH=res['ETag'],
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_replaced_original_resized_again(self):
+        """Test replacing the original in place invalidates its sizes"""
+        url = resize_url(self.recipe.id, 100, 100, 'png')
+        etag = self.client.get(url)['ETag']
+        replace_original(self.recipe.image.path, (400, 800))
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertEqual(self._image(res).size, (50, 100))
+
+    def test_resize_cached(self):
+        """Test a size is only resized once"""
+        url = resize_url(self.recipe.id, 120, 120)
+        with patch(
+            'recipe.images.resize_image', wraps=images.resize_image
+        ) as resize:
+            self.client.get(url)
+            res = self.client.get(url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        resize.assert_called_once()
+
+    def test_invalid_size_or_format(self):
+        """Test unsupported formats and oversized boxes are not found"""
+        for url in (
+            resize_url(self.recipe.id, 100, 100, 'tiff'),
+            resize_url(self.recipe.id, 0, 100),
+            resize_url(self.recipe.id, 100, 100000),
+        ):
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_other_users_recipe(self):
+        """Test images of other users' recipes are not served"""
+        other = get_user_model().objects.create_user(
+            email='other@example.com', password='test123'
+        )
+        self.client.force_authenticate(other)
+        res = self.client.get(resize_url(self.recipe.id, 100, 100))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_auth_required(self):
+        """Test authentication is required"""
+        res = APIClient().get(resize_url(self.recipe.id, 100, 100))
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+PROCESS_OPTIONS = {
+    'sizes': (64,),
+    'max_edge': 256,
+    'encoding': {
+        'JPEG': {'quality': 82, 'optimize': True, 'progressive': True},
+    },
+    'sibling_format': None,
+}
+
+
+class ProcessImageTests(TestCase):
+    """Test uploaded images are optimised in place"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'image.jpg')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _save(self, size, **params):
+        Image.effect_noise(size, 64).convert('RGB').save(
+            self.path, 'JPEG', quality=100, **params
+        )
+
+    def test_metadata_stripped(self):
+        """Test EXIF is dropped and the orientation applied"""
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotated 90 degrees
+        exif[0x010F] = 'camera'
+        self._save((100, 50), exif=exif.tobytes())
+
+        process_image(self.path, PROCESS_OPTIONS)
+
+        with Image.open(self.path) as image:
+            self.assertEqual(image.size, (50, 100))
+            self.assertFalse(image.getexif())
+            self.assertTrue(image.info.get('progressive'))
+
+    def test_longest_edge_capped(self):
+        """Test large images are scaled down to max_edge"""
+        self._save((1000, 500))
+
+        result = process_image(self.path, PROCESS_OPTIONS)
+
+        with Image.open(self.path) as image:
+            self.assertEqual(image.size, (256, 128))
+        self.assertLess(result['stored_bytes'], result['original_bytes'])
+        self.assertEqual(len(result['variants']), 1)
+
+    def test_variants_not_larger_than_image_skipped(self):
+        """Test no variant is written for sizes the image fits already"""
+        self._save((64, 32))
+
+        result = process_image(self.path, PROCESS_OPTIONS)
+
+        self.assertEqual(result['variants'], [])
+        self.assertFalse(os.path.exists(variant_name(self.path, 64)))
+
+    def test_larger_encoding_discarded(self):
+        """Test an original is kept when re-encoding would grow it"""
+        options = dict(PROCESS_OPTIONS, encoding={'JPEG': {'quality': 100}})
+        Image.new('RGB', (100, 100)).save(self.path, 'JPEG', quality=10)
+        with open(self.path, 'rb') as image_file:
+            original = image_file.read()
+
+        result = process_image(self.path, options)
+
+        with open(self.path, 'rb') as image_file:
+            self.assertEqual(image_file.read(), original)
+        self.assertEqual(result['stored_bytes'], len(original))
+
+    def test_bytes_saved_reported(self):
+        """Test the bytes saved are logged"""
+        self._save((1000, 500))
+        with self.assertLogs('recipe.images', 'INFO') as logs:
+            images.report_processing(
+                process_image(self.path, PROCESS_OPTIONS)
+            )
+
+        self.assertIn('saved', logs.output[0])
+
+    @skipUnless(features.check('webp'), 'Pillow built without WebP')
+    def test_sibling_written(self):
+        """Test a cheaper WebP sibling is written"""
+        self._save((200, 200))
+
+        result = process_image(
+            self.path, dict(PROCESS_OPTIONS, sibling_format='WEBP')
+        )
+
+        self.assertIsNotNone(result['sibling_bytes'])
+        with Image.open(sibling_name(self.path, 'WEBP')) as image:
+            self.assertEqual(image.format, 'WEBP')
+
+
+@override_settings(RECIPE_IMAGE_WORKERS=0, RECIPE_IMAGE_SIBLING_FORMAT='WEBP')
+class ImageViewTests(TestCase):
+    """Test serving recipe images by the client's Accept header"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='test123'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='sample recipe',
+            time_minutes=10,
+            price=Decimal('5.00'),
+        )
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', (80, 40)).save(image_file, 'JPEG')
+            image_file.seek(0)
+            self.recipe.image.save('sample.jpg', image_file)
+        self.sibling = sibling_name(self.recipe.image.name, 'WEBP')
+
+    def tearDown(self):
+        self.recipe.image.storage.delete(self.sibling)
+        self.recipe.image.delete()
+
+    def test_original_served(self):
+        """Test the original is served without a sibling"""
+        res = self.client.get(
+            image_url(self.recipe.id), HTTP_ACCEPT='image/webp,*/*'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertIn('Accept', res['Vary'])
+
+    def test_sibling_negotiated(self):
+        """Test the sibling is only served to clients accepting it"""
+        with self.recipe.image.storage.open(self.sibling, 'wb') as sibling:
+            sibling.write(b'webp')
+        url = image_url(self.recipe.id)
+
+        res = self.client.get(url, HTTP_ACCEPT='image/webp')
+        self.assertEqual(res['Content-Type'], 'image/webp')
+        self.assertEqual(b''.join(res.streaming_content), b'webp')
+        etag = res['ETag']
+
+        res = self.client.get(url, HTTP_ACCEPT='image/jpeg')
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_replaced_original_gets_new_etag(self):
+        """Test an original replaced in place is not answered with 304"""
+        url = image_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+        replace_original(self.recipe.image.path, (40, 20))
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+
+class ResizeCacheTests(TestCase):
+    """Test the on-disk resize cache"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _create(self, size):
+        def create(path):
+            with open(path, 'wb') as entry:
+                entry.write(b'x' * size)
+        return create
+
+    def test_evicts_least_recently_used(self):
+        """Test old entries are removed once the size limit is exceeded"""
+        cache = ResizeCache(self.directory, max_bytes=300)
+        first = cache.get_or_create('first', 'png', self._create(100))
+        second = cache.get_or_create('second', 'png', self._create(100))
+        os.utime(first, (1, 1))
+        os.utime(second, (2, 2))
+        cache.get_or_create('first', 'png', self._create(100))
+        cache.get_or_create('third', 'png', self._create(150))
+
+        self.assertTrue(os.path.exists(first))
+        self.assertFalse(os.path.exists(second))
+
+    def test_held_lock_survives_eviction(self):
+        """Test evicting an entry leaves a lock held by a request in place"""
+        cache = ResizeCache(self.directory, max_bytes=150)
+        first = cache.get_or_create('first', 'png', self._create(100))
+        os.utime(first, (1, 1))
+
+        with open(f'{first}.lock') as held:
+            fcntl.flock(held, fcntl.LOCK_EX)
+            cache.get_or_create('second', 'png', self._create(100))
+
+            self.assertFalse(os.path.exists(first))
+            self.assertTrue(os.path.exists(f'{first}.lock'))
+
+    def test_prunes_orphaned_locks(self):
+        """Test lock files of removed entries are pruned when free"""
+        cache = ResizeCache(self.directory, max_bytes=10000)
+        first = cache.get_or_create('first', 'png', self._create(10))
+        second = cache.get_or_create('second', 'png', self._create(10))
+        os.remove(first)
+
+        cache.prune_locks()
+
+        self.assertFalse(os.path.exists(f'{first}.lock'))
+        self.assertTrue(os.path.exists(f'{second}.lock'))
+
+    def test_single_flight(self):
+        """Test concurrent requests for one key create it once"""
+        cache = ResizeCache(self.directory, max_bytes=10000)
+        calls = []
+
+        def create(path):
+            calls.append(path)
+            time.sleep(0.1)
+            self._create(10)(path)
+
+        threads = [
+            threading.Thread(
+                target=cache.get_or_create, args=('key', 'png', create)
+            )
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
@@ -7,9 +7,12 @@ from django.contrib.auth import get_user_model
 from django.urls import reverse
 from core.models import Ingredient,Recipe
 from recipe.serializers import IngredientSerializer
-import random
+import itertools
 
 INGREDIENT_URL = reverse('recipe:ingredient-list')
+INGREDIENT_AUTOCOMPLETE_URL = reverse('recipe:ingredient-autocomplete')
+# ingredient names are unique per user
+INGREDIENT_NUMBERS = itertools.count()
 
 
 def detail_url(ingredient_id):
@@ -21,7 +24,7 @@ def detail_url(ingredient_id):
 
 
 def create_ingredient(user, **argument):
-    payload = {'name': f'Test Ingredient_{random.randint(0, 100)}'}
+    payload = {'name': f'Test Ingredient_{next(INGREDIENT_NUMBERS)}'}
     payload.update(argument)
     ingredient = Ingredient.objects.create(user=user, **payload)
     return ingredient
@@ -58,7 +61,7 @@ class PrivateIngredientApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         ingredients = Ingredient.objects.all().order_by('-name')
         serializer = IngredientSerializer(ingredients, many=True)
-        self.assertEqual(serializer.data, res.data)
+        self.assertEqual(serializer.data, res.data['results'])
 
     def test_ingredients_limited_to_user(self):
         """Test retrieving ingredients for only creator of ingredient"""
@@ -70,8 +73,8 @@ class PrivateIngredientApiTests(TestCase):
         create_ingredient(user=self.user)
         res = self.client.get(INGREDIENT_URL)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        for ingredient in res.data:
+        self.assertEqual(len(res.data['results']), 1)
+        for ingredient in res.data['results']:
             self.assertNotEquals(
                 other_user_ingredient.name,
                 ingredient['name']
@@ -113,8 +116,8 @@ class PrivateIngredientApiTests(TestCase):
         res = self.client.get(INGREDIENT_URL, {'assigned_only': 1})
         s1 = IngredientSerializer(in1)
         s2 = IngredientSerializer(in2)
-        self.assertIn(s1.data, res.data)
-        self.assertNotIn(s2.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertNotIn(s2.data, res.data['results'])
 
     def test_filtered_ingredients_unique(self):
         """Teting filtering ingredients returned a unique list"""
@@ -140,4 +143,37 @@ class PrivateIngredientApiTests(TestCase):
         recipe2.ingredients.add(ing)
         res = self.client.get(INGREDIENT_URL, {'assigned_only': 1})
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_autocomplete_ingredients(self):
+        """Test autocomplete matches ingredient names of the user"""
+        garlic = create_ingredient(user=self.user, name='Garlic')
+        create_ingredient(user=self.user, name='Ginger')
+
+        res = self.client.get(INGREDIENT_AUTOCOMPLETE_URL, {'q': 'garl'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [IngredientSerializer(garlic).data])
+
+    def test_autocomplete_ingredients_empty_query(self):
+        """Test autocomplete without a query returns nothing"""
+        create_ingredient(user=self.user, name='Garlic')
+        res = self.client.get(INGREDIENT_AUTOCOMPLETE_URL, {'q': ' '})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [])
+
+    def test_ingredients_with_counts(self):
+        """Test listing ingredients with their recipe counts"""
+        garlic = create_ingredient(user=self.user, name='Garlic')
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Soup',
+            time_minutes=10,
+            price=Decimal('2.00'),
+        )
+        recipe.ingredients.add(garlic)
+
+        res = self.client.get(INGREDIENT_URL, {'with_counts': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'][0]['recipe_count'], 1)
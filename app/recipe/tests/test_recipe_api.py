@@ -4,7 +4,9 @@ Test the recipe API
 import tempfile
 import os
 from PIL import Image
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from decimal import Decimal
 from django.urls import reverse
 from rest_framework import status
@@ -17,6 +19,8 @@ from core.models import (
 )
 from recipe.serializers import RecipeSerializer
 from recipe.serializers import RecipeDetailSerializer
+from recipe.views import RecipeViewSet
+from recipe.images import schedule_processing, variant_name
 
 RECIPE_URL = reverse('recipe:recipe-list')
 
@@ -81,7 +85,7 @@ class PrivateRecipeApiTest(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         recipes = Recipe.objects.all().order_by('-id')
         serializer = RecipeSerializer(recipes, many=True)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipes_limited_to_user(self):
         """Test list of recipes is limited to authenticated user"""
@@ -95,7 +99,7 @@ class PrivateRecipeApiTest(TestCase):
         recipes = Recipe.objects.filter(user=self.user)
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_get_recipe_detail(self):
         """Test retrieving recipe details"""
@@ -259,6 +263,45 @@ class PrivateRecipeApiTest(TestCase):
         self.assertIn(tag_lunch, recipe.tags.all())
         self.assertNotIn(tag_breakfast, recipe.tags.all())
 
+    def test_update_unchanged_tags_writes_nothing(self):
+        """Test resending the same tags does not touch the link table"""
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(
+            Tag.objects.create(user=self.user, name='Breakfast'),
+            Tag.objects.create(user=self.user, name='Lunch'),
+        )
+        payload = {'tags': [{'name': 'Lunch'}, {'name': 'Breakfast'}]}
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.patch(
+                detail_url(recipe.id), payload, format='json'
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        writes = [
+            q['sql'] for q in ctx.captured_queries
+            if 'core_recipe_tags' in q['sql']
+            and q['sql'].startswith(('INSERT', 'DELETE'))
+        ]
+        self.assertEqual(writes, [])
+
+    def test_update_tags_only_writes_changes(self):
+        """Test changing one tag deletes and inserts a single link"""
+        recipe = create_recipe(user=self.user)
+        keep = Tag.objects.create(user=self.user, name='Breakfast')
+        drop = Tag.objects.create(user=self.user, name='Lunch')
+        recipe.tags.add(keep, drop)
+        through = Recipe.tags.through
+        kept_link = through.objects.get(recipe=recipe, tag=keep)
+        payload = {'tags': [{'name': 'Breakfast'}, {'name': 'Dinner'}]}
+
+        res = self.client.patch(detail_url(recipe.id), payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        names = set(recipe.tags.values_list('name', flat=True))
+        self.assertEqual(names, {'Breakfast', 'Dinner'})
+        self.assertTrue(through.objects.filter(id=kept_link.id).exists())
+
     def test_clearing_recipe_tags(self):
         """Test clearing a recipe tags"""
         tag = Tag.objects.create(user=self.user, name='Breakfast')
@@ -270,6 +313,43 @@ class PrivateRecipeApiTest(TestCase):
         recipe.refresh_from_db()
         self.assertEqual(recipe.tags.count(), 0)
 
+    def test_create_recipe_with_duplicate_tag_names(self):
+        """Test repeated tag names in a payload create a single tag"""
+        payload = {
+            'title': 'Pancakes',
+            'description': 'Fluffy',
+            'time_minutes': 10,
+            'price': Decimal('2.50'),
+            'tags': [{'name': 'Breakfast'}, {'name': 'Breakfast'}],
+        }
+        res = self.client.post(RECIPE_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(len(res.data['tags']), 1)
+
+    def test_create_recipe_query_count_independent_of_items(self):
+        """Test tags and ingredients are resolved and linked in bulk"""
+        Ingredient.objects.create(user=self.user, name='Ing 0')
+
+        def payload(size):
+            return {
+                'title': 'Soup',
+                'description': 'Hot',
+                'time_minutes': 10,
+                'price': Decimal('2.50'),
+                'tags': [{'name': f'Tag {i}'} for i in range(size)],
+                'ingredients': [{'name': f'Ing {i}'} for i in range(size)],
+            }
+
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(RECIPE_URL, payload(2), format='json')
+        with CaptureQueriesContext(connection) as large:
+            res = self.client.post(RECIPE_URL, payload(20), format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data['ingredients']), 20)
+        self.assertEqual(len(small), len(large))
+
     def test_creating_recipe_with_ingredients(self):
         """Test creating a new Recipe with new Ingredients"""
         payloads = {
@@ -357,9 +437,9 @@ class PrivateRecipeApiTest(TestCase):
         s1 = RecipeSerializer(r1)
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
 
     def test_filter_by_ingredients(self):
         """Test filtering recipes by ingredients"""
@@ -376,11 +456,187 @@ class PrivateRecipeApiTest(TestCase):
         s1 = RecipeSerializer(r1)
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertIn(s2.data, res.data['results'])
+        self.assertNotIn(s3.data, res.data['results'])
+
+    def test_filter_by_all_tags(self):
+        """Test filtering recipes having every requested tag"""
+        tag1 = Tag.objects.create(user=self.user, name='Vegan')
+        tag2 = Tag.objects.create(user=self.user, name='Quick')
+        r1 = create_recipe(user=self.user, title='Salad')
+        r1.tags.add(tag1, tag2)
+        r2 = create_recipe(user=self.user, title='Stew')
+        r2.tags.add(tag1)
+
+        params = {'tags': f'{tag1.id},{tag2.id}', 'match': 'all'}
+        res = self.client.get(RECIPE_URL, params)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ids = [item['id'] for item in res.data['results']]
+        self.assertEqual(ids, [r1.id])
+
+    def test_filter_combines_tags_and_ingredients(self):
+        """Test tag and ingredient filters both apply"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ing = Ingredient.objects.create(user=self.user, name='Tofu')
+        r1 = create_recipe(user=self.user, title='Tofu bowl')
+        r1.tags.add(tag)
+        r1.ingredients.add(ing)
+        r2 = create_recipe(user=self.user, title='Salad')
+        r2.tags.add(tag)
+
+        params = {'tags': f'{tag.id}', 'ingredients': f'{ing.id}'}
+        res = self.client.get(RECIPE_URL, params)
+
+        ids = [item['id'] for item in res.data['results']]
+        self.assertEqual(ids, [r1.id])
+
+    def test_filter_uses_exists_without_distinct(self):
+        """Test tag filtering runs as a semi-join with no DISTINCT"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(tag, Tag.objects.create(user=self.user, name='Hot'))
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(RECIPE_URL, {'tags': f'{tag.id}'})
+
+        self.assertEqual(len(res.data['results']), 1)
+        sql = ctx.captured_queries[0]['sql'].upper()
+        self.assertIn('EXISTS', sql)
+        self.assertNotIn('DISTINCT', sql)
+
+    def test_filter_invalid_match_mode(self):
+        """Test an unknown match mode returns an error"""
+        res = self.client.get(RECIPE_URL, {'tags': '1', 'match': 'some'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_search_recipes(self):
+        """Test full text search over title and description"""
+        r1 = create_recipe(user=self.user, title='Tomato soup',
+                           description='Simple and warm')
+        r2 = create_recipe(user=self.user, title='Bruschetta',
+                           description='Bread topped with tomatoes')
+        create_recipe(user=self.user, title='Pancakes',
+                      description='Sweet breakfast')
 
+        res = self.client.get(RECIPE_URL, {'search': 'tomato'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ids = [item['id'] for item in res.data['results']]
+        # title matches rank above description matches
+        self.assertEqual(ids, [r1.id, r2.id])
+
+    def test_search_combines_with_tag_filter(self):
+        """Test search results are narrowed by tag filters"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        r1 = create_recipe(user=self.user, title='Tomato curry')
+        r1.tags.add(tag)
+        create_recipe(user=self.user, title='Tomato omelette')
+
+        params = {'search': 'tomato', 'tags': f'{tag.id}'}
+        res = self.client.get(RECIPE_URL, params)
+
+        ids = [item['id'] for item in res.data['results']]
+        self.assertEqual(ids, [r1.id])
+
+    def test_search_results_paginated(self):
+        """Test walking ranked search results with a cursor"""
+        recipes = [
+            create_recipe(user=self.user, title=f'Tomato dish {i}')
+            for i in range(3)
+        ] + [
+            create_recipe(user=self.user, description='with tomato')
+            for _ in range(2)
+        ]
+        seen = []
+        res = self.client.get(RECIPE_URL, {'search': 'tomato', 'page_size': 2})
+        while True:
+            seen.extend(item['id'] for item in res.data['results'])
+            if not res.data['next']:
+                break
+            res = self.client.get(res.data['next'])
+        self.assertEqual(sorted(seen), sorted(r.id for r in recipes))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_list_recipes_query_count_fixed(self):
+        """Test listing recipes does not query tags per recipe"""
+        for i in range(5):
+            recipe = create_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(
+                Tag.objects.create(user=self.user, name=f'Tag {i}')
+            )
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=self.user, name=f'Ing {i}')
+            )
+        # one query for recipes, one each for prefetched tags / ingredients
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPE_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 5)
+        for item in res.data['results']:
+            self.assertEqual(len(item['tags']), 1)
+            self.assertEqual(len(item['ingredients']), 1)
+
+    def test_retrieve_recipe_query_count_fixed(self):
+        """Test retrieving a recipe prefetches tags and ingredients"""
+        recipe = create_recipe(user=self.user)
+        for i in range(3):
+            recipe.tags.add(
+                Tag.objects.create(user=self.user, name=f'Tag {i}')
+            )
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=self.user, name=f'Ing {i}')
+            )
+        with self.assertNumQueries(3):
+            res = self.client.get(detail_url(recipe.id))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['tags']), 3)
+        self.assertEqual(len(res.data['ingredients']), 3)
+
+    def test_list_recipes_paginated_by_cursor(self):
+        """Test walking the recipe list page by page with a cursor"""
+        recipes = [
+            create_recipe(user=self.user, title=f'Recipe {i}')
+            for i in range(5)
+        ]
+        seen = []
+        url = RECIPE_URL
+        params = {'page_size': 2}
+        with CaptureQueriesContext(connection) as ctx:
+            while url:
+                res = self.client.get(url, params)
+                self.assertEqual(res.status_code, status.HTTP_200_OK)
+                self.assertNotIn('count', res.data)
+                self.assertLessEqual(len(res.data['results']), 2)
+                seen.extend(item['id'] for item in res.data['results'])
+                url, params = res.data['next'], None
+        expected = [r.id for r in sorted(recipes, key=lambda r: -r.id)]
+        self.assertEqual(seen, expected)
+        for query in ctx.captured_queries:
+            self.assertNotIn('OFFSET', query['sql'].upper())
+            self.assertNotIn('COUNT(', query['sql'].upper())
+
+    def test_list_recipes_page_size_capped(self):
+        """Test requested page size is capped"""
+        max_page_size = RecipeViewSet.pagination_class.max_page_size
+        Recipe.objects.bulk_create(
+            Recipe(
+                user=self.user,
+                title=f'Recipe {i}',
+                time_minutes=5,
+                price=Decimal('1.00'),
+                description='',
+            )
+            for i in range(max_page_size + 1)
+        )
+        res = self.client.get(RECIPE_URL, {'page_size': 10 ** 6})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), max_page_size)
+        self.assertIsNotNone(res.data['next'])
+
+
+@override_settings(RECIPE_IMAGE_SIZES=(128, 512), RECIPE_IMAGE_WORKERS=0)
 class ImageUploadTests(TestCase):
     """Test uploading Image API"""
 
@@ -395,8 +651,25 @@ class ImageUploadTests(TestCase):
 
     def tearDown(self):
         """Clean up after each test"""
+        if self.recipe.image:
+            for size in (128, 512):
+                self.recipe.image.storage.delete(
+                    variant_name(self.recipe.image.name, size)
+                )
         self.recipe.image.delete()
 
+    def _upload(self, size=(10, 10)):
+        """Upload a JPEG of `size` to the recipe"""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', size).save(image_file, 'JPEG')
+            image_file.seek(0)
+            res = self.client.post(
+                url, data={'image': image_file}, format='multipart'
+            )
+        self.recipe.refresh_from_db()
+        return res
+
     def test_upload_image(self):
         """Test uploading an image to a recipe """
         url = image_upload_url(self.recipe.id)
@@ -413,9 +686,63 @@ class ImageUploadTests(TestCase):
         self.assertIn('image', res.data)
         self.assertTrue(os.path.exists(self.recipe.image.path))
 
+    def test_image_serialized_as_negotiated_url(self):
+        """Test the image is exposed by its content negotiated URL"""
+        res = self._upload()
+        url = reverse('recipe-image', args=[self.recipe.id])
+
+        self.assertEqual(res.data['image'], f'http://testserver{url}')
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertEqual(res.data['image'], f'http://testserver{url}')
+
     def test_upload_image_bad_request(self):
         """Test uploading an invalid image"""
         url = image_upload_url(self.recipe.id)
         payload = {'image': 'notanimage'}
         res = self.client.post(url, payload)
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_upload_image_generates_thumbnails(self):
+        """Test downscaled variants are written and exposed"""
+        res = self._upload(size=(1000, 600))
+
+        self.assertEqual(set(res.data['thumbnails']), {'128', '512'})
+        for size in (128, 512):
+            path = variant_name(self.recipe.image.path, size)
+            with Image.open(path) as variant:
+                self.assertEqual(max(variant.size), size)
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertTrue(
+            res.data['thumbnails']['128'].endswith(
+                variant_name(self.recipe.image.name, 128)
+            )
+        )
+
+    def test_thumbnails_not_upscaled(self):
+        """Test sizes larger than the image are served by the original"""
+        res = self._upload(size=(300, 50))
+
+        self.assertFalse(
+            os.path.exists(variant_name(self.recipe.image.path, 512))
+        )
+        self.assertTrue(
+            res.data['thumbnails']['512'].endswith(self.recipe.image.url)
+        )
+        self.assertTrue(
+            res.data['thumbnails']['128'].endswith(
+                variant_name(self.recipe.image.name, 128)
+            )
+        )
+
+    def test_thumbnails_generated_in_process_pool(self):
+        """Test variants are produced by the worker pool"""
+        self._upload(size=(1000, 600))
+        for size in (128, 512):
+            os.remove(variant_name(self.recipe.image.path, size))
+        with self.settings(RECIPE_IMAGE_WORKERS=1):
+            result = schedule_processing(self.recipe).result(timeout=60)
+
+        written = result['variants']
+        self.assertEqual(len(written), 2)
+        for path in written:
+            self.assertTrue(os.path.exists(path))
@@ -6,13 +6,17 @@ from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 from django.test import TestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from decimal import Decimal
 
 
 from core.models import Tag,Recipe
 from recipe.serializers import TagSerializer
 
+
 TAGS_URL = reverse('recipe:tag-list')
+TAGS_AUTOCOMPLETE_URL = reverse('recipe:tag-autocomplete')
 
 
 def tag_detail_url(tag_id):
@@ -32,6 +36,18 @@ def create_tag(user, **params):
     return Tag.objects.create(user=user, **defaults)
 
 
+def create_recipe(user, **params):
+    """Create a sample recipe"""
+    defaults = {
+        'title': 'sample recipe',
+        'time_minutes': 22,
+        'price': Decimal('5.25'),
+        'description': 'sample description',
+    }
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
 class PublicTagsApiTests(TestCase):
     """Test Unauthenticated user tags API"""
 
@@ -60,7 +76,7 @@ class PrivateTagsApiTest(TestCase):
         tags = Tag.objects.all().order_by('-name')
         serializer = TagSerializer(tags, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_tags_limited_to_user(self):
         """Test retrieving tags for only the authenticated user"""
@@ -76,7 +92,7 @@ class PrivateTagsApiTest(TestCase):
         res = self.client.get(TAGS_URL)
         serializer = TagSerializer(test_case, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     # def test_create_tag_successful(self):
     #     """Test creating tags successful"""
@@ -128,6 +144,15 @@ class PrivateTagsApiTest(TestCase):
         tag.refresh_from_db()
         self.assertTrue(tag.name == new_name)
 
+    def test_renaming_tag_to_existing_name_fails(self):
+        """Test a tag cannot be renamed to another tag's name"""
+        create_tag(self.user, name='Lunch')
+        tag = create_tag(self.user, name='Dinner')
+        res = self.client.patch(tag_detail_url(tag.id), {'name': 'Lunch'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Dinner')
+
     def test_filter_tag_assigned_to_recipes(self):
         tag1 = Tag.objects.create(user=self.user, name='Breakfast')
         tag2 = Tag.objects.create(user=self.user, name='Lunch')
@@ -145,8 +170,8 @@ class PrivateTagsApiTest(TestCase):
         s1 = TagSerializer(tag1)
         s2 = TagSerializer(tag2)
 
-        self.assertIn(s1.data, res.data)
-        self.assertNotIn(s2.data, res.data)
+        self.assertIn(s1.data, res.data['results'])
+        self.assertNotIn(s2.data, res.data['results'])
 
     def test_filtered_tags_unique(self):
         """Test filtered tags return a unique list"""
@@ -171,6 +196,88 @@ class PrivateTagsApiTest(TestCase):
         recipe2.tags.add(tag)
         recipe1.tags.add(tag)
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_tags_paginated_by_name(self):
+        """Test tags are paged by cursor in name order"""
+        for name in ['Apple', 'Banana', 'Cherry']:
+            create_tag(user=self.user, name=name)
+        res = self.client.get(TAGS_URL, {'page_size': 2})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        names = [tag['name'] for tag in res.data['results']]
+        self.assertEqual(names, ['Cherry', 'Banana'])
+        res = self.client.get(res.data['next'])
+        names = [tag['name'] for tag in res.data['results']]
+        self.assertEqual(names, ['Apple'])
+        self.assertIsNone(res.data['next'])
+
+    def test_autocomplete_tags(self):
+        """Test autocomplete returns prefix then fuzzy matches"""
+        breakfast = create_tag(user=self.user, name='Breakfast')
+        brunch = create_tag(user=self.user, name='Brunch')
+        create_tag(user=self.user, name='Dinner')
+        other_user = create_user(email='other@example.com')
+        create_tag(user=other_user, name='Breakfast')
+
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': 'bre'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [TagSerializer(breakfast).data])
+
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': 'brekfast'})
+        self.assertEqual(res.data[0]['id'], breakfast.id)
+        self.assertNotIn(TagSerializer(brunch).data, res.data)
 
+    def test_autocomplete_tags_limit(self):
+        """Test autocomplete returns at most the requested matches"""
+        for i in range(5):
+            create_tag(user=self.user, name=f'Spicy {i}')
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': 'spi', 'limit': 2})
+        self.assertEqual(len(res.data), 2)
 
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': 'spi', 'limit': 0})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_assigned_only_uses_exists(self):
+        """Test assigned_only is a semi-join without DISTINCT"""
+        tag = create_tag(user=self.user, name='Breakfast')
+        create_recipe(user=self.user).tags.add(tag)
+        create_recipe(user=self.user).tags.add(tag)
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        self.assertEqual(len(res.data['results']), 1)
+        sql = ctx.captured_queries[0]['sql'].upper()
+        self.assertIn('EXISTS', sql)
+        self.assertNotIn('DISTINCT', sql)
+
+    def test_tags_with_counts(self):
+        """Test listing tags with their recipe counts in one query"""
+        breakfast = create_tag(user=self.user, name='Breakfast')
+        lunch = create_tag(user=self.user, name='Lunch')
+        create_tag(user=self.user, name='Dinner')
+        create_recipe(user=self.user).tags.add(breakfast, lunch)
+        create_recipe(user=self.user).tags.add(breakfast)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(TAGS_URL, {'with_counts': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        counts = {t['name']: t['recipe_count'] for t in res.data['results']}
+        self.assertEqual(counts, {'Breakfast': 2, 'Lunch': 1, 'Dinner': 0})
+
+    def test_tags_with_counts_assigned_only(self):
+        """Test counts combined with assigned_only skip unused tags"""
+        breakfast = create_tag(user=self.user, name='Breakfast')
+        create_tag(user=self.user, name='Dinner')
+        create_recipe(user=self.user).tags.add(breakfast)
+
+        res = self.client.get(
+            TAGS_URL, {'with_counts': 1, 'assigned_only': 1}
+        )
+
+        self.assertEqual(
+            res.data['results'],
+            [{'id': breakfast.id, 'name': 'Breakfast', 'recipe_count': 1}],
+        )
@@ -0,0 +1,153 @@
+"""
+Tests for bounded recipe image uploads
+"""
+import io
+import struct
+import tracemalloc
+import zlib
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import (
+    APIClient,
+    APIRequestFactory,
+    force_authenticate
+)
+
+from core.models import Recipe
+from recipe.images import variant_name
+from recipe.views import RecipeViewSet
+
+MAX_UPLOAD_BYTES = 4 * 1024 * 1024
+
+
+def image_upload_url(recipe_id):
+    """Create and return an image upload URL"""
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+def jpeg_bytes(size=(16, 16), padding=0):
+    """Return a small JPEG, optionally padded to a larger file"""
+    buffer = io.BytesIO()
+    Image.new('RGB', size).save(buffer, 'JPEG')
+    return buffer.getvalue() + b'\0' * padding
+
+
+def png_header(width, height):
+    """Return a PNG holding only a header claiming `width` x `height`"""
+    def chunk(kind, data):
+        return (
+            struct.pack('>I', len(data)) + kind + data
+            + struct.pack('>I', zlib.crc32(kind + data))
+        )
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (
+        b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', ihdr) + chunk(b'IEND', b'')
+    )
+
+
+def upload(name, content):
+    """Return an in-memory file to post"""
+    upload_file = io.BytesIO(content)
+    upload_file.name = name
+    return upload_file
+
+
+@override_settings(
+    RECIPE_IMAGE_MAX_UPLOAD_BYTES=MAX_UPLOAD_BYTES,
+    RECIPE_IMAGE_MAX_PIXELS=1000 * 1000,
+    RECIPE_IMAGE_WORKERS=0,
+)
+class ImageUploadLimitTests(TestCase):
+    """Test uploads are streamed and checked before decoding"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com', password='test123'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='sample recipe',
+            time_minutes=10,
+            price=Decimal('5.00'),
+        )
+
+    def tearDown(self):
+        self.recipe.refresh_from_db()
+        if self.recipe.image:
+            for size in (128, 512, 1024):
+                self.recipe.image.storage.delete(
+                    variant_name(self.recipe.image.name, size)
+                )
+            self.recipe.image.delete()
+
+    def _post(self, upload_file):
+        return self.client.post(
+            image_upload_url(self.recipe.id),
+            {'image': upload_file},
+            format='multipart',
+        )
+
+    def test_oversized_upload_rejected(self):
+        """Test uploads over the byte limit get 413"""
+        res = self._post(upload(
+            'big.jpg', jpeg_bytes(padding=MAX_UPLOAD_BYTES)
+        ))
+
+        self.assertEqual(
+            res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    def test_decompression_bomb_rejected(self):
+        """Test an image with too many pixels is rejected from its header"""
+        res = self._post(upload('bomb.png', png_header(50000, 50000)))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', res.data)
+
+    def test_too_many_pixels_rejected(self):
+        """Test images over RECIPE_IMAGE_MAX_PIXELS are rejected"""
+        res = self._post(upload('large.png', png_header(2000, 1000)))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('pixels', str(res.data['image'][0]))
+
+    def test_unsupported_format_rejected(self):
+        """Test formats outside RECIPE_IMAGE_FORMATS are rejected"""
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(buffer, 'BMP')
+        res = self._post(upload('image.bmp', buffer.getvalue()))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_upload_memory_bounded(self):
+        """Test a large upload is streamed instead of held in memory"""
+        content = jpeg_bytes(padding=MAX_UPLOAD_BYTES - 1024 * 1024)
+        request = APIRequestFactory().post(
+            image_upload_url(self.recipe.id),
+            {'image': upload('large.jpg', content)},
+            format='multipart',
+        )
+        force_authenticate(request, user=self.user)
+        view = RecipeViewSet.as_view({'post': 'upload_image'})
+
+        tracemalloc.start()
+        try:
+            res = view(request, pk=self.recipe.id)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            # closes the moved temporary file like the request handler does
+            request.close()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        # a few upload chunks, not the 3 MB file
+        self.assertLess(peak, len(content) // 4)
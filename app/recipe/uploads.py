@@ -0,0 +1,57 @@
+"""
+Bounded streaming of recipe image uploads
+"""
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import MultiPartParser
+
+# allowance for the multipart boundaries and headers around the file
+FORM_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(APIException):
+    """Raised when an upload exceeds RECIPE_IMAGE_MAX_UPLOAD_BYTES"""
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = _('Uploaded file is too large.')
+    default_code = 'upload_too_large'
+
+
+class LimitedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Stream uploads to a temporary file, never into memory.
+
+    A request whose Content-Length is already over the limit is refused
+    before its body is read; otherwise the upload is aborted at the first
+    chunk past the limit.
+    """
+
+    def __init__(self, request=None, max_bytes=None):
+        super().__init__(request)
+        self.max_bytes = max_bytes or settings.RECIPE_IMAGE_MAX_UPLOAD_BYTES
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        if content_length > self.max_bytes + FORM_OVERHEAD:
+            raise UploadTooLarge()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_bytes:
+            # closing the temporary file also removes it
+            self.file.close()
+            raise UploadTooLarge()
+        return super().receive_data_chunk(raw_data, start)
+
+
+class ImageUploadParser(MultiPartParser):
+    """Multipart parser streaming files through the limited handler"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        # upload handlers live on the wrapped Django request
+        request._request.upload_handlers = [
+            LimitedTemporaryFileUploadHandler(request._request)
+        ]
+        return super().parse(stream, media_type, parser_context)
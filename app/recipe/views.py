@@ -1,27 +1,79 @@
 """
 View for recipe API
 """
+import hashlib
+import mimetypes
+
 from drf_spectacular.utils import (
     extend_schema_view,
     extend_schema,
     OpenApiTypes,
     OpenApiParameter
 )
-from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
+from rest_framework import viewsets, mixins, status, serializers
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.settings import api_settings
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Prefetch
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers
+)
 
 from core.models import Recipe, Tag, Ingredient
 from recipe.serializers import (
     RecipeSerializer,
     RecipeDetailSerializer,
     TagSerializer,
+    TagCountSerializer,
     IngredientSerializer,
+    IngredientCountSerializer,
     RecipeImageSerializer
 )
+from recipe.cache import CachedListMixin, ConditionalGetMixin
+from recipe.export import EXPORT_FORMATS
+from recipe.images import (
+    content_marker,
+    get_resized,
+    resize_formats,
+    schedule_processing,
+    sibling_name,
+    CONTENT_TYPES
+)
+from recipe.filters import (
+    autocomplete_names,
+    filter_assigned,
+    filter_by_related,
+    search_recipes,
+    MATCH_ANY,
+    MATCH_MODES
+)
+from recipe.uploads import ImageUploadParser
+from recipe.pagination import (
+    RecipeCursorPagination,
+    RecipeAttrCursorPagination
+)
+from user.authentication import (
+    CachedTokenAuthentication,
+    SignedTokenAuthentication
+)
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.views import APIView
+
+
+class FileContentNegotiation(BaseContentNegotiation):
+    """Accept any Accept header, file views set the type themselves"""
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return (renderers[0], renderers[0].media_type)
 
 
 @extend_schema_view(
@@ -38,36 +90,97 @@ from rest_framework.response import Response
                 OpenApiTypes.STR,
                 description='comma seperated list of IDs to filter ',
                 required=False,
+            ),
+            OpenApiParameter(
+                'match',
+                OpenApiTypes.STR,
+                enum=list(MATCH_MODES),
+                description='"any" (default) returns recipes with any of '
+                            'the given tags / ingredients, "all" only '
+                            'recipes with every one of them',
+                required=False,
+            ),
+            OpenApiParameter(
+                'search',
+                OpenApiTypes.STR,
+                description='full text search over title and description, '
+                            'results are ordered by relevance',
+                required=False,
             )
         ]
+    ),
+    export=extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'output',
+                OpenApiTypes.STR,
+                enum=list(EXPORT_FORMATS),
+                description='"ndjson" (default), "csv" or a "zip" of the '
+                            'NDJSON export and the image files',
+                required=False,
+            )
+        ],
+        responses={200: OpenApiTypes.BINARY},
     )
 )
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin,
+                    CachedListMixin,
+                    viewsets.ModelViewSet):
     """View to manage recipe APIs"""
     serializer_class = RecipeDetailSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
     permission_classes = (IsAuthenticated,)
     queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (
+        CachedTokenAuthentication,
+        SignedTokenAuthentication
+    )
+    pagination_class = RecipeCursorPagination
 
     def _params_to_ints(self, qs):
         """Convert a list of Strings to integers"""
         return [int(str_id) for str_id in qs.split(',')]
 
+    def _prefetch_related_attrs(self, queryset):
+        """Load the nested tags and ingredients in one query each"""
+        return queryset.prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.only('id', 'name')),
+            Prefetch(
+                'ingredients',
+                queryset=Ingredient.objects.only('id', 'name')
+            ),
+        )
+
+    def _get_match_mode(self):
+        """Return the requested tag / ingredient match mode"""
+        match = self.request.query_params.get('match', MATCH_ANY)
+        if match not in MATCH_MODES:
+            raise serializers.ValidationError(
+                {'match': f'Must be one of: {", ".join(MATCH_MODES)}.'}
+            )
+        return match
+
     def get_queryset(self):
         """Retrieve recipes for authenticated user"""
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
+        search = self.request.query_params.get('search', '').strip()
         queryset = self.queryset
+        if self.action in ('list', 'retrieve'):
+            queryset = self._prefetch_related_attrs(queryset)
+        if tags or ingredients:
+            match = self._get_match_mode()
         if tags:
             tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            queryset = filter_by_related(queryset, 'tags', tag_ids, match)
         if ingredients:
             ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
-        return queryset.filter(
-            user=self.request.user
-        ).order_by('-id').distinct()
+            queryset = filter_by_related(
+                queryset, 'ingredients', ingredient_ids, match
+            )
+        if search and self.action == 'list':
+            queryset = search_recipes(queryset, search)
+        return queryset.filter(user=self.request.user).order_by('-id')
 
     def get_serializer_class(self):
         """Return appropriate serializer base on action of user"""
@@ -78,17 +191,38 @@ class RecipeViewSet(viewsets.ModelViewSet):
         else:
             return self.serializer_class
 
-    @action(methods=['POST'], detail=True, url_path='upload-image')
+    @action(methods=['POST'], detail=True, url_path='upload-image',
+            parser_classes=[ImageUploadParser])
     def upload_image(self, request, pk=None):
         """Upload an image to a recipe"""
         # get object base the pk in url
         recipe = self.get_object()
         serializer = self.get_serializer(recipe, data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            # holds the storage lock of a content addressed image until the
+            # new reference is committed
+            with transaction.atomic():
+                recipe = serializer.save()
+            schedule_processing(recipe)
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(methods=['GET'], detail=False, url_path='export',
+            content_negotiation_class=FileContentNegotiation)
+    def export(self, request):
+        """Stream every recipe, tag and ingredient of the user"""
+        output = request.query_params.get('output', 'ndjson')
+        if output not in EXPORT_FORMATS:
+            raise serializers.ValidationError(
+                {'output': f'Must be one of: {", ".join(EXPORT_FORMATS)}.'}
+            )
+        content_type, filename, chunks = EXPORT_FORMATS[output]
+        response = StreamingHttpResponse(
+            chunks(request.user), content_type=content_type
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
     # def perform_create(self, serializer):
     #     """Create a new recipe """
     #     serializer.save(user=self.request.user)
@@ -117,40 +251,203 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 type=OpenApiTypes.INT,
                 enum=[0, 1],
                 description='if 1, only assigned tag / ingredient  will be returned'
+            ),
+            OpenApiParameter(
+                name='with_counts',
+                type=OpenApiTypes.INT,
+                enum=[0, 1],
+                description='if 1, include the number of recipes using each '
+                            'tag / ingredient as recipe_count'
             )
         ]
+    ),
+    autocomplete=extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='q',
+                type=OpenApiTypes.STR,
+                description='prefix or approximate name to match',
+                required=True,
+            ),
+            OpenApiParameter(
+                name='limit',
+                type=OpenApiTypes.INT,
+                description='maximum number of matches to return',
+                required=False,
+            ),
+        ]
     )
 )
-class BaseRecipeAttrViewSet(mixins.ListModelMixin,
+class BaseRecipeAttrViewSet(CachedListMixin,
+                            mixins.ListModelMixin,
                             mixins.UpdateModelMixin,
                             mixins.DestroyModelMixin,
                             viewsets.GenericViewSet
                             ):
     """Base viewset for recipe attributes"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (
+        CachedTokenAuthentication,
+        SignedTokenAuthentication
+    )
     permission_classes = (IsAuthenticated,)
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    pagination_class = RecipeAttrCursorPagination
+    autocomplete_limit = 10
+    max_autocomplete_limit = 25
+
+    def _get_flag(self, name):
+        """Return a 0 / 1 query parameter as a boolean"""
+        return bool(int(self.request.query_params.get(name, 0)))
 
     def get_queryset(self):
         """Retrieve recipes for authenticated user """
-        assigned_only = bool(
-            int(self.request.query_params.get('assigned_only', 0)), )
-        queryset = self.queryset
-        if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
+        assigned_only = self._get_flag('assigned_only')
+        queryset = self.queryset.filter(user=self.request.user)
+        if self._get_flag('with_counts'):
+            # a single grouped query over the link table
+            queryset = queryset.annotate(recipe_count=Count('recipe'))
+            if assigned_only:
+                queryset = queryset.filter(recipe_count__gt=0)
+        elif assigned_only:
+            queryset = filter_assigned(queryset)
+
+        return queryset.order_by('-name')
 
-        return queryset.filter(user=self.request.user).order_by('-name').distinct()
+    def get_serializer_class(self):
+        """Add recipe counts to the list when they were requested"""
+        if self.action == 'list' and self._get_flag('with_counts'):
+            return self.count_serializer_class
+        return self.serializer_class
 
-    pass
+    def _get_autocomplete_limit(self):
+        """Return the requested number of matches, capped"""
+        limit = self.request.query_params.get('limit')
+        if limit is None:
+            return self.autocomplete_limit
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            raise serializers.ValidationError(
+                {'limit': 'Must be a positive integer.'}
+            )
+        return min(limit, self.max_autocomplete_limit)
+
+    @action(methods=['GET'], detail=False, url_path='autocomplete')
+    def autocomplete(self, request):
+        """Return the best name matches for search-as-you-type"""
+        term = request.query_params.get('q', '').strip()
+        limit = self._get_autocomplete_limit()
+        if not term:
+            return Response([])
+        queryset = autocomplete_names(
+            self.queryset.filter(user=request.user).only('id', 'name'),
+            term,
+        )
+        serializer = self.get_serializer(queryset[:limit], many=True)
+        return Response(serializer.data)
 
 
 class TagViewSet(BaseRecipeAttrViewSet):
     """View to manage Tag API"""
     serializer_class = TagSerializer
+    count_serializer_class = TagCountSerializer
     queryset = Tag.objects.all()
 
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
     """Manage Ingredient in the database"""
     serializer_class = IngredientSerializer
+    count_serializer_class = IngredientCountSerializer
     queryset = Ingredient.objects.all()
+
+
+class BaseRecipeImageView(APIView):
+    """Base view serving files of the authenticated user's recipe images"""
+    authentication_classes = (
+        CachedTokenAuthentication,
+        SignedTokenAuthentication
+    )
+    permission_classes = (IsAuthenticated,)
+    content_negotiation_class = FileContentNegotiation
+
+    def get_image(self, pk):
+        """Return the image of a recipe of the user or raise 404"""
+        recipe = Recipe.objects.filter(
+            pk=pk, user=self.request.user
+        ).only('image').first()
+        if recipe is None or not recipe.image:
+            raise Http404
+        return recipe.image
+
+    def get_marker(self, storage, name):
+        """Return the content marker of a stored file or raise 404"""
+        try:
+            return content_marker(storage.path(name))
+        except FileNotFoundError:
+            raise Http404
+
+    def serve(self, request, key, content_type, get_path):
+        """Return the file from `get_path()` unless the client has `key`"""
+        etag = '"{}"'.format(hashlib.sha1(key.encode()).hexdigest())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = FileResponse(
+                open(get_path(), 'rb'), content_type=content_type
+            )
+        response['ETag'] = etag
+        patch_cache_control(
+            response, private=True,
+            max_age=settings.RECIPE_IMAGE_RESIZE_MAX_AGE,
+        )
+        return response
+
+
+class RecipeImageView(BaseRecipeImageView):
+    """Serve a recipe image, re-encoded when the client accepts it"""
+
+    @extend_schema(responses={200: OpenApiTypes.BINARY})
+    def get(self, request, pk):
+        """Return the image, or its cheaper sibling if acceptable"""
+        image = self.get_image(pk)
+        name = image.name
+        content_type = mimetypes.guess_type(name)[0]
+        sibling_format = settings.RECIPE_IMAGE_SIBLING_FORMAT
+        if sibling_format:
+            sibling_type = CONTENT_TYPES[sibling_format]
+            sibling = sibling_name(name, sibling_format)
+            accepted = request.META.get('HTTP_ACCEPT', '')
+            if sibling_type in accepted and image.storage.exists(sibling):
+                name, content_type = sibling, sibling_type
+
+        response = self.serve(
+            request,
+            f'{name}:{self.get_marker(image.storage, name)}',
+            content_type,
+            lambda: image.storage.path(name),
+        )
+        patch_vary_headers(response, ('Accept',))
+        return response
+
+
+class RecipeImageResizeView(BaseRecipeImageView):
+    """Serve a recipe image scaled to fit the requested box"""
+
+    @extend_schema(responses={200: OpenApiTypes.BINARY})
+    def get(self, request, pk, width, height, ext):
+        """Return the resized image from the disk cache"""
+        max_size = settings.RECIPE_IMAGE_MAX_RESIZE
+        formats = resize_formats()
+        if (ext not in formats
+                or not 0 < width <= max_size
+                or not 0 < height <= max_size):
+            raise Http404
+        image = self.get_image(pk)
+        marker = self.get_marker(image.storage, image.name)
+        return self.serve(
+            request,
+            f'{image.name}:{marker}:{width}x{height}.{ext}',
+            formats[ext][1],
+            lambda: get_resized(image, width, height, ext, marker),
+        )
@@ -0,0 +1,185 @@
+"""
+Cached token authentication for the APIs
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import (
+    BaseAuthentication,
+    get_authorization_header,
+    TokenAuthentication
+)
+
+from core.cache import is_shared
+from user import tokens
+
+TOKEN_KEY = 'auth-token:{key}'
+
+DEFAULTS = {
+    # cache alias of the tier shared between processes
+    'ALIAS': 'shared',
+    'TIMEOUT': 300,
+    # the in-process tier can only be invalidated in the process that saw
+    # the change, so it is kept short
+    'LOCAL_TIMEOUT': 10,
+    'LOCAL_SIZE': 1024,
+}
+
+
+def get_settings():
+    """Return the token cache settings merged over their defaults"""
+    return {**DEFAULTS, **getattr(settings, 'TOKEN_AUTH_CACHE', {})}
+
+
+class LocalTokenCache:
+    """Thread safe, size bounded LRU of token entries with a TTL"""
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached entry for a key, or None"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            entry, expires = item
+            if expires <= time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        """Cache an entry, evicting the least recently used one when full"""
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._items[key] = (entry, time.monotonic() + self.timeout)
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def delete(self, key):
+        """Drop a key from the cache"""
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        """Drop every cached entry"""
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+_local_cache = None
+_local_cache_lock = threading.Lock()
+
+
+def get_local_cache():
+    """Return the process wide token LRU, sized from the settings"""
+    global _local_cache
+    options = get_settings()
+    with _local_cache_lock:
+        if (_local_cache is None
+                or _local_cache.size != options['LOCAL_SIZE']
+                or _local_cache.timeout != options['LOCAL_TIMEOUT']):
+            _local_cache = LocalTokenCache(
+                options['LOCAL_SIZE'], options['LOCAL_TIMEOUT']
+            )
+        return _local_cache
+
+
+def get_shared_cache():
+    """Return the cache backend shared between processes, or None"""
+    alias = get_settings()['ALIAS']
+    # a per-process cache could not be invalidated from other processes
+    return caches[alias] if is_shared(alias) else None
+
+
+def invalidate_token(key):
+    """Forget a token in both cache tiers"""
+    get_local_cache().delete(key)
+    shared = get_shared_cache()
+    if shared is not None:
+        shared.delete(TOKEN_KEY.format(key=key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that caches the user id of a token.
+
+    Lookups go to the in-process LRU first, then to the shared cache and
+    only then to the database, so a warm request authenticates without a
+    query. Only the user id and active flag are cached; the user handed to
+    the view has every other field deferred. Entries are dropped when a
+    token is deleted or its user is saved, see user.signals.
+    """
+
+    def authenticate_credentials(self, key):
+        local = get_local_cache()
+        entry = local.get(key)
+        if entry is None:
+            shared = get_shared_cache()
+            cache_key = TOKEN_KEY.format(key=key)
+            if shared is not None:
+                entry = shared.get(cache_key)
+            if entry is None:
+                # raises AuthenticationFailed for unknown keys / inactive users
+                user, token = super().authenticate_credentials(key)
+                entry = {'user_id': user.pk, 'is_active': user.is_active}
+                if shared is not None:
+                    shared.set(cache_key, entry, get_settings()['TIMEOUT'])
+            local.set(key, entry)
+        if not entry['is_active']:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        user = get_user_model().from_db(
+            None, ['id', 'is_active'], [entry['user_id'], entry['is_active']]
+        )
+        return (user, self.get_model()(key=key, user_id=entry['user_id']))
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    Authenticate `Bearer` access tokens issued by user.tokens.
+
+    The user is rebuilt from the signed id without a query; views needing
+    more than its primary key must load the row themselves.
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        if not tokens.get_settings()['ENABLED']:
+            return None
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            msg = _('Invalid token header.')
+            raise exceptions.AuthenticationFailed(msg)
+
+        try:
+            payload = tokens.verify_access_token(auth[1].decode())
+        except (signing.BadSignature, UnicodeError, KeyError):
+            msg = _('Invalid or expired access token.')
+            raise exceptions.AuthenticationFailed(msg)
+        user = get_user_model()(pk=payload['uid'], is_active=True)
+        user._state.adding = False
+        return (user, payload)
+
+    def authenticate_header(self, request):
+        return self.keyword
@@ -0,0 +1,18 @@
+"""
+OpenAPI schema extensions for the user authentication classes
+"""
+from drf_spectacular.extensions import OpenApiAuthenticationExtension
+
+
+class SignedTokenScheme(OpenApiAuthenticationExtension):
+    """Document SignedTokenAuthentication as an HTTP bearer scheme"""
+    target_class = 'user.authentication.SignedTokenAuthentication'
+    name = 'accessToken'
+
+    def get_security_definition(self, auto_schema):
+        return {
+            'type': 'http',
+            'scheme': 'bearer',
+            'description': 'Signed access token issued by '
+                           '/api/user/token/refresh/',
+        }
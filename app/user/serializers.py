@@ -4,6 +4,7 @@ Serializer for user models API view
 from rest_framework import serializers
 from django.contrib.auth import get_user_model, authenticate
 from django.utils.translation import gettext_lazy as _
+from rest_framework.authtoken.models import Token
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -50,3 +51,19 @@ class AuthTokenSerializer(serializers.Serializer):
             raise serializers.ValidationError(msg, code='authentication')
         attrs['user'] = user
         return attrs
+
+
+class RefreshAccessTokenSerializer(serializers.Serializer):
+    """Serializer exchanging an auth token for a new access token"""
+    token = serializers.CharField()
+
+    def validate(self, attrs):
+        """Validate the auth token and its user"""
+        token = Token.objects.select_related('user').filter(
+            key=attrs['token']
+        ).first()
+        if token is None or not token.user.is_active:
+            msg = _('Invalid token.')
+            raise serializers.ValidationError(msg, code='authentication')
+        attrs['user'] = token.user
+        return attrs
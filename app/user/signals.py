@@ -0,0 +1,30 @@
+"""
+Signal handlers for the user API
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from user import tokens
+from user.authentication import invalidate_token
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """Forget a deleted token and the access tokens issued for it"""
+    invalidate_token(instance.key)
+    if tokens.get_settings()['ENABLED']:
+        tokens.deny_list.deny_user(instance.user_id)
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    """Forget the tokens of a saved user, so deactivation applies at once"""
+    if created:
+        return
+    keys = Token.objects.filter(user=instance).values_list('key', flat=True)
+    for key in keys:
+        invalidate_token(key)
+    if not instance.is_active and tokens.get_settings()['ENABLED']:
+        tokens.deny_list.deny_user(instance.pk)
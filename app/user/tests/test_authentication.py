@@ -0,0 +1,141 @@
+"""
+Tests for the cached token authentication
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from user.authentication import (
+    get_local_cache,
+    get_settings,
+    LocalTokenCache,
+    TOKEN_KEY
+)
+
+TAGS_URL = reverse('recipe:tag-list')
+ME_URL = reverse('user:me')
+
+
+class LocalTokenCacheTests(TestCase):
+    """Test the in-process token LRU"""
+
+    def test_evicts_least_recently_used(self):
+        """Test the cache holds at most `size` tokens"""
+        cache = LocalTokenCache(size=2, timeout=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+
+    def test_entries_expire(self):
+        """Test entries are dropped after the timeout"""
+        cache = LocalTokenCache(size=2, timeout=0)
+        cache.set('a', 1)
+
+        self.assertIsNone(cache.get('a'))
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test authenticating API requests with cached tokens"""
+
+    def setUp(self):
+        get_local_cache().clear()
+        caches[get_settings()['ALIAS']].clear()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='test123',
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def _count_queries(self, url):
+        return len(self._get_queries(url))
+
+    def _get_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [query['sql'] for query in queries]
+
+    def _token_lookups(self, url):
+        return [
+            sql for sql in self._get_queries(url) if 'authtoken_token' in sql
+        ]
+
+    def test_warm_request_skips_token_lookup(self):
+        """Test the token is only looked up on the first request"""
+        self.assertEqual(len(self._token_lookups(ME_URL)), 1)
+        # only the profile itself is read
+        self.assertEqual(self._count_queries(ME_URL), 1)
+
+    def test_shared_tier_serves_other_processes(self):
+        """Test a cold in-process cache falls back to the shared cache"""
+        self.assertEqual(len(self._token_lookups(ME_URL)), 1)
+        get_local_cache().clear()
+
+        self.assertEqual(self._token_lookups(ME_URL), [])
+
+    def test_shared_tier_holds_no_credentials(self):
+        """Test only the user id and active flag are cached"""
+        self._count_queries(ME_URL)
+        entry = caches[get_settings()['ALIAS']].get(
+            TOKEN_KEY.format(key=self.token.key)
+        )
+
+        self.assertEqual(entry, {'user_id': self.user.id, 'is_active': True})
+
+    def test_per_process_shared_tier_skipped(self):
+        """Test a per-process cache is never used as the shared tier"""
+        with override_settings(TOKEN_AUTH_CACHE={
+            **get_settings(), 'ALIAS': 'default'
+        }):
+            self._count_queries(ME_URL)
+            get_local_cache().clear()
+
+            self.assertEqual(len(self._token_lookups(ME_URL)), 1)
+        self.assertIsNone(
+            caches['default'].get(TOKEN_KEY.format(key=self.token.key))
+        )
+
+    def test_invalid_token_rejected(self):
+        """Test an unknown token is not authenticated"""
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_token_rejected(self):
+        """Test deleting a token invalidates the cached one"""
+        self._count_queries(TAGS_URL)
+        self.token.delete()
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        """Test deactivating a user invalidates their cached token"""
+        self._count_queries(TAGS_URL)
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_me_returns_current_user(self):
+        """Test profile changes show up despite the cached token"""
+        self._count_queries(ME_URL)
+        self.client.patch(ME_URL, {'name': 'new name'})
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.data['name'], 'new name')
@@ -0,0 +1,201 @@
+"""
+Tests for the signed access tokens
+"""
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from drf_spectacular.generators import SchemaGenerator
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag
+from user import tokens
+from user.tokens import deny_list
+
+TOKEN_URL = reverse('user:token')
+REFRESH_URL = reverse('user:token-refresh')
+REVOKE_URL = reverse('user:token-revoke')
+ME_URL = reverse('user:me')
+TAGS_URL = reverse('recipe:tag-list')
+
+ACCESS_TOKENS = {
+    'ENABLED': True,
+    'ALIAS': 'shared',
+    'LIFETIME': 300,
+    'DENY_LIST_REFRESH': 0,
+}
+
+
+@override_settings(ACCESS_TOKENS=ACCESS_TOKENS)
+class AccessTokenTests(TestCase):
+    """Test issuing, using and revoking signed access tokens"""
+
+    def setUp(self):
+        deny_list.clear()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='test123',
+        )
+        self.client = APIClient()
+        res = self.client.post(
+            TOKEN_URL, {'email': 'user@example.com', 'password': 'test123'}
+        )
+        self.token = res.data['token']
+        self.access = res.data['access']
+
+    def _bearer(self, access):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_token_includes_access_token(self):
+        """Test the token endpoint returns an access token and lifetime"""
+        res = self.client.post(
+            TOKEN_URL, {'email': 'user@example.com', 'password': 'test123'}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('access', res.data)
+        self.assertEqual(res.data['expires_in'], 300)
+
+    @override_settings(ACCESS_TOKENS={**ACCESS_TOKENS, 'ENABLED': False})
+    def test_disabled_by_default(self):
+        """Test no access token is issued nor accepted when disabled"""
+        res = self.client.post(
+            TOKEN_URL, {'email': 'user@example.com', 'password': 'test123'}
+        )
+        self.assertNotIn('access', res.data)
+
+        self._bearer(self.access)
+        res = self.client.get(TAGS_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(
+        ACCESS_TOKENS={**ACCESS_TOKENS, 'DENY_LIST_REFRESH': 60}
+    )
+    def test_access_token_needs_no_query(self):
+        """Test a request authenticates without reading the database"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        self._bearer(self.access)
+        # loads this process' copy of the deny-list
+        self.client.get(ME_URL)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'][0]['name'], 'Vegan')
+        self.assertEqual(len(queries), 1)
+
+    def test_me_with_access_token(self):
+        """Test the profile is loaded for an access token user"""
+        self._bearer(self.access)
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], 'user@example.com')
+
+    def test_tampered_token_rejected(self):
+        """Test an access token with a changed payload is rejected"""
+        payload, signature = self.access.split(':', 1)
+        self._bearer(f'{payload}x:{signature}')
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_expired_token_rejected(self):
+        """Test an access token is rejected after its lifetime"""
+        self._bearer(self.access)
+        with patch('user.tokens.time.time', return_value=10 ** 10):
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh(self):
+        """Test an auth token is exchanged for a working access token"""
+        res = self.client.post(REFRESH_URL, {'token': self.token})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self._bearer(res.data['access'])
+        res = self.client.get(TAGS_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_refresh_invalid_token(self):
+        """Test refreshing with an unknown auth token fails"""
+        res = self.client.post(REFRESH_URL, {'token': 'invalid'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_revoke(self):
+        """Test a revoked access token is rejected"""
+        self._bearer(self.access)
+        res = self.client.post(REVOKE_URL)
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+        res = self.client.get(TAGS_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        """Test deactivating a user revokes their access tokens"""
+        self.user.is_active = False
+        self.user.save()
+        self._bearer(self.access)
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoke_waits_for_the_lock(self):
+        """Test a revocation is written once a concurrent writer is done"""
+        cache = tokens.get_shared_cache()
+        cache.set(tokens.DENY_LIST_LOCK_KEY, 1)
+        self._bearer(self.access)
+
+        def release(seconds):
+            cache.delete(tokens.DENY_LIST_LOCK_KEY)
+
+        with patch('user.tokens.time.sleep', side_effect=release) as sleep:
+            res = self.client.post(REVOKE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertTrue(sleep.called)
+        res = self.client.get(TAGS_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoke_never_writes_without_the_lock(self):
+        """Test a revocation fails rather than race a stuck writer"""
+        payload = tokens.verify_access_token(self.access)
+        cache = tokens.get_shared_cache()
+        cache.set(tokens.DENY_LIST_LOCK_KEY, 1)
+
+        with patch('user.tokens.time.sleep'), \
+                patch('user.tokens.time.monotonic', side_effect=[0, 0, 60]):
+            with self.assertRaises(TimeoutError):
+                deny_list.deny(payload)
+        self.assertIsNone(cache.get(tokens.DENY_LIST_KEY))
+
+    @override_settings(ACCESS_TOKENS={**ACCESS_TOKENS, 'ALIAS': 'default'})
+    def test_per_process_deny_list_refused(self):
+        """Test the deny-list is never kept in a per-process cache"""
+        with self.assertRaises(ImproperlyConfigured):
+            tokens.get_shared_cache()
+
+    def test_schema_documents_bearer_scheme(self):
+        """Test the API schema describes access tokens and revocation"""
+        schema = SchemaGenerator().get_schema(request=None, public=True)
+
+        self.assertEqual(
+            schema['components']['securitySchemes']['accessToken'],
+            {
+                'type': 'http',
+                'scheme': 'bearer',
+                'description': 'Signed access token issued by '
+                               '/api/user/token/refresh/',
+            },
+        )
+        revoke = schema['paths'][REVOKE_URL]['post']
+        self.assertIn({'accessToken': []}, revoke['security'])
+        self.assertEqual(list(revoke['responses']), ['204'])
+        self.assertNotIn('requestBody', revoke)
@@ -0,0 +1,158 @@
+"""
+Stateless signed access tokens for the APIs
+"""
+import secrets
+import threading
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+
+from core.cache import is_shared
+
+SALT = 'user.access-token'
+DENY_LIST_KEY = 'auth-deny-list'
+DENY_LIST_LOCK_KEY = 'auth-deny-list:lock'
+USER_ENTRY = 'user:{user_id}'
+# seconds a deny-list writer may hold the lock before it expires
+LOCK_TIMEOUT = 5
+
+DEFAULTS = {
+    'ENABLED': False,
+    # cache alias holding the deny-list, shared between processes
+    'ALIAS': 'shared',
+    'LIFETIME': 300,
+    # seconds a process reuses its copy of the deny-list
+    'DENY_LIST_REFRESH': 5,
+}
+
+
+def get_settings():
+    """Return the access token settings merged over their defaults"""
+    return {**DEFAULTS, **getattr(settings, 'ACCESS_TOKENS', {})}
+
+
+def get_shared_cache():
+    """Return the cache backend holding the deny-list"""
+    alias = get_settings()['ALIAS']
+    if not is_shared(alias):
+        # a revocation would only reach the process that made it
+        raise ImproperlyConfigured(
+            f"ACCESS_TOKENS['ALIAS'] {alias!r} must name a cache shared "
+            f'between processes'
+        )
+    return caches[alias]
+
+
+def issue_access_token(user):
+    """Return a signed access token for a user and its lifetime"""
+    lifetime = get_settings()['LIFETIME']
+    now = time.time()
+    payload = {
+        'uid': user.pk,
+        # milliseconds, so a token issued right after a revocation survives
+        'iat': round(now, 3),
+        'exp': int(now) + lifetime,
+        'jti': secrets.token_urlsafe(8),
+    }
+    return signing.dumps(payload, salt=SALT), lifetime
+
+
+def verify_access_token(token):
+    """
+    Return the payload of a valid access token or raise BadSignature.
+
+    Checks the HMAC signature, the expiry and the deny-list only, so it
+    needs no database read.
+    """
+    payload = signing.loads(token, salt=SALT)
+    if payload['exp'] <= time.time():
+        raise signing.SignatureExpired('Access token expired')
+    if deny_list.is_denied(payload):
+        raise signing.BadSignature('Access token revoked')
+    return payload
+
+
+class DenyList:
+    """
+    Revoked access tokens, shared through the cache.
+
+    Holds one entry per revoked token id plus one per user whose tokens
+    were all revoked, and drops entries once the tokens they cover have
+    expired, so it stays small. Each process keeps a copy and reloads it
+    at most every `DENY_LIST_REFRESH` seconds.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._loaded = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        now = time.monotonic()
+        refresh = get_settings()['DENY_LIST_REFRESH']
+        with self._lock:
+            if self._loaded is None or now - self._loaded >= refresh:
+                self._entries = get_shared_cache().get(DENY_LIST_KEY) or {}
+                self._loaded = now
+            return self._entries
+
+    def is_denied(self, payload):
+        """Return whether a token payload has been revoked"""
+        entries = self._load()
+        if payload['jti'] in entries:
+            return True
+        cutoff = entries.get(USER_ENTRY.format(user_id=payload['uid']))
+        return cutoff is not None and payload['iat'] <= cutoff
+
+    def _update(self, key, value):
+        cache = get_shared_cache()
+        # serialise writers; a lock left by a crashed writer expires after
+        # LOCK_TIMEOUT, so waiting a little longer than that is enough
+        deadline = time.monotonic() + LOCK_TIMEOUT + 1
+        while not cache.add(DENY_LIST_LOCK_KEY, 1, timeout=LOCK_TIMEOUT):
+            if time.monotonic() >= deadline:
+                raise TimeoutError('Timed out waiting for the deny-list lock')
+            time.sleep(0.01)
+        try:
+            now = int(time.time())
+            lifetime = get_settings()['LIFETIME']
+            entries = {
+                entry: expires
+                for entry, expires in (cache.get(DENY_LIST_KEY) or {}).items()
+                if self._expires_at(entry, expires, lifetime) > now
+            }
+            entries[key] = value
+            cache.set(DENY_LIST_KEY, entries, timeout=None)
+        finally:
+            cache.delete(DENY_LIST_LOCK_KEY)
+        with self._lock:
+            self._entries = entries
+            self._loaded = time.monotonic()
+
+    @staticmethod
+    def _expires_at(entry, value, lifetime):
+        # token entries hold the token expiry, user entries the cutoff time
+        if entry.startswith(USER_ENTRY.format(user_id='')):
+            return value + lifetime
+        return value
+
+    def deny(self, payload):
+        """Revoke a single access token"""
+        self._update(payload['jti'], payload['exp'])
+
+    def deny_user(self, user_id):
+        """Revoke every access token issued to a user so far"""
+        self._update(USER_ENTRY.format(user_id=user_id), time.time())
+
+    def clear(self):
+        """Forget every revoked token"""
+        get_shared_cache().delete(DENY_LIST_KEY)
+        with self._lock:
+            self._entries = {}
+            self._loaded = None
+
+
+deny_list = DenyList()
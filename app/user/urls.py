@@ -10,5 +10,9 @@ app_name = 'user'
 urlpatterns = [
     path('create/', views.UserCreateView.as_view(), name='create'),
     path('token/', views.CreateTokenView.as_view(), name='token'),
+    path('token/refresh/', views.RefreshAccessTokenView.as_view(),
+         name='token-refresh'),
+    path('token/revoke/', views.RevokeAccessTokenView.as_view(),
+         name='token-revoke'),
     path('me/', views.ManageUserView.as_view(), name="me")
 ]
@@ -2,30 +2,114 @@
 Views for the user API
 """
 
-from rest_framework import generics, permissions, authentication
+from django.contrib.auth import get_user_model
+from django.http import Http404
+from django.utils.translation import gettext_lazy as _
+from drf_spectacular.utils import extend_schema
+from rest_framework import generics, permissions, status
 
-from user.serializers import UserSerializer, AuthTokenSerializer
+from user.serializers import (
+    UserSerializer,
+    AuthTokenSerializer,
+    RefreshAccessTokenSerializer
+)
+from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 
+from core.hashing import PasswordHashingBusy
+from user import tokens
+from user.authentication import (
+    CachedTokenAuthentication,
+    SignedTokenAuthentication
+)
 
-class UserCreateView(generics.CreateAPIView):
+
+def access_token_data(user):
+    """Return the response fields of a new access token for a user"""
+    access, lifetime = tokens.issue_access_token(user)
+    return {'access': access, 'expires_in': lifetime}
+
+
+class PasswordHashingUnavailable(APIException):
+    """The password hashing pool is saturated"""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _('Too many sign-ins in progress, try again shortly.')
+    default_code = 'password_hashing_busy'
+    # sent as Retry-After by the DRF exception handler
+    wait = 1
+
+
+class PasswordHashingMixin:
+    """Answer a saturated password hashing pool with 503"""
+
+    def handle_exception(self, exc):
+        if isinstance(exc, PasswordHashingBusy):
+            exc = PasswordHashingUnavailable()
+        return super().handle_exception(exc)
+
+
+class UserCreateView(PasswordHashingMixin, generics.CreateAPIView):
     """Create a new user in the system"""
     serializer_class = UserSerializer
 
 
-class CreateTokenView(ObtainAuthToken):
+class CreateTokenView(PasswordHashingMixin, ObtainAuthToken):
     """Create a new auth token for user"""
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        token, created = Token.objects.get_or_create(user=user)
+        data = {'token': token.key}
+        if tokens.get_settings()['ENABLED']:
+            data.update(access_token_data(user))
+        return Response(data)
+
+
+class RefreshAccessTokenView(generics.GenericAPIView):
+    """Exchange an auth token for a new signed access token"""
+    serializer_class = RefreshAccessTokenSerializer
+    authentication_classes = []
+
+    def post(self, request, *args, **kwargs):
+        if not tokens.get_settings()['ENABLED']:
+            raise Http404
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(
+            access_token_data(serializer.validated_data['user'])
+        )
+
+
+class RevokeAccessTokenView(APIView):
+    """Revoke the signed access token of the request"""
+    authentication_classes = [SignedTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    @extend_schema(request=None, responses={204: None})
+    def post(self, request, *args, **kwargs):
+        tokens.deny_list.deny(request.auth)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(PasswordHashingMixin,
+                     generics.RetrieveUpdateAPIView):
     """Manage the authenticated User """
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [
+        CachedTokenAuthentication,
+        SignedTokenAuthentication
+    ]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
         """Retrieve and return authenticated user"""
-        return self.request.user
+        # request.user may come from the token cache, read the current row
+        return get_user_model().objects.get(pk=self.request.user.pk)